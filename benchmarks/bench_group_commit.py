@@ -0,0 +1,59 @@
+"""
+Throughput of CreatePlayer commands with and without group commit, for the
+RAM backend persisting every commit to a write-ahead log with fsync
+
+With group commit, commands waiting in a lane share one log record and one
+fsync, so throughput grows with the number of commands sent at once.
+
+Usage:
+    PYTHONPATH=engine python benchmarks/bench_group_commit.py
+"""
+import argparse
+import tempfile
+import time
+
+import factories
+from adapters import persistence
+from domain import commands
+
+
+def run(commands_count: int, group_commit: bool, group_size: int) -> float:
+    with tempfile.TemporaryDirectory() as directory:
+        uow = factories.create_uow("ram")
+        uow.persistence = persistence.RamPersistence(directory, fsync=True)
+
+        message_bus = factories.create_message_bus(
+            uow=uow, group_commit=group_commit, group_commit_size=group_size
+        )
+
+        start = time.perf_counter()
+        results = [
+            message_bus.handle(commands.CreatePlayer(f"player{i}"))
+            for i in range(commands_count)
+        ]
+        for result in results:
+            result.get()
+        elapsed = time.perf_counter() - start
+
+        uow.persistence.close()
+
+    return commands_count / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--commands", type=int, default=2000)
+    args = parser.parse_args()
+
+    baseline = run(args.commands, False, 1)
+    print(f"  group commit off       {baseline:10.0f} commands/s")
+    for size in (8, 64, 256):
+        throughput = run(args.commands, True, size)
+        print(
+            f"  group commit size={size:<4} {throughput:10.0f} commands/s"
+            f"  x{throughput / baseline:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
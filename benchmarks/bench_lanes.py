@@ -0,0 +1,83 @@
+"""
+Throughput of JoinRoom commands spread over many rooms for different numbers
+of message bus lanes
+
+Pure in-memory handlers are bound by the GIL, so they are measured both as
+they are and with a fixed delay standing in for a round trip to an external
+store, which is where lanes pay off.
+
+Usage:
+    PYTHONPATH=engine python benchmarks/bench_lanes.py
+"""
+import argparse
+import time
+
+import factories
+from domain import commands
+from service_player import handlers
+
+
+def with_latency(handler, latency: float):
+    def delayed(command, uow):
+        time.sleep(latency)
+        return handler(command, uow)
+
+    return delayed
+
+
+def run(lanes: int, rooms: int, joins: int, latency: float) -> float:
+    command_handlers = dict(handlers.COMMAND_HANDLERS)
+    if latency:
+        command_handlers[commands.JoinRoom] = with_latency(
+            handlers.join_room, latency
+        )
+
+    message_bus = factories.create_message_bus(
+        uow=factories.create_uow("ram"),
+        command_handlers=command_handlers,
+        background_threads=lanes,
+    )
+
+    room_ids = []
+    for i in range(rooms):
+        creator = message_bus.handle(commands.CreatePlayer(f"creator{i}")).get()
+        room_ids.append(message_bus.handle(commands.CreateRoom(creator.id)).get().id)
+
+    player_ids = [
+        message_bus.handle(commands.CreatePlayer(f"player{i}")).get().id
+        for i in range(joins)
+    ]
+
+    start = time.perf_counter()
+    results = [
+        message_bus.handle(commands.JoinRoom(room_ids[i % rooms], player_id))
+        for i, player_id in enumerate(player_ids)
+    ]
+    for result in results:
+        result.get()
+    elapsed = time.perf_counter() - start
+
+    return joins / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rooms", type=int, default=256)
+    parser.add_argument("--joins", type=int, default=4000)
+    parser.add_argument("--latency-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    for latency in (0.0, args.latency_ms / 1000):
+        print(f"handler latency {latency * 1000:.1f} ms")
+        baseline = None
+        for lanes in (1, 2, 4, 8, 16):
+            throughput = run(lanes, args.rooms, args.joins, latency)
+            baseline = baseline or throughput
+            print(
+                f"  lanes={lanes:<3} {throughput:10.0f} joins/s"
+                f"  x{throughput / baseline:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
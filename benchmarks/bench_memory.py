@@ -0,0 +1,54 @@
+"""
+Memory used per player, room, event and command, measured with tracemalloc.
+Includes ids minted the same way the handlers mint them
+
+Usage:
+    PYTHONPATH=engine python benchmarks/bench_memory.py
+"""
+import argparse
+import gc
+import tracemalloc
+from typing import Callable, List
+
+from domain import commands, events, ids, players, rooms
+
+
+def measure(create: Callable[[int], object], count: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    instances: List[object] = [create(i) for i in range(count)]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    size -= len(instances) * 8  # List of instances is not part of them
+    return size / count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    creator = players.Player(id=ids.new_id(), username="creator")
+    member = players.Player(id=ids.new_id(), username="member")
+    room = rooms.Room(id=ids.new_id(), creator=creator)
+
+    cases = {
+        "player": lambda i: players.Player(id=ids.new_id(), username=f"user{i}"),
+        "room (1 player)": lambda i: rooms.Room(id=ids.new_id(), creator=creator),
+        "event PlayerJoinedRoom": lambda i: events.PlayerJoinedRoom(
+            room=room, player=member
+        ),
+        "command JoinRoom": lambda i: commands.JoinRoom(
+            room_id=room.id, player_id=member.id
+        ),
+    }
+
+    for name, create in cases.items():
+        print(f"{name:<24} {measure(create, args.count):8.1f} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Latency of JoinRoom commands while PlayerJoinedRoom event handlers do slow
+background work, e.g. call webhooks, with events handled in the lanes of
+commands and in lanes of their own
+
+Every client sends JoinRoom commands one after another and waits for each.
+
+Usage:
+    PYTHONPATH=engine python benchmarks/bench_priority_lanes.py
+"""
+import argparse
+import statistics
+import threading
+import time
+from typing import List
+
+import factories
+from domain import commands, events
+from service_player import handlers
+
+
+def slow_event_handler(latency: float):
+    def handler(event: events.PlayerJoinedRoom) -> None:
+        time.sleep(latency)
+
+    return handler
+
+
+def run(
+    clients: int, joins: int, lanes: int, event_threads: int, event_latency: float
+) -> List[float]:
+    event_handlers = dict(handlers.EVENT_HANDLERS)
+    if event_latency:
+        event_handlers[events.PlayerJoinedRoom] = [
+            slow_event_handler(event_latency)
+        ]
+
+    message_bus = factories.create_message_bus(
+        uow=factories.create_uow("ram"),
+        event_handlers=event_handlers,
+        background_threads=lanes,
+        event_threads=event_threads,
+    )
+
+    room_ids = []
+    for i in range(clients):
+        creator = message_bus.handle(commands.CreatePlayer(f"creator{i}")).get()
+        room_ids.append(
+            message_bus.handle(commands.CreateRoom(creator.id, capacity=joins + 1))
+            .get()
+            .id
+        )
+    player_ids = [
+        [
+            message_bus.handle(commands.CreatePlayer(f"player{i}-{j}")).get().id
+            for j in range(joins)
+        ]
+        for i in range(clients)
+    ]
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def client(i: int) -> None:
+        measured = []
+        for player_id in player_ids[i]:
+            start = time.perf_counter()
+            message_bus.handle(commands.JoinRoom(room_ids[i], player_id)).get()
+            measured.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(measured)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return latencies
+
+
+def percentile(values: List[float], q: int) -> float:
+    return statistics.quantiles(values, n=100)[q - 1] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--joins", type=int, default=200)
+    parser.add_argument("--lanes", type=int, default=4)
+    parser.add_argument("--event-latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    event_latency = args.event_latency_ms / 1000
+    for name, event_threads, latency in (
+        ("no event work", 0, 0.0),
+        ("slow events, shared lanes", 0, event_latency),
+        ("slow events, event lanes", args.lanes, event_latency),
+    ):
+        latencies = run(args.clients, args.joins, args.lanes, event_threads, latency)
+        print(
+            f"  {name:<26} p50 {percentile(latencies, 50):7.2f} ms"
+            f"  p99 {percentile(latencies, 99):7.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
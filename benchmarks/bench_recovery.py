@@ -0,0 +1,84 @@
+"""
+Restart time of the RAM backend: loading the latest snapshot and replaying
+the write-ahead log written after it
+
+Usage:
+    PYTHONPATH=engine python benchmarks/bench_recovery.py
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import factories
+from adapters import persistence
+from domain import players, rooms
+from service_player import unit_of_work
+
+
+def create_uow(directory: str) -> unit_of_work.RamUnitOfWork:
+    return unit_of_work.RamUnitOfWork(
+        factories.create_players_repository("ram"),
+        factories.create_rooms_repository("ram"),
+        persistence.RamPersistence(directory, snapshot_every=10**12),
+    )
+
+
+def populate(directory: str, players_count: int, rooms_count: int, log: int):
+    uow = create_uow(directory)
+    uow.persistence.recover(uow.players, uow.rooms)
+
+    all_players = [
+        players.Player(id=f"player-{i}", username=f"user-{i}")
+        for i in range(players_count)
+    ]
+    uow.players.restore(all_players)
+
+    per_room = players_count // rooms_count
+    all_rooms = []
+    for i in range(rooms_count):
+        members = all_players[i * per_room : (i + 1) * per_room]
+        room = rooms.Room(id=f"room-{i}", creator=members[0], players=members)
+        all_rooms.append(room)
+    uow.rooms.restore(all_rooms)
+
+    uow.persistence.snapshot(uow.players.all(), uow.rooms.all())
+
+    # Log tail: every commit changes one room
+    for i in range(log):
+        room = all_rooms[i % rooms_count]
+        room.version += 1
+        uow.persistence.append([], [room])
+
+    uow.persistence.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--players", type=int, default=1_000_000)
+    parser.add_argument("--rooms", type=int, default=100_000)
+    parser.add_argument("--log", type=int, default=100_000, help="commits in log")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        populate(directory, args.players, args.rooms, args.log)
+        print(f"populate: {time.perf_counter() - start:.2f} s")
+
+        for name in sorted(os.listdir(directory)):
+            size = os.path.getsize(os.path.join(directory, name))
+            print(f"  {name}: {size / 2**20:.1f} MiB")
+
+        uow = create_uow(directory)
+        start = time.perf_counter()
+        uow.persistence.recover(uow.players, uow.rooms)
+        elapsed = time.perf_counter() - start
+
+        print(
+            f"recover {len(uow.players)} players, {len(uow.rooms)} rooms "
+            f"and {args.log} logged commits: {elapsed:.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Fan-out of PlayerJoinedRoom events to subscribers of one room, with every
+event encoded once for all subscribers and encoded for every subscriber
+
+Subscribers run on one event loop, like WebSocket connections of a server
+process, and events are published at a steady rate from another thread,
+like event handlers of the message bus. Reported latency is the time from
+publishing an event until the last subscriber got it. A share of
+subscribers never reads, to show that slow consumers do not hold the room
+back: they are dropped, or keep only the latest events when coalesced.
+
+Usage:
+    PYTHONPATH=engine python benchmarks/bench_room_fanout.py
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Callable, Dict, List, Tuple
+
+from domain import events, players, rooms
+from entrypoints.fastapi_app.responses import RoomMessage
+from service_player import subscriptions
+
+
+def create_events(count: int) -> Tuple[rooms.Room, List[events.PlayerJoinedRoom]]:
+    creator = players.Player(id="creator", username="creator")
+    room = rooms.Room(id="room", creator=creator, capacity=count + 1)
+    joined = []
+    for i in range(count):
+        player = players.Player(id=f"player{i}", username=f"player{i}")
+        joined.append(events.PlayerJoinedRoom(room=room, player=player))
+    return room, joined
+
+
+async def run(
+    subscribers: int,
+    count: int,
+    interval: float,
+    slow: int,
+    encode_once: bool,
+    coalesce: bool,
+) -> Tuple[List[float], int, int]:
+    """
+    Returns:
+        Tuple[List[float], int, int]: Fan-out latency of every event, readers
+            dropped, slow subscribers dropped
+    """
+    room, joined = create_events(count)
+    if encode_once:
+        encode: Callable = RoomMessage.encode_event
+    else:  # Event is shared, every subscriber encodes it
+        encode = lambda sequence, event: (sequence, event)  # noqa: E731
+    hub = subscriptions.RoomSubscriptions(encode, max_size=16, coalesce=coalesce)
+
+    published_at: Dict[int, float] = {}
+    received_at: Dict[int, float] = {}
+    readers = [hub.subscribe(room.id) for _ in range(subscribers - slow)]
+    slow_subscribers = [hub.subscribe(room.id) for _ in range(slow)]
+
+    async def read(subscription: subscriptions.Subscription) -> None:
+        while (published := await subscription.get()) is not None:
+            sequence, _, message = published
+            if not encode_once:
+                message = RoomMessage.encode_event(*message)
+            received_at[sequence] = time.perf_counter()
+            if sequence == count:
+                break
+
+    def publish() -> None:
+        for sequence, event in enumerate(joined, 1):
+            published_at[sequence] = time.perf_counter()
+            hub.publish(event)
+            time.sleep(interval)
+
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        loop.run_in_executor(None, publish),
+        *[read(subscription) for subscription in readers],
+    )
+
+    latencies = [
+        received_at[sequence] - published_at[sequence]
+        for sequence in published_at
+        if sequence in received_at
+    ]
+    return (
+        latencies,
+        sum(s.overflowed for s in readers),
+        sum(s.overflowed for s in slow_subscribers),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--subscribers", type=int, default=10000)
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--interval-ms", type=float, default=20.0)
+    parser.add_argument("--slow", type=int, default=100)
+    args = parser.parse_args()
+
+    print(
+        f"  {args.subscribers} subscribers, {args.slow} of them not reading,"
+        f" {args.events} events every {args.interval_ms} ms"
+    )
+    for name, encode_once, coalesce in (
+        ("encode per subscriber", False, False),
+        ("encode once, drop", True, False),
+        ("encode once, coalesce", True, True),
+    ):
+        latencies, readers_dropped, slow_dropped = asyncio.run(
+            run(
+                args.subscribers,
+                args.events,
+                args.interval_ms / 1000,
+                args.slow,
+                encode_once,
+                coalesce,
+            )
+        )
+        latency = (
+            f"p50 {statistics.median(latencies) * 1000:7.2f} ms"
+            f"  max {max(latencies) * 1000:7.2f} ms"
+            if latencies
+            else "no events delivered"
+        )
+        print(
+            f"  {name:<22} {latency}"
+            f"  readers dropped {readers_dropped:5}  slow dropped {slow_dropped}"
+        )
+
+
+if __name__ == "__main__":
+    main()
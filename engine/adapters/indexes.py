@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Generic, List, Optional, Tuple, TypeVar
+
+from domain.base import BaseModel
+
+_T = TypeVar("_T", bound=BaseModel)
+# Entry of SortedIndex: value, id and instance, ordered by value and id
+_Entry = Tuple[Any, str, Any]
+_entry_key: Callable[[_Entry], Tuple[Any, str]] = itemgetter(0, 1)
+
+
+class Index(Generic[_T]):
+    """
+    Non-unique secondary index: value of `key` -> committed instances having it.
+
+    Indexes are declared on a repository and maintained incrementally when
+    instances are stored, so cost of an update is proportional to the number
+    of values that changed. The SQL backend uses the same declarations to
+    match instances changed in a transaction but not flushed yet
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key: Optional[Callable[[_T], Any]] = None,
+        unique: bool = False,
+        where: Optional[Callable[[_T], bool]] = None,
+    ):
+        """
+        Args:
+            name (str): Name to query the index by
+            key (Optional[Callable[[_T], Any]]): Function getting indexed value
+                from instance, attribute `name` by default
+            unique (bool): Allow at most one instance per value, checked on commit
+            where (Optional[Callable[[_T], bool]]): Index only instances
+                matching the condition, all by default
+        """
+        self.name: str = name
+        self.key: Callable[[_T], Any] = key or attrgetter(name)
+        self.unique: bool = unique
+        self.where: Optional[Callable[[_T], bool]] = where
+        self._buckets: dict[Any, dict[str, _T]] = {}  # value -> id -> instance
+
+    def values(self, instance: _T) -> Tuple[Any, ...]:
+        """
+        Get values instance is indexed by
+
+        Args:
+            instance (_T): Instance
+
+        Returns:
+            Tuple[Any, ...]: Values, empty if instance is not indexed
+        """
+        if self.where is not None and not self.where(instance):
+            return ()
+        return (self.key(instance),)
+
+    def update(self, instance: _T, original: Optional[_T]) -> None:
+        """
+        Index instance in place of its previous version
+
+        Args:
+            instance (_T): Instance being stored
+            original (Optional[_T]): Stored version it replaces, if any
+        """
+        values = self.values(instance)
+        if original is not None:
+            # Sets, instances of a MultiIndex can have many values
+            for value in set(self.values(original)).difference(values):
+                self._discard(value, original)
+
+        for value in values:  # Also kept values, they point to original
+            self._buckets.setdefault(value, {})[instance.id] = instance
+
+    def find(self, value: Any) -> List[_T]:
+        """
+        Get instances indexed by value
+
+        Args:
+            value (Any): Value
+
+        Returns:
+            List[_T]: Instances, in order they were first indexed by value
+        """
+        bucket = self._buckets.get(value)
+        return list(bucket.values()) if bucket else []
+
+    def _discard(self, value: Any, instance: _T) -> None:
+        bucket = self._buckets.get(value)
+        if bucket is not None and bucket.get(instance.id) is instance:
+            del bucket[instance.id]
+            if not bucket:
+                del self._buckets[value]
+
+
+class MultiIndex(Index[_T]):
+    """
+    Index of instances by every value of a collection, for example rooms by
+    ids of their players
+    """
+
+    def values(self, instance: _T) -> Tuple[Any, ...]:
+        if self.where is not None and not self.where(instance):
+            return ()
+        return tuple(self.key(instance))
+
+
+class SortedIndex(Index[_T]):
+    """
+    Index keeping instances ordered by value, for range queries.
+    Instances with equal values are ordered by id
+
+    Entries are kept in sorted blocks of up to `block_size`, so an update
+    copies one block and the list of blocks instead of shifting the whole
+    index. Published blocks are never changed: an update builds new ones
+    and swaps them in with one assignment, so readers without a lock see
+    the index either before or after it
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key: Optional[Callable[[_T], Any]] = None,
+        unique: bool = False,
+        where: Optional[Callable[[_T], bool]] = None,
+        block_size: int = 1024,
+    ):
+        super().__init__(name, key, unique, where)
+        self.block_size: int = block_size
+        # Blocks of (value, id, instance) and (value, id) of last entry of each
+        self._blocks: Tuple[List[List[_Entry]], List[Tuple[Any, str]]] = ([], [])
+
+    def update(self, instance: _T, original: Optional[_T]) -> None:
+        values = self.values(instance)
+        previous = self.values(original) if original is not None else ()
+        if not values and not previous:
+            return
+
+        blocks, lasts = list(self._blocks[0]), list(self._blocks[1])
+        if original is not None:
+            for value in previous:
+                self._remove(blocks, lasts, (value, original.id), original)
+        for value in values:
+            self._insert(blocks, lasts, (value, instance.id, instance))
+        self._blocks = (blocks, lasts)
+
+    def find(self, value: Any) -> List[_T]:
+        blocks, lasts = self._blocks
+        found: List[_T] = []
+        index, position = _position(blocks, lasts, (value,))
+        for block in islice(blocks, index, None):
+            for entry in islice(block, position, None):
+                if entry[0] != value:
+                    return found
+                found.append(entry[2])
+            position = 0
+        return found
+
+    def find_range(
+        self,
+        start: Any = None,
+        stop: Any = None,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+        after: Optional[Tuple[Any, str]] = None,
+    ) -> List[_T]:
+        """
+        Get instances with values in range [start, stop)
+
+        Args:
+            start (Any): Lowest value, unbounded if None
+            stop (Any): Value above the highest, unbounded if None
+            limit (Optional[int]): Maximum number of instances
+            reverse (bool): Return highest values first
+            after (Optional[Tuple[Any, str]]): Value and id of the last instance
+                of the previous page, to continue right after it
+
+        Returns:
+            List[_T]: Instances ordered by value
+        """
+        blocks, lasts = self._blocks  # Snapshot, consistent without a lock
+        # Positions are (block, position in block)
+        low = (0, 0) if start is None else _position(blocks, lasts, (start,))
+        high = (
+            (len(blocks), 0) if stop is None else _position(blocks, lasts, (stop,))
+        )
+        if after is not None:
+            if reverse:
+                high = min(high, _position(blocks, lasts, after))
+            else:
+                low = max(low, _position(blocks, lasts, after, right=True))
+
+        found: List[_T] = []
+        if reverse:
+            index, end = high
+            while (index, end) > low and (limit is None or len(found) < limit):
+                if end == 0:
+                    index -= 1
+                    end = len(blocks[index])
+                    continue
+                begin = low[1] if index == low[0] else 0
+                if limit is not None:
+                    begin = max(begin, end - (limit - len(found)))
+                found.extend(entry[2] for entry in reversed(blocks[index][begin:end]))
+                end = begin
+        else:
+            index, begin = low
+            while (index, begin) < high and (limit is None or len(found) < limit):
+                end = high[1] if index == high[0] else len(blocks[index])
+                if limit is not None:
+                    end = min(end, begin + limit - len(found))
+                found.extend(entry[2] for entry in blocks[index][begin:end])
+                index, begin = index + 1, 0
+
+        return found
+
+    def _insert(
+        self, blocks: List[List[_Entry]], lasts: List[Tuple[Any, str]], entry: _Entry
+    ) -> None:
+        key = _entry_key(entry)
+        if not blocks:
+            blocks.append([entry])
+            lasts.append(key)
+            return
+
+        index = min(bisect_left(lasts, key), len(blocks) - 1)
+        block = blocks[index]
+        position = bisect_left(block, key, key=_entry_key)
+        if position < len(block) and _entry_key(block[position]) == key:
+            block = block[:position] + [entry] + block[position + 1 :]
+        else:
+            block = block[:position] + [entry] + block[position:]
+
+        if len(block) > self.block_size:
+            half = len(block) // 2
+            blocks[index : index + 1] = [block[:half], block[half:]]
+            lasts[index : index + 1] = [
+                _entry_key(block[half - 1]),
+                _entry_key(block[-1]),
+            ]
+        else:
+            blocks[index] = block
+            lasts[index] = _entry_key(block[-1])
+
+    def _remove(
+        self,
+        blocks: List[List[_Entry]],
+        lasts: List[Tuple[Any, str]],
+        key: Tuple[Any, str],
+        instance: _T,
+    ) -> None:
+        index = bisect_left(lasts, key)
+        if index == len(blocks):
+            return
+        block = blocks[index]
+        position = bisect_left(block, key, key=_entry_key)
+        if _entry_key(block[position]) != key or block[position][2] is not instance:
+            return
+
+        block = block[:position] + block[position + 1 :]
+        if not block:
+            del blocks[index]
+            del lasts[index]
+            return
+
+        blocks[index] = block
+        lasts[index] = _entry_key(block[-1])
+        # Merge blocks emptied by removals, so they do not pile up
+        if (
+            len(block) < self.block_size // 4
+            and index + 1 < len(blocks)
+            and len(block) + len(blocks[index + 1]) <= self.block_size
+        ):
+            blocks[index : index + 2] = [block + blocks[index + 1]]
+            del lasts[index]
+
+
+def _position(
+    blocks: List[List[_Entry]],
+    lasts: List[Tuple[Any, str]],
+    probe: Tuple[Any, ...],
+    right: bool = False,
+) -> Tuple[int, int]:
+    """
+    Find block and position in it of the first entry not below probe, or
+    above it if right
+    """
+    search = bisect_right if right else bisect_left
+    index = search(lasts, probe)
+    if index == len(blocks):
+        return index, 0
+    return index, search(blocks[index], probe, key=_entry_key)
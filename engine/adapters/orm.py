@@ -0,0 +1,86 @@
+import sqlite3
+from functools import lru_cache
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+metadata = MetaData()
+
+players = Table(
+    "players",
+    metadata,
+    Column("id", String(64), primary_key=True),
+    Column("username", String(255), nullable=False, unique=True),
+    Column("version", Integer, nullable=False),
+)
+
+rooms = Table(
+    "rooms",
+    metadata,
+    Column("id", String(64), primary_key=True),
+    Column("creator_id", ForeignKey("players.id"), nullable=False, index=True),
+    Column("capacity", Integer, nullable=True),  # NULL if there is no limit
+    Column("created_at", DateTime(timezone=True), nullable=False, index=True),
+    Column("version", Integer, nullable=False),
+)
+
+room_players = Table(
+    "room_players",
+    metadata,
+    Column("room_id", ForeignKey("rooms.id"), primary_key=True),
+    Column("player_id", ForeignKey("players.id"), primary_key=True),
+    Column("position", Integer, nullable=False),  # Order in which players joined
+    Index("ix_room_players_player_id", "player_id", unique=True),  # One room each
+)
+
+
+@lru_cache(maxsize=None)
+def get_engine(uri: str, pool_size: int = 5, max_overflow: int = 10) -> Engine:
+    """
+    Get engine for database uri. Engines are shared, so every unit of work
+    connected to the same database uses the same connection pool
+
+    Args:
+        uri (str): Database uri
+        pool_size (int): Number of connections kept open in the pool
+        max_overflow (int): Number of connections allowed above pool_size
+
+    Returns:
+        Engine: SQLAlchemy engine
+    """
+    if uri in ("sqlite://", "sqlite:///:memory:"):
+        # Every connection to in-memory SQLite gets its own database, so the
+        # single connection has to be shared. A pool of one lends it to one
+        # transaction at a time, transactions of different lanes wait for
+        # each other instead of mixing statements on the same connection
+        connection = sqlite3.connect(":memory:", check_same_thread=False)
+        engine = create_engine(
+            "sqlite://",
+            creator=lambda: connection,
+            poolclass=QueuePool,
+            pool_size=1,
+            max_overflow=0,
+        )
+    elif uri.startswith("sqlite"):
+        engine = create_engine(uri, connect_args={"check_same_thread": False})
+    else:
+        engine = create_engine(
+            uri,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=True,
+        )
+
+    metadata.create_all(engine)
+    return engine
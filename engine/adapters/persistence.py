@@ -0,0 +1,333 @@
+from __future__ import annotations
+
+import gc
+import glob
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, BinaryIO, Iterator, List, Optional, Tuple
+
+from domain import players, rooms
+
+if TYPE_CHECKING:
+    from adapters import repository
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("<II")  # Length and crc32 of a log record
+
+PlayerRecord = Tuple[str, str, int]  # id, username, version
+# id, creator_id, version, player ids, capacity, created_at timestamp
+RoomRecord = Tuple[str, str, int, List[str], Optional[int], float]
+
+
+def encode_player(player: players.Player) -> PlayerRecord:
+    return (player.id, player.username, player.version)
+
+
+def encode_room(room: rooms.Room) -> RoomRecord:
+    return (
+        room.id,
+        room.creator_id,
+        room.version,
+        [p.id for p in room.players],
+        room.capacity,
+        room.created_at.timestamp(),
+    )
+
+
+class RamPersistence:
+    """
+    Durability for RAM repositories
+
+    Every commit is appended to a write-ahead log before it is applied.
+    Every `snapshot_every` commits the state is written to a snapshot in a
+    background thread and a new log segment is started, so recovery loads
+    the latest snapshot and replays only the log written after it.
+
+    Files in `directory`:
+        snapshot-<sequence>.pickle - state after commit <sequence>
+        wal-<sequence>.log - commits starting from <sequence>
+    """
+
+    def __init__(
+        self, directory: str, snapshot_every: int = 100_000, fsync: bool = False
+    ):
+        """
+        Args:
+            directory (str): Directory for snapshots and log segments
+            snapshot_every (int): Number of commits between snapshots
+            fsync (bool): Wait for every commit to reach the disk. Otherwise
+                commits survive a crash of the process, but not of the machine
+        """
+        self.directory: str = directory
+        self.snapshot_every: int = snapshot_every
+        self.fsync: bool = fsync
+
+        self._sequence: int = 0  # Sequence number of the last commit
+        self._snapshot_sequence: int = 0
+        self._log: Optional[BinaryIO] = None
+        self._snapshot_thread: Optional[threading.Thread] = None
+
+        os.makedirs(directory, exist_ok=True)
+
+    def recover(
+        self,
+        players_repository: repository.RamPlayerRepository,
+        rooms_repository: repository.RamRoomRepository,
+    ) -> None:
+        """
+        Restore repositories from the latest snapshot and the log written
+        after it, then start a new log segment
+
+        Args:
+            players_repository (repository.RamPlayerRepository): Players
+            rooms_repository (repository.RamRoomRepository): Rooms
+        """
+        # Millions of long-lived objects are created at once, collecting
+        # garbage meanwhile would only walk them over and over again
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            players_by_id = {player.id: player for player in players_repository.all()}
+            snapshot = self._latest_snapshot()
+            if snapshot is not None:
+                (
+                    self._sequence,
+                    players_records,
+                    rooms_records,
+                ) = self._read_snapshot(snapshot)
+                self._restore(
+                    players_repository,
+                    rooms_repository,
+                    players_by_id,
+                    players_records,
+                    rooms_records,
+                )
+            self._snapshot_sequence = self._sequence
+
+            replayed = 0
+            for sequence, players_records, rooms_records in self._read_log():
+                if sequence <= self._sequence:
+                    continue
+                self._restore(
+                    players_repository,
+                    rooms_repository,
+                    players_by_id,
+                    players_records,
+                    rooms_records,
+                )
+                self._sequence = sequence
+                replayed += 1
+
+            if gc_enabled:
+                gc.freeze()  # Recovered state stays alive, keep it out of collections
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        logger.info(
+            f"Recovered state at commit {self._sequence}, "
+            f"{replayed} commits replayed from log"
+        )
+        self._open_segment()
+
+    def append(
+        self, players_list: List[players.Player], rooms_list: List[rooms.Room]
+    ) -> None:
+        """
+        Append a commit to the log. Must be called under the commit lock,
+        before the commit is applied
+
+        Args:
+            players_list (List[players.Player]): Added or changed players
+            rooms_list (List[rooms.Room]): Added or changed rooms
+        """
+        if not players_list and not rooms_list:
+            return
+
+        log = self._log if self._log is not None else self._open_segment()
+
+        record = pickle.dumps(
+            (
+                self._sequence + 1,
+                [encode_player(player) for player in players_list],
+                [encode_room(room) for room in rooms_list],
+            ),
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+        log.write(_HEADER.pack(len(record), zlib.crc32(record)) + record)
+        log.flush()
+        if self.fsync:
+            os.fsync(log.fileno())
+
+        self._sequence += 1
+
+    def should_snapshot(self) -> bool:
+        """
+        Check if enough commits were logged since the last snapshot
+
+        Returns:
+            bool: True if snapshot should be taken
+        """
+        return (
+            self._sequence - self._snapshot_sequence >= self.snapshot_every
+            and (self._snapshot_thread is None or not self._snapshot_thread.is_alive())
+        )
+
+    def snapshot(
+        self, players_list: List[players.Player], rooms_list: List[rooms.Room]
+    ) -> None:
+        """
+        Start writing a snapshot in the background. Must be called under the
+        commit lock, so lists hold the state after the last logged commit.
+        Committed instances are never modified in place, so they can be
+        encoded after the lock is released
+
+        Args:
+            players_list (List[players.Player]): All committed players
+            rooms_list (List[rooms.Room]): All committed rooms
+        """
+        sequence = self._sequence
+        self._snapshot_sequence = sequence
+        self._open_segment()
+
+        self._snapshot_thread = threading.Thread(
+            target=self._write_snapshot,
+            args=(sequence, players_list, rooms_list),
+            name="ram-snapshot",
+            daemon=True,
+        )
+        self._snapshot_thread.start()
+
+    def close(self) -> None:
+        """
+        Wait for the snapshot being written and close the log
+        """
+        if self._snapshot_thread is not None:
+            self._snapshot_thread.join()
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _write_snapshot(
+        self,
+        sequence: int,
+        players_list: List[players.Player],
+        rooms_list: List[rooms.Room],
+    ) -> None:
+        path = self._path("snapshot", sequence, "pickle")
+        with open(f"{path}.tmp", "wb") as file:
+            pickle.dump(
+                (
+                    sequence,
+                    [encode_player(player) for player in players_list],
+                    [encode_room(room) for room in rooms_list],
+                ),
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(f"{path}.tmp", path)
+
+        # Everything before the snapshot is not needed anymore
+        for old in self._files("snapshot", "pickle"):
+            if self._file_sequence(old) < sequence:
+                os.remove(old)
+        for old in self._files("wal", "log"):
+            if self._file_sequence(old) <= sequence:
+                os.remove(old)
+
+        logger.info(f"Snapshot written at commit {sequence}")
+
+    def _open_segment(self) -> BinaryIO:
+        if self._log is not None:
+            self._log.close()
+        self._log = open(self._path("wal", self._sequence + 1, "log"), "ab")
+        return self._log
+
+    def _restore(
+        self,
+        players_repository: repository.RamPlayerRepository,
+        rooms_repository: repository.RamRoomRepository,
+        players_by_id: dict[str, players.Player],
+        players_records: List[PlayerRecord],
+        rooms_records: List[RoomRecord],
+    ) -> None:
+        restored_players = []
+        for id, username, version in players_records:
+            player = players.Player(id=id, username=username)
+            player.version = version
+            restored_players.append(player)
+            players_by_id[id] = player
+        players_repository.restore(restored_players)
+
+        restored_rooms = []
+        for record in rooms_records:
+            id, creator_id, version, player_ids = record[:4]
+            # Records written before rooms had capacity and creation time,
+            # rooms had no limit then
+            capacity, created_at = record[4:] if len(record) > 4 else (None, 0.0)
+            room = rooms.Room(
+                id=id,
+                creator=players_by_id[creator_id],
+                players=[players_by_id[player_id] for player_id in player_ids],
+                capacity=capacity,
+                created_at=datetime.fromtimestamp(created_at, timezone.utc),
+            )
+            room.version = version
+            restored_rooms.append(room)
+        rooms_repository.restore(restored_rooms)
+
+    def _read_snapshot(
+        self, path: str
+    ) -> Tuple[int, List[PlayerRecord], List[RoomRecord]]:
+        with open(path, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return pickle.loads(data)
+
+    def _read_log(self) -> Iterator[Tuple[int, List[PlayerRecord], List[RoomRecord]]]:
+        for path in self._files("wal", "log"):
+            size = os.path.getsize(path)
+            if size == 0:
+                continue
+
+            offset = 0
+            with open(path, "rb") as file:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    while offset + _HEADER.size <= size:
+                        length, crc = _HEADER.unpack_from(data, offset)
+                        start = offset + _HEADER.size
+                        record = data[start : start + length]
+                        if len(record) < length or zlib.crc32(record) != crc:
+                            break
+                        yield pickle.loads(record)
+                        offset = start + length
+
+            if offset < size:
+                # Torn write of the last commit before a crash
+                logger.warning(f"Truncating broken log tail in {path}")
+                os.truncate(path, offset)
+
+    def _latest_snapshot(self) -> Optional[str]:
+        snapshots = self._files("snapshot", "pickle")
+        return snapshots[-1] if snapshots else None
+
+    def _files(self, prefix: str, extension: str) -> List[str]:
+        return sorted(
+            glob.glob(os.path.join(self.directory, f"{prefix}-*.{extension}")),
+            key=self._file_sequence,
+        )
+
+    def _path(self, prefix: str, sequence: int, extension: str) -> str:
+        return os.path.join(self.directory, f"{prefix}-{sequence:016d}.{extension}")
+
+    @staticmethod
+    def _file_sequence(path: str) -> int:
+        return int(os.path.basename(path).split("-")[1].split(".")[0])
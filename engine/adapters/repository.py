@@ -1,18 +1,90 @@
 from __future__ import annotations
 
 import abc
-from copy import deepcopy
-from typing import Generic, List, Optional, TypeVar
+import contextvars
+import sys
+from collections import defaultdict, deque
+from copy import copy
+from datetime import datetime, timezone
+from operator import attrgetter
+from typing import (
+    Any,
+    Callable,
+    Generic,
+    Iterable,
+    KeysView,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    cast,
+)
 
+from adapters import indexes, orm
 from domain import players, rooms
 from domain.base import BaseModel
+from service_player import exceptions
+from sqlalchemy import (
+    Table,
+    and_,
+    bindparam,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import Select, Subquery
 
 _T = TypeVar("_T", bound=BaseModel)
+# Free slots rooms without capacity are sorted by, after all others
+_NO_LIMIT = sys.maxsize
 
 
-class AbstractRepository(abc.ABC, Generic[_T]):
+class _State:
+    """
+    Transaction state of a repository. Each thread and asyncio task has its
+    own, so they can run units of work against the same repository at once
+    """
+
     def __init__(self):
-        self.seen: set[_T] = set()
+        self.seen: dict = {}  # Used as a set which keeps insertion order
+        self.transaction: Optional[_Transaction] = None
+        self.connection: Optional[Connection] = None
+
+
+class AbstractRepository(abc.ABC, Generic[_T]):
+    _fields: List[str]  # Unique fields, the first one is the key
+
+    def __init__(self, indexes_list: Optional[List[indexes.Index[_T]]] = None):
+        self._state: contextvars.ContextVar[_State] = contextvars.ContextVar(
+            f"{type(self).__name__}_state"
+        )
+        self._indexes: dict[str, indexes.Index[_T]] = {
+            index.name: index for index in indexes_list or []
+        }
+
+    @property
+    def _local(self) -> _State:
+        try:
+            return self._state.get()
+        except LookupError:
+            state = _State()
+            self._state.set(state)
+            return state
+
+    @property
+    def seen(self) -> KeysView[_T]:
+        """
+        Instances added or loaded in the current transaction, in the
+        order they were first seen. Cleared on commit and rollback
+
+        Returns:
+            KeysView[_T]: Instances
+        """
+        return self._local.seen.keys()
 
     def add(self, instance: _T) -> None:
         """
@@ -22,7 +94,8 @@ class AbstractRepository(abc.ABC, Generic[_T]):
             instance (_T): Instance
         """
         self._add(instance)
-        self.seen.add(instance)
+        if self._local.transaction is not None:
+            self._local.seen[instance] = None
 
     def get(self, **kwargs) -> Optional[_T]:
         """
@@ -36,11 +109,235 @@ class AbstractRepository(abc.ABC, Generic[_T]):
         """
         instance: Optional[_T] = self._get(**kwargs)
 
-        if instance:
-            self.seen.add(instance)
+        if instance and self._local.transaction is not None:
+            self._see([instance])
 
         return instance
 
+    def savepoint(self) -> Optional[_Savepoint[_T]]:
+        """
+        Mark the current state of the transaction to roll back to later.
+        Instances are copied lazily, when they are got from the repository
+        after the savepoint, so the cost depends on the instances touched
+
+        Returns:
+            Optional[_Savepoint[_T]]: Savepoint, None outside of a transaction
+        """
+        if self._local.transaction is None:
+            return None
+
+        return self._local.transaction.savepoint(len(self._local.seen))
+
+    def rollback_to(self, savepoint: Optional[_Savepoint[_T]]) -> None:
+        """
+        Undo changes made to the transaction since savepoint, keeping ones
+        made before it. The savepoint and ones marked after it are released
+
+        Args:
+            savepoint (Optional[_Savepoint[_T]]): Savepoint
+        """
+        if savepoint is None or self._local.transaction is None:
+            return
+
+        seen = self._local.seen
+        while len(seen) > savepoint.seen:  # Seen later, dicts pop in LIFO order
+            seen.popitem()
+
+        self._local.transaction.rollback_to(savepoint, self._fields)
+
+    def release(self, savepoint: Optional[_Savepoint[_T]]) -> None:
+        """
+        Forget savepoint, keeping changes made since it
+
+        Args:
+            savepoint (Optional[_Savepoint[_T]]): Savepoint
+        """
+        if savepoint is None or self._local.transaction is None:
+            return
+
+        self._local.transaction.release(savepoint)
+
+    def find(self, index: str, value: Any) -> List[_T]:
+        """
+        Get instances by value of a secondary index
+
+        Args:
+            index (str): Name of index
+            value (Any): Indexed value
+
+        Raises:
+            ValueError: If there is no such index
+
+        Returns:
+            List[_T]: Instances
+        """
+        found = self._find(self._index(index).name, value)
+        return self._merge_working(index, found, lambda values: value in values)
+
+    def find_range(
+        self,
+        index: str,
+        start: Any = None,
+        stop: Any = None,
+        limit: Optional[int] = None,
+        reverse: bool = False,
+        after: Optional[Tuple[Any, str]] = None,
+    ) -> List[_T]:
+        """
+        Get instances with values of a sorted secondary index in range
+        [start, stop), ordered by value and id
+
+        Args:
+            index (str): Name of index
+            start (Any): Lowest value, unbounded if None
+            stop (Any): Value above the highest, unbounded if None
+            limit (Optional[int]): Maximum number of instances
+            reverse (bool): Return highest values first
+            after (Optional[Tuple[Any, str]]): Value and id of the last instance
+                of the previous page, to continue right after it
+
+        Raises:
+            ValueError: If there is no such sorted index
+
+        Returns:
+            List[_T]: Instances
+        """
+        if not isinstance(self._index(index), indexes.SortedIndex):
+            raise ValueError(f"Index {index} is not sorted")
+
+        transaction = self._local.transaction
+        # Working copies may leave the range, fetch enough to fill the limit
+        extra = len(transaction.working) if transaction is not None else 0
+        found = self._find_range(
+            index,
+            start,
+            stop,
+            None if limit is None else limit + extra,
+            reverse,
+            after,
+        )
+        if transaction is None:
+            return found
+
+        def in_range(values: Tuple[Any, ...]) -> bool:
+            return bool(values) and all(
+                (start is None or value >= start) and (stop is None or value < stop)
+                for value in values
+            )
+
+        key = self._indexes[index].key
+
+        def position(instance: _T) -> Tuple[Any, str]:
+            return (key(instance), instance.id)
+
+        found = sorted(
+            self._merge_working(index, found, in_range), key=position, reverse=reverse
+        )
+        if after is not None:
+            found = [
+                instance
+                for instance in found
+                if (position(instance) < after) == reverse
+                and position(instance) != after
+            ]
+        return found if limit is None else found[:limit]
+
+    def _index(self, name: str) -> indexes.Index[_T]:
+        if name not in self._indexes:
+            raise ValueError(f"Unknown index {name}")
+        return self._indexes[name]
+
+    def _merge_working(
+        self,
+        index: str,
+        found: List[_T],
+        matches: Callable[[Tuple[Any, ...]], bool],
+    ) -> List[_T]:
+        """
+        Make result of index query see changes of the current transaction.
+        Indexes only know committed values, so instances changed since then
+        are matched again and added instances matching the query are added
+
+        Args:
+            index (str): Name of index
+            found (List[_T]): Instances found by committed values
+            matches (Callable[[Tuple[Any, ...]], bool]): Check of indexed values
+
+        Returns:
+            List[_T]: Instances
+        """
+        transaction = self._local.transaction
+        if transaction is None:
+            return found
+
+        values = self._indexes[index].values
+        result = [instance for instance in found if matches(values(instance))]
+        returned = {id(instance) for instance in found}
+        result.extend(
+            instance
+            for instance in transaction.working.values()
+            if id(instance) not in returned and matches(values(instance))
+        )
+
+        self._see(result)
+        return result
+
+    def _see(self, instances: List[_T]) -> None:
+        self._local.seen.update(dict.fromkeys(instances))
+
+        transaction = self._local.transaction
+        # Keep state to roll back to before changes
+        if transaction is not None and transaction.savepoints:
+            key = self._fields[0]
+            for instance in instances:
+                transaction.protect(getattr(instance, key), instance)
+
+    def _find(self, index: str, value: Any) -> List[_T]:
+        """
+        Get instances by committed value of index, working copies of them
+        if in a transaction
+
+        Args:
+            index (str): Name of index
+            value (Any): Indexed value
+
+        Returns:
+            List[_T]: Instances
+        """
+        raise NotImplementedError
+
+    def _find_range(
+        self,
+        index: str,
+        start: Any,
+        stop: Any,
+        limit: Optional[int],
+        reverse: bool,
+        after: Optional[Tuple[Any, str]],
+    ) -> List[_T]:
+        """
+        Get instances by committed values of sorted index in range
+        [start, stop) and after position `after`, working copies of them if
+        in a transaction
+
+        Returns:
+            List[_T]: Instances
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        """
+        Get number of committed instances, e.g. for metrics
+
+        Raises:
+            NotImplementedError: Not implemented
+
+        Returns:
+            int: Number of instances
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def _add(self, instance: _T) -> None:
         """
@@ -68,13 +365,166 @@ class AbstractRepository(abc.ABC, Generic[_T]):
         raise NotImplementedError
 
 
+def _state(instance: BaseModel) -> dict[str, Any]:
+    """
+    Get attributes of instance as a dictionary
+
+    Args:
+        instance (BaseModel): Instance
+
+    Returns:
+        dict[str, Any]: Attribute name to value mapping
+    """
+    state: Any = instance.__getstate__()
+    if isinstance(state, tuple):  # Instances with __slots__
+        return {**(state[0] or {}), **state[1]}
+    return state
+
+
+def _copy_instance(instance: _T) -> _T:
+    """
+    Copy instance together with its containers, so that the copy can be
+    modified without affecting the original
+
+    Args:
+        instance (_T): Instance
+
+    Returns:
+        _T: Working copy of instance
+    """
+    duplicate = copy(instance)
+    for name, value in _state(instance).items():
+        if isinstance(value, (list, dict, set, deque)):
+            setattr(duplicate, name, copy(value))
+    return duplicate
+
+
+def _restore_instance(instance: _T, copied: _T) -> None:
+    """
+    Bring instance back to the state it had when it was copied
+
+    Args:
+        instance (_T): Instance
+        copied (_T): Copy made by _copy_instance
+    """
+    state = _state(copied)
+    for name in _state(instance).keys() - state.keys():  # Set after copying
+        delattr(instance, name)
+    for name, value in state.items():
+        setattr(instance, name, value)
+
+
+class _Savepoint(Generic[_T]):
+    """
+    State of a transaction to roll back to: how many instances were tracked
+    and seen, and copies of working ones made before they were got again
+    """
+
+    def __init__(self, tracked: int, seen: int):
+        self.tracked: int = tracked
+        self.seen: int = seen
+        self.copies: dict[Any, Tuple[_T, _T]] = {}  # key -> (working, copy)
+
+
+class _Transaction(Generic[_T]):
+    """
+    Instances touched in a repository since the last commit or rollback
+
+    `working` holds instances handed out to the caller, `originals` holds
+    what they looked like when they were loaded (None for added instances)
+    """
+
+    def __init__(self):
+        self.working: dict[Any, _T] = {}  # key -> working copy
+        self.originals: dict[Any, Optional[_T]] = {}  # key -> committed instance
+        self.lookups: dict[str, dict[Any, _T]] = defaultdict(dict)
+        self.pending: Optional[List[Tuple[_T, Optional[_T]]]] = None  # Prepared
+        self.savepoints: List[_Savepoint[_T]] = []
+
+    def track(self, key: Any, instance: _T, original: Optional[_T], fields: List[str]):
+        self.working[key] = instance
+        self.originals.setdefault(key, original)
+        for field in fields:
+            self.lookups[field][getattr(instance, field)] = instance
+
+    def changes(self) -> List[Tuple[_T, Optional[_T]]]:
+        """
+        Instances which were added or changed, with their originals
+        """
+        return [
+            (instance, original)
+            for key, instance in self.working.items()
+            if (original := self.originals[key]) is None
+            or _state(original) != _state(instance)
+        ]
+
+    def savepoint(self, seen: int) -> _Savepoint[_T]:
+        savepoint: _Savepoint[_T] = _Savepoint(len(self.working), seen)
+        self.savepoints.append(savepoint)
+        return savepoint
+
+    def protect(self, key: Any, instance: _T) -> None:
+        """
+        Copy working instance, unless the last savepoint has it already
+        """
+        copies = self.savepoints[-1].copies
+        if key not in copies:
+            copies[key] = (instance, _copy_instance(instance))
+
+    def rollback_to(self, savepoint: _Savepoint[_T], fields: List[str]) -> None:
+        while self.savepoints:  # Undo later savepoints first
+            last = self.savepoints.pop()
+            while len(self.working) > last.tracked:  # Tracked after savepoint
+                key, instance = self.working.popitem()
+                del self.originals[key]
+                self._forget_lookups(instance, fields)
+
+            for key, (instance, copied) in last.copies.items():
+                if key in self.working:
+                    self._forget_lookups(self.working[key], fields)
+                    _restore_instance(instance, copied)
+                    self.working[key] = instance
+                    for field in fields:
+                        self.lookups[field][getattr(instance, field)] = instance
+
+            if last is savepoint:
+                break
+
+        self.pending = None
+
+    def _forget_lookups(self, instance: _T, fields: List[str]) -> None:
+        for field in fields:
+            lookup = self.lookups[field]
+            if lookup.get(getattr(instance, field)) is instance:
+                del lookup[getattr(instance, field)]
+
+    def release(self, savepoint: _Savepoint[_T]) -> None:
+        while self.savepoints:
+            last = self.savepoints.pop()
+            if self.savepoints:  # Outer savepoint rolls these changes back too
+                copies = self.savepoints[-1].copies
+                for key, copied in last.copies.items():
+                    copies.setdefault(key, copied)
+
+            if last is savepoint:
+                break
+
+    def clear(self) -> None:
+        self.working.clear()
+        self.originals.clear()
+        self.lookups.clear()
+        self.pending = None
+        self.savepoints.clear()
+
+
 class RamRepository(AbstractRepository[_T]):
     def __init__(
         self,
         fields: Optional[List[str]] = None,
         storages: Optional[dict[str, dict[str, _T]]] = None,
+        indexes_list: Optional[List[indexes.Index[_T]]] = None,
     ):
-        super().__init__()
+        super().__init__(indexes_list)
         self._fields: List[str] = fields or []
         self._storages: dict[str, dict[str, _T]] = storages or {}
 
@@ -82,34 +532,245 @@ class RamRepository(AbstractRepository[_T]):
             if field not in self._storages:
                 self._storages[field] = {}
 
-    def copy(self) -> RamRepository[_T]:
+    def __len__(self) -> int:  # For testing purposes
+        return len(self._storages[self._fields[0]])
+
+    def begin(self) -> None:
+        """
+        Start tracking changes. Until commit, instances returned by the
+        repository are working copies of the committed ones
+        """
+        if self._local.transaction is None:
+            self._local.transaction = _Transaction()
+
+    def end(self) -> None:
+        """
+        Stop tracking changes, uncommitted changes are discarded
         """
-        Copy repository
+        self.rollback()
+        self._local.transaction = None
+
+    def all(self) -> List[_T]:
+        """
+        Get all committed instances
 
         Returns:
-            RamRepository: Copy of repository
+            List[_T]: Instances
         """
-        fields = self._fields.copy()
-        storages = deepcopy(self._storages)
-        repository = RamRepository(fields, storages)
-        repository.seen = self.seen.copy()
-        return repository
+        return list(self._storages[self._fields[0]].values())
 
-    def __len__(self) -> int:  # For testing purposes
-        return len(self._storages[self._fields[0]])
+    def restore(self, instances: Iterable[_T]) -> None:
+        """
+        Store instances as committed, replacing ones with the same key.
+        Used to recover the repository from persistent storage
 
-    def _add(self, instance: _T) -> None:
-        for field in self._fields:
+        Args:
+            instances (Iterable[_T]): Instances
+        """
+        storage = self._storages[self._fields[0]]
+        for instance in instances:
+            self._store(instance, storage.get(getattr(instance, self._fields[0])))
+
+    def prepare(self) -> List[_T]:
+        """
+        Check that nothing changed by the current transaction was committed
+        by another transaction since it was loaded, and set new versions of
+        the instances to be stored by commit
+
+        Raises:
+            exceptions.ConcurrencyConflict: If it was
+
+        Returns:
+            List[_T]: Instances to be stored
+        """
+        transaction = self._local.transaction
+        if transaction is None:
+            return []
+
+        return [instance for instance, _ in self._prepare(transaction)]
+
+    def commit(self) -> None:
+        """
+        Store working copies which were added or changed since the last commit.
+        Cost is proportional to the number of instances touched
+
+        Raises:
+            exceptions.ConcurrencyConflict: If not prepared and preparing fails
+        """
+        transaction = self._local.transaction
+        if transaction is None:
+            return
+
+        pending = transaction.pending
+        if pending is None:
+            pending = self._prepare(transaction)
+
+        for instance, original in pending:
+            self._store(instance, original)
+
+        self._local.seen.clear()
+        transaction.clear()
+
+    def rollback(self) -> None:
+        """
+        Forget working copies made since the last commit
+        """
+        transaction = self._local.transaction
+        if transaction is None:
+            return
+
+        self._local.seen.clear()
+        transaction.clear()
+
+    def _prepare(
+        self, transaction: _Transaction[_T]
+    ) -> List[Tuple[_T, Optional[_T]]]:
+        transaction.pending = pending = transaction.changes()
+        claimed: dict[Tuple[str, Any], _T] = {}  # Unique values of pending
+        for instance, original in pending:
+            self._check_conflicts(instance, original)
+            self._check_unique_indexes(transaction, instance, original, claimed)
+            instance.version = (original.version if original else 0) + 1
+
+        return pending
+
+    def _check_conflicts(self, instance: _T, original: Optional[_T]) -> None:
+        key = getattr(instance, self._fields[0])
+        stored = self._storages[self._fields[0]].get(key)
+
+        expected_version = original.version if original is not None else None
+        stored_version = stored.version if stored is not None else None
+        if stored_version != expected_version:
+            raise exceptions.ConcurrencyConflict(
+                f"{type(instance).__name__} with id {key} was changed \
+by another transaction"
+            )
+
+        for field in self._fields[1:]:
             value = getattr(instance, field)
-            self._storages[field][value] = instance
+            other = self._storages[field].get(value)
+            if other is not None and other is not stored:
+                raise exceptions.ConcurrencyConflict(
+                    f"{type(instance).__name__} with {field} {value} already exists"
+                )
+
+    def _check_unique_indexes(
+        self,
+        transaction: _Transaction[_T],
+        instance: _T,
+        original: Optional[_T],
+        claimed: dict[Tuple[str, Any], _T],
+    ) -> None:
+        key = self._fields[0]
 
-    def _get(self, **kwargs) -> Optional[players.Player]:
+        for index in self._indexes.values():
+            if not index.unique:
+                continue
+
+            # Values kept from original were checked when they were added,
+            # a change to a room with many players checks only new ones
+            added = set(index.values(instance))
+            if original is not None:
+                added.difference_update(index.values(original))
+            for value in added:
+                if claimed.setdefault((index.name, value), instance) is not instance:
+                    raise exceptions.ConcurrencyConflict(
+                        f"{type(instance).__name__} with {index.name} {value} \
+already exists"
+                    )
+
+                for other in index.find(value):
+                    if other.id == instance.id:
+                        continue
+                    working = transaction.working.get(getattr(other, key))
+                    if working is not None and value not in index.values(working):
+                        continue  # Released by the same transaction
+                    raise exceptions.ConcurrencyConflict(
+                        f"{type(instance).__name__} with {index.name} {value} \
+already exists"
+                    )
+
+    def _store(self, instance: _T, original: Optional[_T]) -> None:
+        # Readers do not lock, so new keys are assigned before old ones are
+        # deleted: a key which still exists is never missing in between
+        for field in self._fields:
+            self._storages[field][getattr(instance, field)] = instance
+
+        if original is not None:
+            for field in self._fields:
+                value = getattr(original, field)
+                storage = self._storages[field]
+                if value != getattr(instance, field) and storage.get(value) is original:
+                    del storage[value]
+
+        for index in self._indexes.values():
+            index.update(instance, original)
+
+    def _add(self, instance: _T) -> None:
+        if self._local.transaction is None:
+            instance.version += 1
+            self._store(instance, None)
+            return
+
+        key = getattr(instance, self._fields[0])
+        self._local.transaction.track(key, instance, None, self._fields)
+
+    def _get(self, **kwargs) -> Optional[_T]:
         for field in self._fields:
             if value := kwargs.get(field, None):
-                return self._storages[field].get(value, None)
+                return self._lookup(field, value)
 
         return None
 
+    def _find(self, index: str, value: Any) -> List[_T]:
+        return self._working(self._indexes[index].find(value))
+
+    def _find_range(
+        self,
+        index: str,
+        start: Any,
+        stop: Any,
+        limit: Optional[int],
+        reverse: bool,
+        after: Optional[Tuple[Any, str]],
+    ) -> List[_T]:
+        # Checked to be sorted by find_range
+        sorted_index = cast(indexes.SortedIndex[_T], self._indexes[index])
+        return self._working(
+            sorted_index.find_range(start, stop, limit, reverse, after)
+        )
+
+    def _working(self, committed: List[_T]) -> List[_T]:
+        if self._local.transaction is None:
+            return committed
+
+        key = self._fields[0]
+        return [
+            instance
+            for original in committed
+            if (instance := self._lookup(key, getattr(original, key))) is not None
+        ]
+
+    def _lookup(self, field: str, value: Any) -> Optional[_T]:
+        transaction = self._local.transaction
+        if transaction is None:
+            return self._storages[field].get(value, None)
+
+        if (instance := transaction.lookups[field].get(value)) is not None:
+            return instance
+
+        original = self._storages[field].get(value, None)
+        if original is None:
+            return None
+
+        key = getattr(original, self._fields[0])
+        if key in transaction.working:  # Value was changed in working copy
+            return None
+
+        instance = _copy_instance(original)
+        transaction.track(key, instance, original, self._fields)
+        return instance
+
 
 class RamPlayerRepository(RamRepository[players.Player]):
     def __init__(
@@ -121,11 +782,573 @@ class RamPlayerRepository(RamRepository[players.Player]):
         super().__init__(fields, storages)
 
 
+def _room_indexes() -> List[indexes.Index[rooms.Room]]:
+    return [
+        # Player can be in one room at a time
+        indexes.MultiIndex(
+            "player_id",
+            lambda room: [player.id for player in room.players],
+            unique=True,
+        ),
+        indexes.SortedIndex("players_count", attrgetter("players_count")),
+        indexes.SortedIndex("created_at"),
+        # Rooms players can still join, by creation time
+        indexes.SortedIndex(
+            "open_created_at",
+            attrgetter("created_at"),
+            where=lambda room: not room.is_full,
+        ),
+        # Rooms players can still join, fullest first
+        indexes.SortedIndex(
+            "open_free_slots",
+            lambda room: _NO_LIMIT if room.free_slots is None else room.free_slots,
+            where=lambda room: not room.is_full,
+        ),
+    ]
+
+
 class RamRoomRepository(RamRepository[rooms.Room]):
     def __init__(
         self,
         fields: Optional[List[str]] = None,
         storages: Optional[dict[str, dict[str, players.Player]]] = None,
+        indexes_list: Optional[List[indexes.Index[rooms.Room]]] = None,
     ):
         fields = fields or ["id", "creator_id"]
-        super().__init__(fields, storages)
+        super().__init__(fields, storages, indexes_list or _room_indexes())
+
+
+class SqlRepository(AbstractRepository[_T]):
+    def __init__(
+        self,
+        engine: Engine,
+        fields: List[str],
+        indexes_list: Optional[List[indexes.Index[_T]]] = None,
+    ):
+        super().__init__(indexes_list)
+        self._engine: Engine = engine
+        self._fields: List[str] = fields
+
+    def begin(self, connection: Connection) -> None:
+        """
+        Start tracking changes made through connection. Changes are written
+        in batches by flush
+
+        Args:
+            connection (Connection): Connection with an open transaction
+        """
+        self._local.connection = connection
+        self._local.transaction = _Transaction()
+
+    def end(self) -> None:
+        """
+        Stop tracking changes, unflushed changes are discarded
+        """
+        self.rollback()
+        self._local.connection = None
+        self._local.transaction = None
+
+    @property
+    def _connection(self) -> Connection:
+        # Set by begin, together with the transaction
+        return cast(Connection, self._local.connection)
+
+    def flush(self) -> None:
+        """
+        Write instances which were added or changed since the last flush
+        and bump their versions
+
+        Raises:
+            exceptions.ConcurrencyConflict: If a changed instance was updated
+                by another transaction since it was loaded
+        """
+        transaction = self._local.transaction
+        if transaction is None:
+            return
+
+        added: List[_T] = []
+        changed: List[Tuple[_T, _T]] = []
+        for instance, original in transaction.changes():
+            if original is None:
+                added.append(instance)
+            else:
+                changed.append((instance, original))
+
+        self._write(self._connection, added, changed)
+
+        for instance in added + [instance for instance, _ in changed]:
+            instance.version += 1
+
+        self._local.seen.clear()
+        transaction.clear()
+
+    def rollback(self) -> None:
+        """
+        Forget instances loaded since the last flush
+        """
+        transaction = self._local.transaction
+        if transaction is None:
+            return
+
+        self._local.seen.clear()
+        transaction.clear()
+
+    def _add(self, instance: _T) -> None:
+        if self._local.transaction is None:
+            with self._engine.begin() as connection:
+                self._write(connection, [instance], [])
+            return
+
+        key = getattr(instance, self._fields[0])
+        self._local.transaction.track(key, instance, None, self._fields)
+
+    def _get(self, **kwargs) -> Optional[_T]:
+        for field in self._fields:
+            if value := kwargs.get(field, None):
+                return self._lookup(field, value)
+
+        return None
+
+    def _lookup(self, field: str, value: Any) -> Optional[_T]:
+        transaction = self._local.transaction
+        if transaction is None:
+            with self._engine.connect() as connection:
+                return self._load(connection, field, value)
+
+        if (instance := transaction.lookups[field].get(value)) is not None:
+            return instance
+
+        instance = self._load(self._connection, field, value)
+        if instance is None:
+            return None
+
+        key = getattr(instance, self._fields[0])
+        if key in transaction.working:  # Value was changed in working copy
+            return None
+
+        transaction.track(key, instance, _copy_instance(instance), self._fields)
+        return instance
+
+    def _find(self, index: str, value: Any) -> List[_T]:
+        keys = self._index_subquery(index)
+        return self._load_all(select(keys.c.id).where(keys.c.key == value))
+
+    def _find_range(
+        self,
+        index: str,
+        start: Any,
+        stop: Any,
+        limit: Optional[int],
+        reverse: bool,
+        after: Optional[Tuple[Any, str]],
+    ) -> List[_T]:
+        keys = self._index_subquery(index)
+        statement = select(keys.c.id)
+        if start is not None:
+            statement = statement.where(keys.c.key >= start)
+        if stop is not None:
+            statement = statement.where(keys.c.key < stop)
+        if after is not None:
+            value, id = after
+            if reverse:
+                statement = statement.where(
+                    or_(keys.c.key < value, and_(keys.c.key == value, keys.c.id < id))
+                )
+            else:
+                statement = statement.where(
+                    or_(keys.c.key > value, and_(keys.c.key == value, keys.c.id > id))
+                )
+        if reverse:
+            statement = statement.order_by(keys.c.key.desc(), keys.c.id.desc())
+        else:
+            statement = statement.order_by(keys.c.key, keys.c.id)
+        if limit is not None:
+            statement = statement.limit(limit)
+
+        return self._load_all(statement)
+
+    def _load_all(self, statement: Select) -> List[_T]:
+        """
+        Load instances by ids selected by statement, in the same order
+
+        Args:
+            statement (Select): Select of ids
+
+        Returns:
+            List[_T]: Instances, working copies if in a transaction
+        """
+        field = self._fields[0]
+        if self._local.transaction is None:
+            with self._engine.connect() as connection:
+                return [
+                    instance
+                    for id in connection.scalars(statement).all()
+                    if (instance := self._load(connection, field, id)) is not None
+                ]
+
+        return [
+            instance
+            for id in self._connection.scalars(statement).all()
+            if (instance := self._lookup(field, id)) is not None
+        ]
+
+    def _index_subquery(self, index: str) -> Subquery:
+        """
+        Get query mirroring a secondary index
+
+        Args:
+            index (str): Name of index
+
+        Returns:
+            Subquery: Rows of instance ids ("id") and indexed values ("key")
+        """
+        raise NotImplementedError
+
+    def _update_versioned(
+        self, connection: Connection, table: Table, instances: List[_T], **columns
+    ) -> None:
+        """
+        Update rows of instances if their versions did not change since they
+        were loaded, bumping the versions
+
+        Args:
+            connection (Connection): Connection
+            table (Table): Table
+            instances (List[_T]): Changed instances
+            **columns: Column name to function getting its value from instance
+
+        Raises:
+            exceptions.ConcurrencyConflict: If any row was not updated
+        """
+        statement = (
+            update(table)
+            .where(
+                table.c.id == bindparam("instance_id"),
+                table.c.version == bindparam("instance_version"),
+            )
+            .values(
+                version=table.c.version + 1,
+                **{name: bindparam(f"new_{name}") for name in columns},
+            )
+        )
+        rows = [
+            {
+                "instance_id": instance.id,
+                "instance_version": instance.version,
+                **{f"new_{name}": get(instance) for name, get in columns.items()},
+            }
+            for instance in instances
+        ]
+
+        if connection.dialect.supports_sane_multi_rowcount:
+            updated = connection.execute(statement, rows).rowcount
+        else:
+            updated = sum(connection.execute(statement, row).rowcount for row in rows)
+
+        if updated != len(rows):
+            raise exceptions.ConcurrencyConflict(
+                f"{table.name} were changed by another transaction"
+            )
+
+    @abc.abstractmethod
+    def _load(self, connection: Connection, field: str, value: Any) -> Optional[_T]:
+        """
+        Load instance from database
+
+        Args:
+            connection (Connection): Connection
+            field (str): Indexed column to search by
+            value (Any): Value of column
+
+        Returns:
+            Optional[_T]: Instance or None if not found
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def _write(
+        self,
+        connection: Connection,
+        added: List[_T],
+        changed: List[Tuple[_T, _T]],
+    ):
+        """
+        Write instances to database
+
+        Args:
+            connection (Connection): Connection
+            added (List[_T]): Instances to insert
+            changed (List[Tuple[_T, _T]]): Instances to update, with how they
+                looked when they were loaded
+        """
+        raise NotImplementedError
+
+
+class SqlPlayerRepository(SqlRepository[players.Player]):
+    def __init__(self, engine: Engine, fields: Optional[List[str]] = None):
+        super().__init__(engine, fields or ["id", "username"])
+
+    def __len__(self) -> int:  # For testing purposes
+        with self._engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(orm.players)
+            ).scalar_one()
+
+    def _load(
+        self, connection: Connection, field: str, value: Any
+    ) -> Optional[players.Player]:
+        row = connection.execute(
+            select(orm.players).where(orm.players.c[field] == value)
+        ).first()
+
+        if row is None:
+            return None
+
+        player = players.Player(id=row.id, username=row.username)
+        player.version = row.version
+        return player
+
+    def _write(
+        self,
+        connection: Connection,
+        added: List[players.Player],
+        changed: List[Tuple[players.Player, players.Player]],
+    ):
+        if added:
+            connection.execute(
+                insert(orm.players),
+                [
+                    {"id": player.id, "username": player.username, "version": 1}
+                    for player in added
+                ],
+            )
+
+        if changed:
+            self._update_versioned(
+                connection,
+                orm.players,
+                [player for player, _ in changed],
+                username=lambda player: player.username,
+            )
+
+
+class SqlRoomRepository(SqlRepository[rooms.Room]):
+    def __init__(
+        self,
+        engine: Engine,
+        fields: Optional[List[str]] = None,
+        indexes_list: Optional[List[indexes.Index[rooms.Room]]] = None,
+    ):
+        super().__init__(
+            engine, fields or ["id", "creator_id"], indexes_list or _room_indexes()
+        )
+
+    def __len__(self) -> int:  # For testing purposes
+        with self._engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(orm.rooms)
+            ).scalar_one()
+
+    def _index_subquery(self, index: str) -> Subquery:
+        if index == "player_id":
+            return select(
+                orm.room_players.c.room_id.label("id"),
+                orm.room_players.c.player_id.label("key"),
+            ).subquery()
+
+        if index == "players_count":
+            return (
+                select(
+                    orm.rooms.c.id.label("id"),
+                    func.count(orm.room_players.c.player_id).label("key"),
+                )
+                .select_from(
+                    orm.rooms.outerjoin(
+                        orm.room_players, orm.room_players.c.room_id == orm.rooms.c.id
+                    )
+                )
+                .group_by(orm.rooms.c.id)
+                .subquery()
+            )
+
+        if index == "created_at":
+            return select(
+                orm.rooms.c.id.label("id"), orm.rooms.c.created_at.label("key")
+            ).subquery()
+
+        if index == "open_created_at":
+            return (
+                select(
+                    orm.rooms.c.id.label("id"), orm.rooms.c.created_at.label("key")
+                )
+                .select_from(
+                    orm.rooms.outerjoin(
+                        orm.room_players, orm.room_players.c.room_id == orm.rooms.c.id
+                    )
+                )
+                .group_by(orm.rooms.c.id)
+                .having(
+                    or_(
+                        orm.rooms.c.capacity.is_(None),
+                        func.count(orm.room_players.c.player_id) < orm.rooms.c.capacity,
+                    )
+                )
+                .subquery()
+            )
+
+        if index == "open_free_slots":
+            members = func.count(orm.room_players.c.player_id)
+            return (
+                select(
+                    orm.rooms.c.id.label("id"),
+                    func.coalesce(orm.rooms.c.capacity - members, _NO_LIMIT).label(
+                        "key"
+                    ),
+                )
+                .select_from(
+                    orm.rooms.outerjoin(
+                        orm.room_players, orm.room_players.c.room_id == orm.rooms.c.id
+                    )
+                )
+                .group_by(orm.rooms.c.id)
+                .having(
+                    or_(orm.rooms.c.capacity.is_(None), members < orm.rooms.c.capacity)
+                )
+                .subquery()
+            )
+
+        return super()._index_subquery(index)
+
+    def _load(
+        self, connection: Connection, field: str, value: Any
+    ) -> Optional[rooms.Room]:
+        row = connection.execute(
+            select(
+                orm.rooms.c.id,
+                orm.rooms.c.creator_id,
+                orm.rooms.c.version,
+                orm.rooms.c.capacity,
+                orm.rooms.c.created_at,
+                orm.players.c.username,
+            )
+            .join(orm.players, orm.players.c.id == orm.rooms.c.creator_id)
+            .where(orm.rooms.c[field] == value)
+            .limit(1)
+        ).first()
+
+        if row is None:
+            return None
+
+        members = connection.execute(
+            select(orm.players.c.id, orm.players.c.username)
+            .join(orm.room_players, orm.room_players.c.player_id == orm.players.c.id)
+            .where(orm.room_players.c.room_id == row.id)
+            .order_by(orm.room_players.c.position)
+        )
+
+        room = rooms.Room(
+            id=row.id,
+            creator=players.Player(id=row.creator_id, username=row.username),
+            players=[
+                players.Player(id=member.id, username=member.username)
+                for member in members
+            ],
+            capacity=row.capacity,
+            created_at=_utc(row.created_at),
+        )
+        room.version = row.version
+        return room
+
+    def _write(
+        self,
+        connection: Connection,
+        added: List[rooms.Room],
+        changed: List[Tuple[rooms.Room, rooms.Room]],
+    ):
+        if added:
+            connection.execute(
+                insert(orm.rooms),
+                [
+                    {
+                        "id": room.id,
+                        "creator_id": room.creator_id,
+                        "capacity": room.capacity,
+                        "created_at": _utc(room.created_at),
+                        "version": 1,
+                    }
+                    for room in added
+                ],
+            )
+
+        members = [
+            {"room_id": room.id, "player_id": player.id, "position": position}
+            for room in added
+            for position, player in enumerate(room.players)
+        ]
+        if changed:
+            self._update_versioned(connection, orm.rooms, [room for room, _ in changed])
+            members.extend(self._write_members(connection, changed))
+
+        if members:
+            connection.execute(insert(orm.room_players), members)
+
+    def _write_members(
+        self, connection: Connection, changed: List[Tuple[rooms.Room, rooms.Room]]
+    ) -> List[dict[str, Any]]:
+        """
+        Delete rows of players who left changed rooms. Players who stay keep
+        their order, so only who joined is inserted, after them. A player who
+        left and joined again moved to the end, the room is then rewritten
+
+        Returns:
+            List[dict[str, Any]]: Rows of players who joined
+        """
+        left: List[dict[str, Any]] = []
+        joined: List[Tuple[str, str]] = []
+        for room, original in changed:
+            ids = [player.id for player in room.players]
+            original_ids = [player.id for player in original.players]
+            members = set(ids)
+            stayed = [id for id in original_ids if id in members]
+            if ids[: len(stayed)] != stayed:
+                stayed = []
+            left.extend(
+                {"left_room_id": room.id, "left_player_id": id}
+                for id in set(original_ids).difference(stayed)
+            )
+            joined.extend((room.id, id) for id in ids[len(stayed) :])
+
+        if left:
+            connection.execute(
+                delete(orm.room_players).where(
+                    orm.room_players.c.room_id == bindparam("left_room_id"),
+                    orm.room_players.c.player_id == bindparam("left_player_id"),
+                ),
+                left,
+            )
+        if not joined:
+            return []
+
+        positions = connection.execute(
+            select(orm.room_players.c.room_id, func.max(orm.room_players.c.position))
+            .where(orm.room_players.c.room_id.in_({id for id, _ in joined}))
+            .group_by(orm.room_players.c.room_id)
+        )
+        last: dict[str, int] = {room_id: position for room_id, position in positions}
+        rows = []
+        for room_id, player_id in joined:
+            last[room_id] = position = last.get(room_id, -1) + 1
+            rows.append(
+                {"room_id": room_id, "player_id": player_id, "position": position}
+            )
+        return rows
+
+
+def _utc(value: datetime) -> datetime:
+    """
+    Convert time to UTC. SQLite does not keep time zones, times are always
+    stored in UTC and read back without one
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
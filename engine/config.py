@@ -1,5 +1,138 @@
 import os
+from typing import Optional
 
 
 def get_api_url() -> str:
     return os.getenv("API_URL", "http://localhost:8000")
+
+
+def get_database_uri() -> str:
+    return os.getenv("DATABASE_URI", "sqlite://")
+
+
+def get_ram_data_dir() -> Optional[str]:
+    """
+    Directory where the RAM backend keeps its snapshots and write-ahead log.
+    Nothing is persisted if it is not set
+    """
+    return os.getenv("RAM_DATA_DIR")
+
+
+def get_ram_snapshot_every() -> int:
+    return int(os.getenv("RAM_SNAPSHOT_EVERY", "100000"))
+
+
+def get_ram_fsync() -> bool:
+    return os.getenv("RAM_FSYNC", "0") == "1"
+
+
+def get_id_generator() -> str:
+    """
+    Generator of ids for new players, rooms, commands and events:
+    "ulid" for time-ordered ids or "uuid4" for random ones
+    """
+    return os.getenv("ID_GENERATOR", "ulid")
+
+
+def get_message_bus_lanes() -> int:
+    """
+    Lanes commands are partitioned into by their partition key. Commands of
+    the same partition run one after another, lanes run in parallel
+    """
+    return int(os.getenv("MESSAGE_BUS_LANES", "4"))
+
+
+def get_group_commit() -> bool:
+    """
+    Commit commands which arrive together in one transaction
+    """
+    return os.getenv("GROUP_COMMIT", "0") == "1"
+
+
+def get_group_commit_window() -> float:
+    """
+    Seconds a group of commands waits for more to arrive before it is handled
+    """
+    return float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0")) / 1000
+
+
+def get_group_commit_size() -> int:
+    return int(os.getenv("GROUP_COMMIT_SIZE", "64"))
+
+
+def get_max_queue_size() -> Optional[int]:
+    """
+    Maximum number of commands waiting to be handled, more are rejected.
+    Unbounded if set to 0
+    """
+    return int(os.getenv("MAX_QUEUE_SIZE", "10000")) or None
+
+
+def get_max_queue_wait() -> Optional[float]:
+    """
+    Seconds a command may wait to be handled before it is rejected.
+    Unbounded if set to 0
+    """
+    return float(os.getenv("MAX_QUEUE_WAIT_MS", "2000")) / 1000 or None
+
+
+def get_command_timeout() -> Optional[float]:
+    """
+    Seconds the API waits for a command to be handled, it is skipped if it
+    has not started by then. Unbounded if set to 0
+    """
+    return float(os.getenv("COMMAND_TIMEOUT_MS", "10000")) / 1000 or None
+
+
+def get_event_threads() -> int:
+    """
+    Threads handling events apart from commands, so that slow event handlers
+    do not delay commands. Events share threads with commands if set to 0
+    """
+    return int(os.getenv("EVENT_THREADS", "1"))
+
+
+def get_idempotency_cache_size() -> int:
+    """
+    Maximum number of idempotency keys results of commands are kept for
+    """
+    return int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+
+def get_idempotency_ttl() -> float:
+    """
+    Seconds a retried command with the same idempotency key gets the result
+    of the first one instead of being handled again
+    """
+    return float(os.getenv("IDEMPOTENCY_TTL_MS", "300000")) / 1000
+
+
+def get_room_subscriber_queue_size() -> int:
+    """
+    Maximum number of room events waiting to be sent to a subscriber,
+    subscribers falling further behind are disconnected
+    """
+    return int(os.getenv("ROOM_SUBSCRIBER_QUEUE_SIZE", "1000"))
+
+
+def get_room_subscriber_overflow() -> str:
+    """
+    What happens to a subscriber falling behind: "coalesce" sends it only
+    the latest event, which has the current room, "drop" disconnects it
+    """
+    return os.getenv("ROOM_SUBSCRIBER_OVERFLOW", "coalesce")
+
+
+def get_trace_sample_rate() -> float:
+    """
+    Share of requests traced, from 0 to 1. Tracing is off if set to 0
+    """
+    return float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+
+
+def get_trace_file() -> Optional[str]:
+    """
+    File spans of traced requests are appended to as JSON lines.
+    Tracing is off if it is not set
+    """
+    return os.getenv("TRACE_FILE")
@@ -6,4 +6,12 @@ def inject_dependencies(handler: callable, dependencies: dict[str, any]) -> call
     deps = {
         name: dependency for name, dependency in dependencies.items() if name in params
     }
+
+    if inspect.iscoroutinefunction(handler):
+
+        async def injected_coroutine(message):
+            return await handler(message, **deps)
+
+        return injected_coroutine
+
     return lambda message: handler(message, **deps)
@@ -1,13 +1,19 @@
-from typing import TYPE_CHECKING
+from collections import deque
+from typing import TYPE_CHECKING, Optional
 
 if TYPE_CHECKING:
     from domain.events import Event
 
 
 class BaseModel:
+    # Millions of instances are kept in memory, slots drop the per-instance dict
+    __slots__ = ("__id", "version", "__events")
+
     def __init__(self, id: str):
         self.__id = id
-        self.events: list[Event] = []
+        self.version: int = 0  # Number of commits, checked to detect conflicts
+        # Most instances never raise events, the queue is created on demand
+        self.__events: Optional[deque[Event]] = None
 
     @property
     def id(self) -> str:
@@ -18,3 +24,25 @@ class BaseModel:
             str: id
         """
         return self.__id
+
+    @property
+    def events(self) -> "deque[Event]":
+        """
+        Getter for events, created on first access
+
+        Returns:
+            deque[Event]: events raised by the instance and not collected yet
+        """
+        if self.__events is None:
+            self.__events = deque()
+        return self.__events
+
+    @property
+    def has_events(self) -> bool:
+        """
+        Check if instance has events to collect, without creating the queue
+
+        Returns:
+            bool: True if there are events
+        """
+        return bool(self.__events)
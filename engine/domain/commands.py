@@ -1,20 +1,48 @@
+import time
 from dataclasses import dataclass
-from typing import Any
-from uuid import uuid4
+from typing import Any, Optional
+
+from domain import ids, rooms
 
 
 class Command:
+    __slots__ = ("__id", "deadline", "trace", "idempotency_key")
+
     def __init__(self):
-        self.__id: str = str(uuid4())  # unique id of command
+        self.__id: str = ids.new_id()  # unique id of command
+        # time.monotonic() after which the command is not worth handling
+        self.deadline: Optional[float] = None
+        # service_player.tracing.TraceContext of the span which sent it
+        self.trace: Any = None
+        # Key given by the client, commands of the same type and key are
+        # handled once and retries get the same result
+        self.idempotency_key: Optional[str] = None
 
     @property
     def id(self) -> str:
         return self.__id
 
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+    @property
+    def partition_key(self) -> Optional[str]:
+        """
+        Commands with the same partition key are handled one after another,
+        in the order they were sent. None means the default partition
+
+        Returns:
+            Optional[str]: partition key
+        """
+        return None
+
 
 class CommandResult:
+    __slots__ = ("__id", "__command", "__result")
+
     def __init__(self, command: Command, result: Any = None):
-        self.__id: str = str(uuid4())  # unique id of command response
+        self.__id: str = ids.new_id()  # unique id of command response
         self.__command: Command = command  # command that was executed
         self.__result: Any = result  # result of command execution
 
@@ -33,24 +61,42 @@ class CommandResult:
 
 @dataclass
 class CreatePlayer(Command):
+    __slots__ = ("username",)
+
     username: str
 
     def __init__(self, username: str = ""):
         super().__init__()
         self.username = username
 
+    @property
+    def partition_key(self) -> Optional[str]:
+        return self.username
+
 
 @dataclass
 class CreateRoom(Command):
+    __slots__ = ("creator_id", "capacity")
+
     creator_id: str  # id of player who created the room
+    capacity: Optional[int]  # maximum number of players, including creator
 
-    def __init__(self, creator_id: str):
+    def __init__(
+        self, creator_id: str, capacity: Optional[int] = rooms.DEFAULT_CAPACITY
+    ):
         super().__init__()
         self.creator_id = creator_id
+        self.capacity = capacity
+
+    @property
+    def partition_key(self) -> Optional[str]:
+        return self.creator_id
 
 
 @dataclass
 class JoinRoom(Command):
+    __slots__ = ("room_id", "player_id")
+
     room_id: str
     player_id: str
 
@@ -59,9 +105,15 @@ class JoinRoom(Command):
         self.room_id = room_id
         self.player_id = player_id
 
+    @property
+    def partition_key(self) -> Optional[str]:
+        return self.room_id
+
 
 @dataclass
 class LeaveRoom(Command):
+    __slots__ = ("room_id", "player_id")
+
     room_id: str
     player_id: str
 
@@ -69,3 +121,28 @@ class LeaveRoom(Command):
         super().__init__()
         self.room_id = room_id
         self.player_id = player_id
+
+    @property
+    def partition_key(self) -> Optional[str]:
+        return self.room_id
+
+
+@dataclass
+class QuickJoin(Command):
+    __slots__ = ("player_id", "capacity")
+
+    player_id: str
+    capacity: Optional[int]  # capacity of room created if there is no room to join
+
+    def __init__(
+        self, player_id: str, capacity: Optional[int] = rooms.DEFAULT_CAPACITY
+    ):
+        super().__init__()
+        self.player_id = player_id
+        self.capacity = capacity
+
+    @property
+    def partition_key(self) -> Optional[str]:
+        # Quick joins compete for the same fullest room, running them one
+        # after another avoids conflicts between them
+        return "quick_join"
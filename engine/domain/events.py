@@ -1,12 +1,16 @@
 from dataclasses import dataclass
-from uuid import uuid4
+from typing import Any
 
-from domain import players, rooms
+from domain import ids, players, rooms
 
 
 class Event:
+    __slots__ = ("__id", "trace")
+
     def __init__(self):
-        self.__id: str = str(uuid4())  # unique id of event
+        self.__id: str = ids.new_id()  # unique id of event
+        # service_player.tracing.TraceContext of the span which raised it
+        self.trace: Any = None
 
     @property
     def id(self) -> str:
@@ -15,6 +19,8 @@ class Event:
 
 @dataclass
 class PlayerCreated(Event):
+    __slots__ = ("player",)
+
     player: players.Player
 
     def __init__(self, player: players.Player):
@@ -24,6 +30,8 @@ class PlayerCreated(Event):
 
 @dataclass
 class RoomCreated(Event):
+    __slots__ = ("room",)
+
     room: rooms.Room
 
     def __init__(self, room: rooms.Room):
@@ -33,6 +41,8 @@ class RoomCreated(Event):
 
 @dataclass
 class PlayerJoinedRoom(Event):
+    __slots__ = ("room", "player")
+
     room: rooms.Room
     player: players.Player
 
@@ -44,6 +54,8 @@ class PlayerJoinedRoom(Event):
 
 @dataclass
 class PlayerLeftRoom(Event):
+    __slots__ = ("room", "player")
+
     room: rooms.Room
     player: players.Player
 
@@ -6,15 +6,19 @@ from domain.base import BaseModel
 
 @dataclass
 class WebhookHandlerDescription:
+    __slots__ = ("url",)
+
     url: str
 
 
 @dataclass
 class RedisHandlerDescription:
-    pass
+    __slots__ = ()
 
 
 class GameDescription(BaseModel):
+    __slots__ = ("__name", "__description", "handler_description")
+
     def __init__(
         self,
         id: str,
@@ -49,6 +53,8 @@ class GameDescription(BaseModel):
 
 
 class Game(BaseModel):
+    __slots__ = ("__game_description_id", "__state")
+
     def __init__(self, id: str, game_description_id: str, state: Dict[str, Any]):
         super().__init__(id)
         self.__game_description_id = game_description_id
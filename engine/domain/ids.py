@@ -0,0 +1,118 @@
+import abc
+import itertools
+import os
+import time
+from typing import Tuple
+from uuid import uuid4
+
+# Crockford's base32, its order matches the order of ASCII codes,
+# so encoded ids sort the same way as the numbers they encode
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_PAIRS = [first + second for first in _ALPHABET for second in _ALPHABET]
+
+_TIME_BITS = 48
+_NODE_BITS = 40
+_COUNTER_BITS = 40
+_COUNTER_MASK = (1 << _COUNTER_BITS) - 1
+
+
+def _encode(value: int, length: int) -> str:
+    """
+    Encode number as base32 string of fixed length, two digits at a time
+
+    Args:
+        value (int): Number to encode
+        length (int): Even number of digits
+
+    Returns:
+        str: Encoded number, padded with zeros
+    """
+    return "".join(
+        [_PAIRS[(value >> shift) & 0x3FF] for shift in range(length * 5 - 10, -1, -10)]
+    )
+
+
+class IdGenerator(abc.ABC):
+    @abc.abstractmethod
+    def __call__(self) -> str:
+        """
+        Generate new unique id
+
+        Returns:
+            str: id
+        """
+        raise NotImplementedError
+
+
+class UlidGenerator(IdGenerator):
+    """
+    Time-ordered ids in ULID format: 26 characters, 48 bits of milliseconds
+    since epoch followed by 80 bits that keep ids unique.
+
+    Unlike ULID spec the 80 bits are not random for every id: they are a
+    random node number picked once per generator and a counter. Ids are
+    unique across processes, sort by creation time and are monotonic
+    within a thread, while generating one costs a clock read, an increment
+    and a few table lookups instead of a call to os.urandom
+    """
+
+    def __init__(self):
+        self._node: str = _encode(
+            int.from_bytes(os.urandom(_NODE_BITS // 8), "big"), _NODE_BITS // 5
+        )
+        # Counter starts at a random point too, `next` on count is atomic
+        self._counter = itertools.count(
+            int.from_bytes(os.urandom(_COUNTER_BITS // 8), "big") >> 1
+        )
+        self._prefix: Tuple[int, str] = (-1, "")  # Millisecond and its encoding
+
+    def __call__(self) -> str:
+        millisecond = time.time_ns() // 1_000_000
+        prefix = self._prefix
+        if prefix[0] != millisecond:
+            # Time takes 50 bits when encoded, two highest are always zero
+            prefix = (millisecond, _encode(millisecond, (_TIME_BITS + 2) // 5))
+            self._prefix = prefix
+
+        counter = next(self._counter) & _COUNTER_MASK
+        return (
+            prefix[1]
+            + self._node
+            + _PAIRS[counter >> 30]
+            + _PAIRS[(counter >> 20) & 0x3FF]
+            + _PAIRS[(counter >> 10) & 0x3FF]
+            + _PAIRS[counter & 0x3FF]
+        )
+
+
+class Uuid4Generator(IdGenerator):
+    """
+    Random ids, not ordered by time
+    """
+
+    def __call__(self) -> str:
+        return str(uuid4())
+
+
+_generator: IdGenerator = UlidGenerator()
+
+
+def new_id() -> str:
+    """
+    Generate new unique id with the current generator
+
+    Returns:
+        str: id
+    """
+    return _generator()
+
+
+def set_generator(generator: IdGenerator) -> None:
+    """
+    Replace generator used by `new_id`
+
+    Args:
+        generator (IdGenerator): New generator
+    """
+    global _generator
+    _generator = generator
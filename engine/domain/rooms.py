@@ -1,16 +1,33 @@
+from datetime import datetime, timezone
 from typing import List, Optional
 
 from domain.base import BaseModel
 from domain.players import Player
 
+DEFAULT_CAPACITY: Optional[int] = None  # No limit
+
 
 class Room(BaseModel):
+    __slots__ = ("__creator_id", "__players", "__capacity", "__created_at")
+
     def __init__(
-        self, id: str, creator: Player, players: Optional[List[Player]] = None
+        self,
+        id: str,
+        creator: Player,
+        players: Optional[List[Player]] = None,
+        capacity: Optional[int] = DEFAULT_CAPACITY,
+        created_at: Optional[datetime] = None,
     ):
         super().__init__(id)
         self.__creator_id = creator.id
-        self.__players = players or [creator]
+        # Player id -> player, dicts keep insertion order, so it is join order
+        self.__players: dict[str, Player] = {
+            player.id: player
+            for player in (players if players is not None else [creator])
+        }
+        # Maximum number of players, None if there is no limit
+        self.__capacity: Optional[int] = capacity
+        self.__created_at: datetime = created_at or datetime.now(timezone.utc)
 
     @property
     def creator_id(self) -> str:
@@ -28,9 +45,75 @@ class Room(BaseModel):
         Getter for players
 
         Returns:
-            list[Player]: players currently in the room
+            list[Player]: players currently in the room, in join order
+        """
+        return list(self.__players.values())
+
+    @property
+    def players_count(self) -> int:
+        """
+        Getter for players_count
+
+        Returns:
+            int: number of players currently in the room
+        """
+        return len(self.__players)
+
+    @property
+    def capacity(self) -> Optional[int]:
+        """
+        Getter for capacity
+
+        Returns:
+            Optional[int]: maximum number of players in the room, None if
+                there is no limit
+        """
+        return self.__capacity
+
+    @property
+    def free_slots(self) -> Optional[int]:
+        """
+        Getter for free_slots
+
+        Returns:
+            Optional[int]: number of players that can still join the room,
+                None if there is no limit
+        """
+        if self.__capacity is None:
+            return None
+        return max(self.__capacity - len(self.__players), 0)
+
+    @property
+    def is_full(self) -> bool:
+        """
+        Getter for is_full
+
+        Returns:
+            bool: True if no more players can join the room
+        """
+        return self.free_slots == 0
+
+    @property
+    def created_at(self) -> datetime:
+        """
+        Getter for created_at
+
+        Returns:
+            datetime: time the room was created at, in UTC
+        """
+        return self.__created_at
+
+    def has_player(self, player: Player) -> bool:
+        """
+        Check if player is in the room
+
+        Args:
+            player (players.Player): Player to check
+
+        Returns:
+            bool: True if player is in the room
         """
-        return self.__players
+        return player.id in self.__players
 
     def join(self, player: Player) -> None:
         """
@@ -39,7 +122,7 @@ class Room(BaseModel):
         Args:
             player (players.Player): The player to add to the room.
         """
-        self.__players.append(player)
+        self.__players[player.id] = player
 
     def leave(self, player: Player) -> None:
         """
@@ -48,4 +131,4 @@ class Room(BaseModel):
         Args:
             player (players.Player): Player to remove from the room
         """
-        self.__players.remove(player)
+        del self.__players[player.id]
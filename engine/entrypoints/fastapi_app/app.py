@@ -1,6 +1,22 @@
+import contextlib
+from typing import AsyncIterator
+
 from fastapi import FastAPI
 
 
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Close the unit of work of the message bus at shutdown, so the log of
+    RAM persistence is closed and a snapshot being written is finished
+    """
+    yield
+
+    from entrypoints.fastapi_app.deps import message_bus
+
+    message_bus.uow.close()
+
+
 def create_app() -> FastAPI:
     """
     Create FastAPI app
@@ -15,12 +31,16 @@ def create_app() -> FastAPI:
         rewrite_404_exception,
         rewrite_500_exception,
     )
+    from entrypoints.fastapi_app.metrics import router as metrics_router
+    from entrypoints.fastapi_app.middleware import TracingMiddleware
     from entrypoints.fastapi_app.v1.routers import router as api_v1_router
 
     logging.basicConfig(level=logging.DEBUG)
 
-    app = FastAPI(debug=True)
+    app = FastAPI(debug=True, lifespan=lifespan)
     app.include_router(api_v1_router)
+    app.include_router(metrics_router)
+    app.add_middleware(TracingMiddleware)
 
     app.add_exception_handler(404, rewrite_404_exception)
     app.add_exception_handler(500, rewrite_500_exception)
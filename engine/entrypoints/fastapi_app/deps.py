@@ -1,8 +1,50 @@
-from factories import create_message_bus, create_uow
-from service_player.messagebus import MessageBus
+from typing import cast
 
-message_bus = create_message_bus(create_uow("ram"))
+import config
+from domain import ids
+from entrypoints.fastapi_app.responses import RoomMessage
+from factories import (
+    create_id_generator,
+    create_message_bus,
+    create_tracer,
+    create_uow,
+)
+from service_player import subscriptions, tracing
+from service_player.messagebus import AsyncMessageBus
 
+ids.set_generator(create_id_generator(config.get_id_generator()))
+tracing.set_tracer(
+    create_tracer(config.get_trace_file(), config.get_trace_sample_rate())
+)
+room_subscriptions = subscriptions.RoomSubscriptions(
+    encode=RoomMessage.encode_event,
+    max_size=config.get_room_subscriber_queue_size(),
+    coalesce=config.get_room_subscriber_overflow() == "coalesce",
+)
+# Created asynchronous, the factory is typed for both kinds of bus
+message_bus = cast(
+    AsyncMessageBus,
+    create_message_bus(
+        create_uow("ram"),
+        asynchronous=True,
+        background_threads=config.get_message_bus_lanes(),
+        group_commit=config.get_group_commit(),
+        group_commit_window=config.get_group_commit_window(),
+        group_commit_size=config.get_group_commit_size(),
+        max_queue_size=config.get_max_queue_size(),
+        max_queue_wait=config.get_max_queue_wait(),
+        command_timeout=config.get_command_timeout(),
+        event_threads=config.get_event_threads(),
+        idempotency_cache_size=config.get_idempotency_cache_size(),
+        idempotency_ttl=config.get_idempotency_ttl(),
+        room_subscriptions=room_subscriptions,
+    ),
+)
 
-async def get_message_bus() -> MessageBus:
+
+async def get_message_bus() -> AsyncMessageBus:
     return message_bus
+
+
+async def get_room_subscriptions() -> subscriptions.RoomSubscriptions:
+    return room_subscriptions
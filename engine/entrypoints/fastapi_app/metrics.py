@@ -0,0 +1,25 @@
+from typing import Annotated
+
+from entrypoints.fastapi_app.deps import get_message_bus
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+from service_player import messagebus
+
+router = APIRouter(
+    tags=["metrics"],
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"  # Prometheus text format
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+) -> PlainTextResponse:
+    """
+    Metrics endpoint
+
+    It will return metrics of the message bus and repositories in the
+    Prometheus text format
+    """
+    return PlainTextResponse(message_bus.metrics.render(), media_type=CONTENT_TYPE)
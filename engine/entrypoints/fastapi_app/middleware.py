@@ -0,0 +1,34 @@
+from service_player import tracing
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class TracingMiddleware:
+    """
+    Record a root span for every HTTP request. Commands sent by routes join
+    its trace, so spans of the message bus are recorded under it. If the
+    request is not sampled, they carry NOT_SAMPLED and are not recorded
+
+    Args:
+        app (ASGIApp): Wrapped application
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app: ASGIApp = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        with tracing.span(f"{method} {path}", root=True, method=method) as span:
+            if span is None:  # Not sampled
+                await self.app(scope, receive, send)
+                return
+
+            async def send_traced(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.attributes["status_code"] = message["status"]
+                await send(message)
+
+            await self.app(scope, receive, send_traced)
@@ -0,0 +1,68 @@
+from typing import Annotated, List, Literal, Optional, Union
+
+from domain import commands, rooms
+from pydantic import BaseModel, Field
+
+
+class CreatePlayer(BaseModel):
+    """
+    Create player command model
+    """
+
+    type: Literal["CreatePlayer"]
+    username: str
+
+    def to_command(self) -> commands.CreatePlayer:
+        return commands.CreatePlayer(username=self.username)
+
+
+class CreateRoom(BaseModel):
+    """
+    Create room command model
+    """
+
+    type: Literal["CreateRoom"]
+    creator_id: str
+    capacity: Optional[int] = rooms.DEFAULT_CAPACITY
+
+    def to_command(self) -> commands.CreateRoom:
+        return commands.CreateRoom(creator_id=self.creator_id, capacity=self.capacity)
+
+
+class JoinRoom(BaseModel):
+    """
+    Join room command model
+    """
+
+    type: Literal["JoinRoom"]
+    room_id: str
+    player_id: str
+
+    def to_command(self) -> commands.JoinRoom:
+        return commands.JoinRoom(room_id=self.room_id, player_id=self.player_id)
+
+
+class LeaveRoom(BaseModel):
+    """
+    Leave room command model
+    """
+
+    type: Literal["LeaveRoom"]
+    room_id: str
+    player_id: str
+
+    def to_command(self) -> commands.LeaveRoom:
+        return commands.LeaveRoom(room_id=self.room_id, player_id=self.player_id)
+
+
+class BatchRequest(BaseModel):
+    """
+    Batch request model, commands are handled in order in one transaction
+    """
+
+    commands: List[
+        Annotated[
+            Union[CreatePlayer, CreateRoom, JoinRoom, LeaveRoom],
+            Field(discriminator="type"),
+        ]
+    ] = Field(min_length=1, max_length=1000)
@@ -1,5 +1,6 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional, Union
 
+from domain import events, rooms
 from pydantic import BaseModel
 
 
@@ -11,6 +12,27 @@ class Room(BaseModel):
     id: str
     creator_id: str
     players: List[str]
+    capacity: Optional[int]  # None if there is no limit
+    created_at: str  # ISO 8601, UTC
+
+    @classmethod
+    def from_domain(cls, room: rooms.Room) -> "Room":
+        return cls(
+            id=room.id,
+            creator_id=room.creator_id,
+            players=[player.id for player in room.players],
+            capacity=room.capacity,
+            created_at=room.created_at.isoformat(),
+        )
+
+
+class RoomsPage(BaseModel):
+    """
+    Page of rooms model
+    """
+
+    rooms: List[Room]
+    next_cursor: Optional[str]  # Pass as cursor to get the next page
 
 
 class Response(BaseModel):
@@ -43,9 +65,53 @@ class InternalErrorResponse(ErrorResponse):
     message: str = "Internal server error"
 
 
+class ServiceUnavailableResponse(ErrorResponse):
+    """
+    Response model for commands rejected by overloaded service
+    """
+
+    status_code: int = 503  # Internal status code
+    message: str = "Service overloaded"
+
+
 class GetRoomResponse(Response):
     """
     Response model for get room
     """
 
     data: Room
+
+
+class ListRoomsResponse(BaseModel):
+    """
+    Response model for list rooms
+    """
+
+    status_code: int  # Internal status code
+    success: bool
+    message: str
+    data: RoomsPage
+
+
+class RoomMessage(BaseModel):
+    """
+    Message pushed to subscribers of a room
+    """
+
+    type: str  # "snapshot", "PlayerJoinedRoom" or "PlayerLeftRoom"
+    sequence: int  # Number of the last event of room this message includes
+    version: int  # Number of commits of room
+    room: Room
+    player_id: Optional[str] = None  # Player who joined or left
+
+    @classmethod
+    def encode_event(
+        cls, sequence: int, event: Union[events.PlayerJoinedRoom, events.PlayerLeftRoom]
+    ) -> str:
+        return cls(
+            type=type(event).__name__,
+            sequence=sequence,
+            version=event.room.version,
+            room=Room.from_domain(event.room),
+            player_id=event.player.id,
+        ).model_dump_json()
@@ -0,0 +1,107 @@
+import logging
+from typing import Annotated, Any, Dict, Union
+
+from domain import players, rooms
+from entrypoints.fastapi_app.deps import get_message_bus
+from entrypoints.fastapi_app.requests import BatchRequest
+from entrypoints.fastapi_app.responses import (
+    ErrorResponse,
+    InternalErrorResponse,
+    Response,
+    ServiceUnavailableResponse,
+)
+from fastapi import APIRouter, Depends, status
+from fastapi.responses import JSONResponse
+from service_player import exceptions, messagebus
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/batch",
+    tags=["batch"],
+)
+
+# Status codes of failed commands, the same single command endpoints return
+ERROR_STATUS_CODES: Dict[type, int] = {
+    exceptions.InvalidPlayerUsername: status.HTTP_400_BAD_REQUEST,
+    exceptions.InvalidRoomCapacity: status.HTTP_400_BAD_REQUEST,
+    exceptions.PlayerDoesNotExist: status.HTTP_404_NOT_FOUND,
+    exceptions.RoomDoesNotExist: status.HTTP_404_NOT_FOUND,
+    exceptions.PlayerNotInRoom: status.HTTP_404_NOT_FOUND,
+    exceptions.PlayerAlreadyExists: status.HTTP_409_CONFLICT,
+    exceptions.RoomAlreadyExists: status.HTTP_409_CONFLICT,
+    exceptions.PlayerAlreadyInRoom: status.HTTP_409_CONFLICT,
+    exceptions.RoomIsFull: status.HTTP_409_CONFLICT,
+}
+
+
+def _describe(result: Any) -> Dict[str, Any]:
+    if isinstance(result, players.Player):
+        return {"id": result.id, "username": result.username}
+    if isinstance(result, rooms.Room):
+        return {"id": result.id, "creator_id": result.creator_id}
+    return {}
+
+
+@router.post("/", response_model=Response, status_code=status.HTTP_200_OK)
+async def handle_batch(
+    request: BatchRequest,
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+) -> Union[JSONResponse, Response]:
+    """
+    Batch endpoint
+
+    It will handle commands in order as a single transaction: either all of
+    them succeed, or none is applied and the first failure is returned
+    """
+    try:
+        results = await message_bus.handle_batch_async(
+            [command.to_command() for command in request.commands]
+        )
+
+        return JSONResponse(
+            content=Response(
+                message="Batch handled",
+                data={"results": [_describe(result) for result in results]},
+                status_code=status.HTTP_200_OK,
+                success=True,
+            ).model_dump(),
+            status_code=status.HTTP_200_OK,
+        )
+    except exceptions.BatchCommandFailed as e:
+        status_code = ERROR_STATUS_CODES.get(type(e.error))
+        if status_code is None:
+            logger.exception(e)
+            return JSONResponse(
+                content=InternalErrorResponse().model_dump(),
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                data={"index": e.index},
+                status_code=status_code,
+            ).model_dump(),
+            status_code=status_code,
+        )
+    except exceptions.MessageBusOverloaded as e:
+        return JSONResponse(
+            content=ServiceUnavailableResponse(message=str(e)).model_dump(),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except exceptions.DeadlineExceeded as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            ).model_dump(),
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
+    except Exception as e:
+        logger.exception(e)
+        return JSONResponse(
+            content=InternalErrorResponse().model_dump(),
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
@@ -1,15 +1,17 @@
 import logging
-import multiprocessing.pool
-from typing import Annotated, Union
+from typing import Annotated, List, Optional, Union
 
-from domain import commands, players
+from domain import commands, players, rooms
 from entrypoints.fastapi_app.deps import get_message_bus
 from entrypoints.fastapi_app.responses import (
     ErrorResponse,
+    GetRoomResponse,
     InternalErrorResponse,
     Response,
+    Room,
+    ServiceUnavailableResponse,
 )
-from fastapi import APIRouter, Depends, status
+from fastapi import APIRouter, Depends, Header, status
 from fastapi.responses import JSONResponse
 from service_player import exceptions, messagebus
 
@@ -24,18 +26,19 @@ router = APIRouter(
 @router.post("/", response_model=Response, status_code=status.HTTP_201_CREATED)
 async def create_player(
     username: str,
-    message_bus: Annotated[messagebus.MessageBus, Depends(get_message_bus)],
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+    idempotency_key: Optional[str] = Header(None),
 ) -> Union[JSONResponse, Response]:
     """
     Create player endpoint
 
-    It will create player with username
+    It will create player with username.
+    Retries with the same Idempotency-Key header get the first response
     """
     try:
-        async_result: multiprocessing.pool.ApplyResult = message_bus.handle(
-            commands.CreatePlayer(username=username)
-        )
-        player: players.Player = async_result.get()
+        command = commands.CreatePlayer(username=username)
+        command.idempotency_key = idempotency_key
+        player: players.Player = await message_bus.handle_async(command)
 
         return JSONResponse(
             content=Response(
@@ -57,6 +60,14 @@ async def create_player(
             ).model_dump(),
             status_code=status.HTTP_409_CONFLICT,
         )
+    except exceptions.IdempotencyKeyReused as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            ).model_dump(),
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
     except exceptions.InvalidPlayerUsername as e:
         return JSONResponse(
             content=ErrorResponse(
@@ -65,9 +76,70 @@ async def create_player(
             ).model_dump(),
             status_code=status.HTTP_400_BAD_REQUEST,
         )
+    except exceptions.MessageBusOverloaded as e:
+        return JSONResponse(
+            content=ServiceUnavailableResponse(message=str(e)).model_dump(),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except exceptions.DeadlineExceeded as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            ).model_dump(),
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
     except Exception as e:
         logger.exception(e)
         return JSONResponse(
             content=InternalErrorResponse().model_dump(),
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
+
+
+@router.get(
+    "/{player_id}/room",
+    response_model=Response,
+    status_code=status.HTTP_200_OK,
+)
+async def get_player_room(
+    player_id: str,
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+) -> Union[JSONResponse, Response]:
+    """
+    Get player room endpoint
+
+    It will return room which player with player_id is currently in
+    """
+    player: Optional[players.Player] = message_bus.uow.players.get(id=player_id)
+
+    if player is None:
+        return JSONResponse(
+            content=ErrorResponse(
+                message="Player does not exist",
+                status_code=status.HTTP_404_NOT_FOUND,
+            ).model_dump(),
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+
+    found: List[rooms.Room] = message_bus.uow.rooms.find("player_id", player_id)
+
+    if not found:
+        return JSONResponse(
+            content=ErrorResponse(
+                message="Player is not in a room",
+                status_code=status.HTTP_404_NOT_FOUND,
+            ).model_dump(),
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+
+    return JSONResponse(
+        content=GetRoomResponse(
+            message="Room found",
+            data=Room.from_domain(found[0]),
+            status_code=status.HTTP_200_OK,
+            success=True,
+        ).model_dump(),
+        status_code=status.HTTP_200_OK,
+    )
@@ -1,19 +1,35 @@
+import asyncio
+import base64
+import binascii
 import logging
-import multiprocessing.pool
-from typing import Annotated, List, Union
+from datetime import datetime, timezone
+from typing import Annotated, Optional, Union
 
 from domain import commands, rooms
-from entrypoints.fastapi_app.deps import get_message_bus
+from domain.rooms import DEFAULT_CAPACITY
+from entrypoints.fastapi_app.deps import get_message_bus, get_room_subscriptions
 from entrypoints.fastapi_app.responses import (
     ErrorResponse,
     GetRoomResponse,
     InternalErrorResponse,
+    ListRoomsResponse,
     Response,
     Room,
+    RoomMessage,
+    RoomsPage,
+    ServiceUnavailableResponse,
+)
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    Query,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
 )
-from fastapi import APIRouter, Depends, status
 from fastapi.responses import JSONResponse
-from service_player import exceptions, messagebus
+from service_player import exceptions, messagebus, subscriptions, views
 
 logger = logging.getLogger(__name__)
 
@@ -23,21 +39,105 @@ router = APIRouter(
 )
 
 
+def _encode_cursor(cursor: views.RoomsCursor) -> str:
+    created_at, room_id = cursor
+    return base64.urlsafe_b64encode(
+        f"{created_at.isoformat()}|{room_id}".encode()
+    ).decode()
+
+
+def _decode_cursor(cursor: str) -> views.RoomsCursor:
+    """
+    Raises:
+        ValueError: If cursor is malformed
+    """
+    try:
+        created_at, room_id = (
+            base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        )
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    return _utc(datetime.fromisoformat(created_at)), room_id
+
+
+def _utc(value: datetime) -> datetime:
+    """
+    Convert time to UTC, times without a time zone are taken as UTC
+    """
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+@router.get("/", response_model=Response, status_code=status.HTTP_200_OK)
+async def list_rooms(
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+    free_slots: bool = False,
+    creator_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+) -> Union[JSONResponse, Response]:
+    """
+    List rooms endpoint
+
+    It will return a page of rooms ordered by creation time, optionally only
+    ones with free slots, created by player with creator_id or created at or
+    after created_after. Pass next_cursor of a page as cursor to get the next
+    """
+    try:
+        after = _decode_cursor(cursor) if cursor is not None else None
+    except ValueError:
+        return JSONResponse(
+            content=ErrorResponse(
+                message="Invalid cursor",
+                status_code=status.HTTP_400_BAD_REQUEST,
+            ).model_dump(),
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+
+    if created_after is not None:
+        created_after = _utc(created_after)
+
+    found, next_cursor = views.list_rooms(
+        message_bus.uow,
+        limit=limit,
+        free_slots=free_slots,
+        creator_id=creator_id,
+        created_after=created_after,
+        after=after,
+    )
+
+    return JSONResponse(
+        content=ListRoomsResponse(
+            message="Rooms found",
+            data=RoomsPage(
+                rooms=[Room.from_domain(room) for room in found],
+                next_cursor=_encode_cursor(next_cursor) if next_cursor else None,
+            ),
+            status_code=status.HTTP_200_OK,
+            success=True,
+        ).model_dump(),
+        status_code=status.HTTP_200_OK,
+    )
+
+
 @router.post("/", response_model=Response, status_code=status.HTTP_201_CREATED)
 async def create_room(
     creator_id: str,
-    message_bus: Annotated[messagebus.MessageBus, Depends(get_message_bus)],
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+    capacity: Optional[int] = DEFAULT_CAPACITY,
 ) -> Union[JSONResponse, Response]:
     """
     Create room endpoint
 
-    It will create room with creator as player with creator_id
+    It will create room with creator as player with creator_id,
+    which up to capacity players can join, any number if it is not given
     """
     try:
-        async_result: multiprocessing.pool.AsyncResult = message_bus.handle(
-            commands.CreateRoom(creator_id=creator_id)
+        room: rooms.Room = await message_bus.handle_async(
+            commands.CreateRoom(creator_id=creator_id, capacity=capacity)
         )
-        room: rooms.Room = async_result.get()
 
         return JSONResponse(
             content=Response(
@@ -59,6 +159,14 @@ async def create_room(
             ).model_dump(),
             status_code=status.HTTP_409_CONFLICT,
         )
+    except exceptions.InvalidRoomCapacity as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_400_BAD_REQUEST,
+            ).model_dump(),
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
     except exceptions.PlayerDoesNotExist as e:
         return JSONResponse(
             content=ErrorResponse(
@@ -67,6 +175,28 @@ async def create_room(
             ).model_dump(),
             status_code=status.HTTP_404_NOT_FOUND,
         )
+    except exceptions.PlayerAlreadyInRoom as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_409_CONFLICT,
+            ).model_dump(),
+            status_code=status.HTTP_409_CONFLICT,
+        )
+    except exceptions.MessageBusOverloaded as e:
+        return JSONResponse(
+            content=ServiceUnavailableResponse(message=str(e)).model_dump(),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except exceptions.DeadlineExceeded as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            ).model_dump(),
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
     except Exception as e:
         logger.exception(e)
         return JSONResponse(
@@ -86,18 +216,19 @@ async def create_room(
 async def join_room(
     room_id: str,
     player_id: str,
-    message_bus: Annotated[messagebus.MessageBus, Depends(get_message_bus)],
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+    idempotency_key: Optional[str] = Header(None),
 ) -> Union[JSONResponse, Response]:
     """
     Join room endpoint
 
-    It will add player with player_id to room with room_id
+    It will add player with player_id to room with room_id.
+    Retries with the same Idempotency-Key header get the first response
     """
     try:
-        async_result: multiprocessing.pool.AsyncResult = message_bus.handle(
-            commands.JoinRoom(room_id=room_id, player_id=player_id)
-        )
-        room: rooms.Room = async_result.get()
+        command = commands.JoinRoom(room_id=room_id, player_id=player_id)
+        command.idempotency_key = idempotency_key
+        room: rooms.Room = await message_bus.handle_async(command)
 
         return JSONResponse(
             content=Response(
@@ -135,6 +266,116 @@ async def join_room(
             ).model_dump(),
             status_code=status.HTTP_409_CONFLICT,
         )
+    except exceptions.RoomIsFull as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_409_CONFLICT,
+            ).model_dump(),
+            status_code=status.HTTP_409_CONFLICT,
+        )
+    except exceptions.IdempotencyKeyReused as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            ).model_dump(),
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    except exceptions.MessageBusOverloaded as e:
+        return JSONResponse(
+            content=ServiceUnavailableResponse(message=str(e)).model_dump(),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except exceptions.DeadlineExceeded as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            ).model_dump(),
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
+    except Exception as e:
+        logger.exception(e)
+        return JSONResponse(
+            content=InternalErrorResponse().model_dump(),
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+        )
+
+
+@router.post(
+    "/quick-join",
+    response_model=Response,
+    status_code=status.HTTP_200_OK,
+)
+async def quick_join(
+    player_id: str,
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+    capacity: Optional[int] = DEFAULT_CAPACITY,
+) -> Union[JSONResponse, Response]:
+    """
+    Quick join endpoint
+
+    It will add player with player_id to the fullest room which is not full,
+    or create a room for up to capacity players if there is none. Rooms
+    without capacity are never full
+    """
+    try:
+        room: rooms.Room = await message_bus.handle_async(
+            commands.QuickJoin(player_id=player_id, capacity=capacity)
+        )
+
+        return JSONResponse(
+            content=Response(
+                message="Player joined room",
+                data={
+                    "id": room.id,
+                    "creator_id": room.creator_id,
+                },
+                status_code=status.HTTP_200_OK,
+                success=True,
+            ).model_dump(),
+            status_code=status.HTTP_200_OK,
+        )
+    except exceptions.PlayerDoesNotExist as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_404_NOT_FOUND,
+            ).model_dump(),
+            status_code=status.HTTP_404_NOT_FOUND,
+        )
+    except (exceptions.PlayerAlreadyInRoom, exceptions.RoomAlreadyExists) as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_409_CONFLICT,
+            ).model_dump(),
+            status_code=status.HTTP_409_CONFLICT,
+        )
+    except exceptions.InvalidRoomCapacity as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_400_BAD_REQUEST,
+            ).model_dump(),
+            status_code=status.HTTP_400_BAD_REQUEST,
+        )
+    except exceptions.MessageBusOverloaded as e:
+        return JSONResponse(
+            content=ServiceUnavailableResponse(message=str(e)).model_dump(),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except exceptions.DeadlineExceeded as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            ).model_dump(),
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
     except Exception as e:
         logger.exception(e)
         return JSONResponse(
@@ -150,7 +391,7 @@ async def join_room(
 )
 async def get_room(
     room_id: str,
-    message_bus: Annotated[messagebus.MessageBus, Depends(get_message_bus)],
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
 ) -> Union[JSONResponse, Response]:
     """
     Get room endpoint
@@ -168,16 +409,10 @@ async def get_room(
             status_code=status.HTTP_404_NOT_FOUND,
         )
 
-    players: List[str] = [player.id for player in room.players]
-
     return JSONResponse(
         content=GetRoomResponse(
             message="Room found",
-            data=Room(
-                id=room.id,
-                creator_id=room.creator_id,
-                players=players,
-            ),
+            data=Room.from_domain(room),
             status_code=status.HTTP_200_OK,
             success=True,
         ).model_dump(),
@@ -193,7 +428,7 @@ async def get_room(
 async def leave_room(
     room_id: str,
     player_id: str,
-    message_bus: Annotated[messagebus.MessageBus, Depends(get_message_bus)],
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
 ) -> Union[JSONResponse, Response]:
     """
     Leave room endpoint
@@ -201,10 +436,9 @@ async def leave_room(
     It will remove player with player_id from room with room_id
     """
     try:
-        async_result: multiprocessing.pool.AsyncResult = message_bus.handle(
+        room: rooms.Room = await message_bus.handle_async(
             commands.LeaveRoom(room_id=room_id, player_id=player_id)
         )
-        room: rooms.Room = async_result.get()
 
         return JSONResponse(
             content=Response(
@@ -242,9 +476,85 @@ async def leave_room(
             ).model_dump(),
             status_code=status.HTTP_404_NOT_FOUND,
         )
+    except exceptions.MessageBusOverloaded as e:
+        return JSONResponse(
+            content=ServiceUnavailableResponse(message=str(e)).model_dump(),
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except exceptions.DeadlineExceeded as e:
+        return JSONResponse(
+            content=ErrorResponse(
+                message=str(e),
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            ).model_dump(),
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
     except Exception as e:
         logger.exception(e)
         return JSONResponse(
             content=InternalErrorResponse().model_dump(),
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         )
+
+
+@router.websocket("/{room_id}/events")
+async def room_events(
+    websocket: WebSocket,
+    room_id: str,
+    message_bus: Annotated[messagebus.AsyncMessageBus, Depends(get_message_bus)],
+    room_subscriptions: Annotated[
+        subscriptions.RoomSubscriptions, Depends(get_room_subscriptions)
+    ],
+) -> None:
+    """
+    Room events endpoint
+
+    It will send a snapshot of room with room_id, then a message for every
+    player who joins or leaves it. Events already included in the snapshot
+    are skipped, later ones have consecutive sequence numbers. A client
+    which falls behind gets only the latest message, with the current room,
+    or is disconnected with code 1013 and should reconnect
+    """
+    subscription = room_subscriptions.subscribe(room_id)
+    try:
+        room: Optional[rooms.Room] = message_bus.uow.rooms.get(id=room_id)
+        if room is None:
+            await websocket.close(
+                code=status.WS_1008_POLICY_VIOLATION, reason="Room does not exist"
+            )
+            return
+
+        await websocket.accept()
+        await websocket.send_text(
+            RoomMessage(
+                type="snapshot",
+                sequence=subscription.sequence,
+                version=room.version,
+                room=Room.from_domain(room),
+            ).model_dump_json()
+        )
+
+        async def wait_for_disconnect() -> None:
+            # Clients do not send anything, the only message is disconnect
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+            subscription.close()
+
+        receiver = asyncio.ensure_future(wait_for_disconnect())
+        try:
+            while (published := await subscription.get()) is not None:
+                _, version, message = published
+                if version <= room.version:  # Already in snapshot
+                    continue
+                # Encoded once for all subscribers, see RoomMessage.encode_event
+                await websocket.send_text(message)
+        finally:
+            receiver.cancel()
+
+        if subscription.overflowed:
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        room_subscriptions.unsubscribe(subscription)
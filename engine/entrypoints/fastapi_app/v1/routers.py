@@ -1,3 +1,4 @@
+from entrypoints.fastapi_app.v1.batch import router as batch_router
 from entrypoints.fastapi_app.v1.players import router as players_router
 from entrypoints.fastapi_app.v1.rooms import router as rooms_router
 from fastapi import APIRouter
@@ -12,3 +13,4 @@ router = APIRouter(
 
 router.include_router(players_router)
 router.include_router(rooms_router)
+router.include_router(batch_router)
@@ -1,9 +1,56 @@
-from typing import Callable, List, Literal
+from typing import Callable, List, Literal, Optional
 
+import config
 import di
-from adapters import repository
-from domain import commands, events
-from service_player import handlers, messagebus, unit_of_work
+from adapters import orm, persistence, repository
+from domain import commands, events, ids
+from service_player import (
+    handlers,
+    messagebus,
+    subscriptions,
+    tracing,
+    unit_of_work,
+)
+
+
+def create_id_generator(type: str) -> ids.IdGenerator:
+    """
+    Create id generator
+
+    Args:
+        type (str): Type of generator, "ulid" or "uuid4" as configured
+
+    Raises:
+        ValueError: If type is unknown
+
+    Returns:
+        ids.IdGenerator: Id generator
+    """
+    if type == "ulid":
+        return ids.UlidGenerator()
+
+    elif type == "uuid4":
+        return ids.Uuid4Generator()
+
+    raise ValueError("Unknown type of id generator")
+
+
+def create_tracer(trace_file: Optional[str], sample_rate: float) -> tracing.Tracer:
+    """
+    Create tracer
+
+    Args:
+        trace_file (Optional[str]): File spans are appended to as JSON lines,
+            nothing is traced if None
+        sample_rate (float): Share of traces recorded, from 0 to 1
+
+    Returns:
+        tracing.Tracer: Tracer
+    """
+    if trace_file is None:
+        return tracing.Tracer(tracing.NullExporter(), sample_rate=0.0)
+
+    return tracing.Tracer(tracing.JsonFileExporter(trace_file), sample_rate)
 
 
 def create_players_repository(
@@ -16,7 +63,6 @@ def create_players_repository(
         type (Literal["ram", "sql"]): Type of repository
 
     Raises:
-        NotImplementedError: If type is not implemented
         ValueError: If type is unknown
 
     Returns:
@@ -26,7 +72,9 @@ def create_players_repository(
         return repository.RamPlayerRepository()
 
     elif type == "sql":
-        raise NotImplementedError
+        return repository.SqlPlayerRepository(
+            orm.get_engine(config.get_database_uri())
+        )
 
     raise ValueError("Unknown type of repository")
 
@@ -47,7 +95,7 @@ def create_rooms_repository(
         return repository.RamRoomRepository()
 
     elif type == "sql":
-        raise NotImplementedError
+        return repository.SqlRoomRepository(orm.get_engine(config.get_database_uri()))
 
     raise ValueError("Unknown type of repository")
 
@@ -60,19 +108,33 @@ def create_uow(type: Literal["ram", "sql"]) -> unit_of_work.AbstractUnitOfWork:
         type (Literal["ram", "sql"]): Type of unit of work
 
     Raises:
-        NotImplementedError: If type is not implemented
         ValueError: If type is unknown
 
     Returns:
         unit_of_work.AbstractUnitOfWork: Unit of work
     """
     if type == "ram":
-        return unit_of_work.RamUnitOfWork(
+        uow = unit_of_work.RamUnitOfWork(
             create_players_repository("ram"), create_rooms_repository("ram")
         )
 
+        if data_dir := config.get_ram_data_dir():
+            uow.persistence = persistence.RamPersistence(
+                data_dir,
+                snapshot_every=config.get_ram_snapshot_every(),
+                fsync=config.get_ram_fsync(),
+            )
+            uow.persistence.recover(uow.players, uow.rooms)
+
+        return uow
+
     elif type == "sql":
-        raise NotImplementedError
+        engine = orm.get_engine(config.get_database_uri())
+        return unit_of_work.SqlUnitOfWork(
+            engine,
+            repository.SqlPlayerRepository(engine),
+            repository.SqlRoomRepository(engine),
+        )
 
     raise ValueError("Unknown type of unit of work")
 
@@ -81,19 +143,55 @@ def create_message_bus(
     uow: unit_of_work.AbstractUnitOfWork,
     event_handlers: dict[events.Event, List[Callable]] = handlers.EVENT_HANDLERS,
     command_handlers: dict[commands.Command, Callable] = handlers.COMMAND_HANDLERS,
+    asynchronous: bool = False,
+    background_threads: int = 1,
+    group_commit: bool = False,
+    group_commit_window: float = 0.0,
+    group_commit_size: int = 64,
+    max_queue_size: Optional[int] = None,
+    max_queue_wait: Optional[float] = None,
+    command_timeout: Optional[float] = None,
+    event_threads: int = 0,
+    idempotency_cache_size: int = 10000,
+    idempotency_ttl: float = 300.0,
+    room_subscriptions: Optional[subscriptions.RoomSubscriptions] = None,
 ) -> messagebus.MessageBus:
     """
     Create message bus
 
     Args:
         uow (unit_of_work.AbstractUnitOfWork): Unit of work
+        asynchronous (bool): Create AsyncMessageBus, which `handle_async`
+            returns an awaitable
+        background_threads (int): Number of lanes commands are partitioned into
+        group_commit (bool): Commit commands waiting in a lane together
+        group_commit_window (float): Seconds a lane waits for a group to fill
+        group_commit_size (int): Maximum number of commands in a group
+        max_queue_size (Optional[int]): Maximum number of commands waiting to
+            be handled, unbounded if None
+        max_queue_wait (Optional[float]): Seconds a command may wait to be
+            handled, unbounded if None
+        command_timeout (Optional[float]): Seconds after which commands sent
+            without a deadline are not worth handling, never if None
+        event_threads (int): Number of lanes for events, if 0 events are
+            handled in lanes of commands which raised them
+        idempotency_cache_size (int): Maximum number of idempotency keys
+            results are kept for
+        idempotency_ttl (float): Seconds results of commands with an
+            idempotency key are kept for
+        room_subscriptions (Optional[subscriptions.RoomSubscriptions]):
+            Subscribers pushed events of rooms, a new hub if None
 
     Returns:
         messagebus.MessageBus: Message bus
     """
 
+    if room_subscriptions is None:
+        room_subscriptions = subscriptions.RoomSubscriptions()
+
     dependencies = {
         "uow": uow,
+        "room_subscriptions": room_subscriptions,
     }
 
     injected_command_handlers = {
@@ -107,8 +205,19 @@ def create_message_bus(
         for event, handlers_list in event_handlers.items()
     }
 
-    return messagebus.MessageBus(
+    bus_class = messagebus.AsyncMessageBus if asynchronous else messagebus.MessageBus
+    return bus_class(
         uow=uow,
         event_handlers=injected_event_handlers,
         command_handlers=injected_command_handlers,
+        background_threads=background_threads,
+        group_commit=group_commit,
+        group_commit_window=group_commit_window,
+        group_commit_size=group_commit_size,
+        max_queue_size=max_queue_size,
+        max_queue_wait=max_queue_wait,
+        command_timeout=command_timeout,
+        event_threads=event_threads,
+        idempotency_cache_size=idempotency_cache_size,
+        idempotency_ttl=idempotency_ttl,
     )
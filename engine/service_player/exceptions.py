@@ -2,6 +2,13 @@ class InternalException(Exception):
     pass
 
 
+class ConcurrencyConflict(InternalException):
+    """
+    Raised on commit if another transaction committed changes to the same
+    aggregate first. The message bus retries commands failed with it
+    """
+
+
 class PlayerAlreadyExists(InternalException):
     pass
 
@@ -28,3 +35,60 @@ class PlayerAlreadyInRoom(InternalException):
 
 class PlayerNotInRoom(InternalException):
     pass
+
+
+class RoomIsFull(InternalException):
+    pass
+
+
+class InvalidRoomCapacity(InternalException):
+    pass
+
+
+class BatchCommandFailed(InternalException):
+    """
+    Raised when a command of a batch fails. Nothing of the batch is committed
+    """
+
+    def __init__(self, index: int, error: Exception):
+        super().__init__(f"Command {index} of batch failed: {error}")
+        self.index: int = index  # Position of failed command in batch
+        self.error: Exception = error
+
+
+class IdempotencyKeyReused(InternalException):
+    """
+    Raised if an idempotency key is sent again with a command which is not
+    the same as the one the key was first used with
+    """
+
+
+class MessageBusOverloaded(InternalException):
+    """
+    Raised when a command is rejected because the message bus has more work
+    queued than it can handle in time. Clients should retry after
+    `retry_after` seconds
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after: int = retry_after
+
+
+class QueueFull(MessageBusOverloaded):
+    """
+    Raised on submit if the queue of commands is full
+    """
+
+
+class QueueWaitExpired(MessageBusOverloaded):
+    """
+    Raised instead of handling a command which waited in the queue too long
+    """
+
+
+class DeadlineExceeded(InternalException):
+    """
+    Raised if a command was not handled before its deadline: either the
+    message bus skipped it, or the caller stopped waiting for its result
+    """
@@ -1,8 +1,8 @@
 import logging
-from uuid import uuid4
+from typing import Optional
 
-from domain import commands, events, players, rooms
-from service_player import exceptions, unit_of_work
+from domain import commands, events, ids, players, rooms
+from service_player import exceptions, subscriptions, unit_of_work
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +26,7 @@ def create_player(
                 f"Player with username {command.username} already exists"
             )
 
-        player = players.Player(id=str(uuid4()), username=command.username)
+        player = players.Player(id=ids.new_id(), username=command.username)
         player.events.append(
             events.PlayerCreated(player=player)
         )  # TODO: Create event collector
@@ -59,6 +59,9 @@ def create_room(
         command (commands.CreateRoom): Create room command
         uow (unit_of_work.AbstractUnitOfWork): Unit of work
     """
+    if command.capacity is not None and command.capacity < 1:
+        raise exceptions.InvalidRoomCapacity("Room capacity must be at least 1")
+
     with uow:
         player: players.Player = uow.players.get(id=command.creator_id)
         if not player:
@@ -71,7 +74,13 @@ def create_room(
                 f"Room with creator id {command.creator_id} already exists"
             )
 
-        room = rooms.Room(id=str(uuid4()), creator=player)
+        if current := uow.rooms.find("player_id", player.id):
+            raise exceptions.PlayerAlreadyInRoom(
+                f"Player with id {player.id} is \
+already in room with id {current[0].id}"
+            )
+
+        room = rooms.Room(id=ids.new_id(), creator=player, capacity=command.capacity)
         room.events.append(events.RoomCreated(room=room))
         uow.rooms.add(room)
         uow.commit()
@@ -102,12 +111,21 @@ def join_room(
                 f"Player with id {command.player_id} does not exist"
             )
 
-        if player in room.players:
+        if room.has_player(player):
             raise exceptions.PlayerAlreadyInRoom(
                 f"Player with id {command.player_id} is \
 already in room with id {command.room_id}"
             )
 
+        if current := uow.rooms.find("player_id", player.id):
+            raise exceptions.PlayerAlreadyInRoom(
+                f"Player with id {command.player_id} is \
+already in room with id {current[0].id}"
+            )
+
+        if room.is_full:
+            raise exceptions.RoomIsFull(f"Room with id {command.room_id} is full")
+
         room.join(player)
 
         room.events.append(events.PlayerJoinedRoom(room=room, player=player))
@@ -139,7 +157,7 @@ def leave_room(
                 f"Player with id {command.player_id} does not exist"
             )
 
-        if player not in room.players:
+        if not room.has_player(player):
             raise exceptions.PlayerNotInRoom(
                 f"Player with id {command.player_id} is not \
 in room with id {command.room_id}"
@@ -153,15 +171,80 @@ in room with id {command.room_id}"
         return room
 
 
+def quick_join(
+    command: commands.QuickJoin, uow: unit_of_work.AbstractUnitOfWork
+) -> rooms.Room:
+    """
+    Join the fullest room which is not full, or create one if there is none
+
+    Args:
+        command (commands.QuickJoin): Quick join command
+        uow (unit_of_work.AbstractUnitOfWork): Unit of work
+    """
+    if command.capacity is not None and command.capacity < 1:
+        raise exceptions.InvalidRoomCapacity("Room capacity must be at least 1")
+
+    with uow:
+        player: Optional[players.Player] = uow.players.get(id=command.player_id)
+        if player is None:
+            raise exceptions.PlayerDoesNotExist(
+                f"Player with id {command.player_id} does not exist"
+            )
+
+        if current := uow.rooms.find("player_id", player.id):
+            raise exceptions.PlayerAlreadyInRoom(
+                f"Player with id {command.player_id} is \
+already in room with id {current[0].id}"
+            )
+
+        # Fewest free slots first, rooms without limit last, oldest room among
+        # equally full ones
+        found = uow.rooms.find_range("open_free_slots", limit=1)
+        if found:
+            room = found[0]
+            room.join(player)
+            room.events.append(events.PlayerJoinedRoom(room=room, player=player))
+        else:
+            if uow.rooms.get(creator_id=player.id):
+                raise exceptions.RoomAlreadyExists(
+                    f"Room with creator id {player.id} already exists"
+                )
+
+            room = rooms.Room(
+                id=ids.new_id(), creator=player, capacity=command.capacity
+            )
+            room.events.append(events.RoomCreated(room=room))
+            uow.rooms.add(room)
+
+        uow.commit()
+
+        return room
+
+
+def room_event_handler(
+    event: subscriptions.RoomEvent,
+    room_subscriptions: subscriptions.RoomSubscriptions,
+) -> None:
+    """
+    Push player joined or left room event to subscribers of the room
+
+    Args:
+        event (subscriptions.RoomEvent): Player joined or left room event
+        room_subscriptions (subscriptions.RoomSubscriptions): Subscribers
+    """
+    room_subscriptions.publish(event)
+
+
 EVENT_HANDLERS = {
     events.PlayerCreated: [player_created_event_handler],
     events.RoomCreated: [],
-    events.PlayerJoinedRoom: [],
-    events.PlayerLeftRoom: [],
+    events.PlayerJoinedRoom: [room_event_handler],
+    events.PlayerLeftRoom: [room_event_handler],
 }
 COMMAND_HANDLERS = {
     commands.CreatePlayer: create_player,
     commands.CreateRoom: create_room,
     commands.JoinRoom: join_room,
     commands.LeaveRoom: leave_room,
+    commands.QuickJoin: quick_join,
 }
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Tuple
+
+from service_player import exceptions
+
+
+class ResultCache:
+    """
+    Results of recent commands by idempotency key, of both running and
+    finished commands, so that a retried command gets the result of the
+    first one instead of running again.
+
+    Holds at most `max_size` results, the least recently used are evicted
+    first. Finished results expire `ttl` seconds after they were finished,
+    running ones only when evicted. A key is bound to the fingerprint of
+    the command it was first used with, reusing it for another command is
+    an error.
+
+    Args:
+        max_size (int): Maximum number of results
+        ttl (float): Seconds finished results are kept for
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        # key -> [result, time.monotonic() it expires at, None while running,
+        #         fingerprint]
+        self._results: OrderedDict[Hashable, List[Any]] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def get_or_add(
+        self,
+        key: Hashable,
+        factory: Callable[[], Any],
+        fingerprint: Hashable = None,
+    ) -> Tuple[Any, bool]:
+        """
+        Get result for key, or add a new running one made by factory
+
+        Args:
+            key (Hashable): Idempotency key
+            factory (Callable[[], Any]): Makes the result of a new command
+            fingerprint (Hashable): Payload of command, must be the same as
+                the one of the command which added the result
+
+        Raises:
+            exceptions.IdempotencyKeyReused: If key was used with another
+                fingerprint
+
+        Returns:
+            Tuple[Any, bool]: Result and whether it was added
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                expires = entry[1]
+                if expires is None or time.monotonic() <= expires:
+                    if entry[2] != fingerprint:
+                        raise exceptions.IdempotencyKeyReused(
+                            "Idempotency key was used with another request"
+                        )
+                    self._results.move_to_end(key)
+                    return entry[0], False
+
+            result = factory()
+            self._results[key] = [result, None, fingerprint]
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+        return result, True
+
+    def finish(self, key: Hashable, result: Any) -> None:
+        """
+        Start expiry of a finished result, unless it was evicted already
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and entry[0] is result:
+                entry[1] = time.monotonic() + self.ttl
+
+    def discard(self, key: Hashable, result: Optional[Any] = None) -> None:
+        """
+        Forget result for key, only if it is result when given
+        """
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None and (result is None or entry[0] is result):
+                del self._results[key]
@@ -1,11 +1,29 @@
 from __future__ import annotations
 
+import asyncio
+import contextlib
+import dataclasses
 import logging
+import multiprocessing
 import multiprocessing.pool
-from typing import TYPE_CHECKING, Any, Callable, List, Union
+import threading
+import time
+from collections import deque
+from itertools import chain
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeGuard,
+    Union,
+)
 
 from domain import commands, events
-from service_player import exceptions
+from service_player import exceptions, idempotency, metrics, tracing
 
 if TYPE_CHECKING:
     from . import unit_of_work
@@ -15,20 +33,220 @@ logger = logging.getLogger(__name__)
 Message = Union[commands.Command, events.Event]
 
 
+def _attribute(source: Any, name: str) -> Callable[[], Dict[metrics.Labels, float]]:
+    """
+    Values of a metric kept as attribute of source, e.g. a counter
+    """
+    return lambda: {(): getattr(source, name)}
+
+
+def _fingerprint(command: commands.Command) -> Tuple[Any, ...]:
+    """
+    Values of fields of command, what a retry must send again
+    """
+    if not dataclasses.is_dataclass(command):
+        return ()
+    return tuple(
+        getattr(command, field.name) for field in dataclasses.fields(command)
+    )
+
+
+class PendingResult:
+    """
+    Result of a command handled in a group commit, resolved once the group
+    is committed, or shared by commands with the same idempotency key.
+    Has the interface of multiprocessing.pool.AsyncResult
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[Any], None]] = None,
+        error_callback: Optional[Callable[[BaseException], None]] = None,
+    ):
+        self._callbacks: List[
+            Tuple[
+                Optional[Callable[[Any], None]],
+                Optional[Callable[[BaseException], None]],
+            ]
+        ] = [(callback, error_callback)]
+        self._lock: threading.Lock = threading.Lock()
+        self._event: threading.Event = threading.Event()
+        self._success: bool = False
+        self._value: Any = None
+
+    def ready(self) -> bool:
+        return self._event.is_set()
+
+    def successful(self) -> bool:
+        if not self.ready():
+            raise ValueError(f"{self!r} not ready")
+        return self._success
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        self._event.wait(timeout)
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        Wait for result of command
+
+        Args:
+            timeout (Optional[float]): Seconds to wait, forever if None
+
+        Raises:
+            multiprocessing.TimeoutError: If result is not ready in time
+            Exception: Exception raised by command handler
+
+        Returns:
+            Any: Result of command handler
+        """
+        self.wait(timeout)
+        if not self.ready():
+            raise multiprocessing.TimeoutError
+        if self._success:
+            return self._value
+        raise self._value
+
+    def add_callbacks(
+        self,
+        callback: Optional[Callable[[Any], None]] = None,
+        error_callback: Optional[Callable[[BaseException], None]] = None,
+    ) -> None:
+        """
+        Call callback with the result or error_callback with the exception
+        once it is ready, right away if it is ready already
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append((callback, error_callback))
+                return
+        self._call(callback, error_callback)
+
+    def _set(self, success: bool, value: Any) -> None:
+        with self._lock:
+            self._success = success
+            self._value = value
+            callbacks, self._callbacks = self._callbacks, []
+            self._event.set()
+        for callback, error_callback in callbacks:
+            self._call(callback, error_callback)
+
+    def _call(
+        self,
+        callback: Optional[Callable[[Any], None]],
+        error_callback: Optional[Callable[[BaseException], None]],
+    ) -> None:
+        if self._success and callback is not None:
+            callback(self._value)
+        if not self._success and error_callback is not None:
+            error_callback(self._value)
+
+
 class MessageBus:
+    """
+    Message bus handling messages in background threads
+
+    Every thread is a lane: commands are routed to lanes by their partition
+    key, so commands with the same key run one after another in the order
+    they were sent, while commands with different keys can run in parallel.
+    Events are handled in the lane of the command that raised them, unless
+    there are `event_threads`: then events get lanes of their own, so slow
+    event handlers do not delay commands. Events raised in the same command
+    lane share an event lane and keep their order.
+
+    Handlers failing with ConcurrencyConflict are retried up to
+    `conflict_retries` times.
+
+    With `group_commit` enabled, commands waiting in a lane are handled
+    together, up to `group_commit_size` at a time, in one unit of work with a
+    single commit. A lane waits up to `group_commit_window` seconds for the
+    group to fill; with no window, groups are whatever arrived while the lane
+    was busy, so they only grow under load. Every command runs in its own
+    nested `with` block of the unit of work, which is a savepoint: a failing
+    one is rolled back alone and its caller gets the exception, while the
+    others are committed.
+
+    At most `max_queue_size` commands wait to be handled, more are rejected
+    with QueueFull. Commands which waited longer than `max_queue_wait`
+    seconds fail with QueueWaitExpired without being handled. Both are
+    MessageBusOverloaded, telling callers to retry after `retry_after`
+    seconds. Events are never rejected.
+
+    Commands whose deadline passed before they were started are skipped with
+    DeadlineExceeded. Commands without a deadline get one `command_timeout`
+    seconds after they are sent. `skipped` counts skipped commands and
+    `expired` counts results callers stopped waiting for at the deadline.
+
+    `metrics` has latencies of commands split into queue wait, handler and
+    commit time, event counts, queue depth, repository sizes and outcomes
+    of transactions.
+
+    Commands with an idempotency key share the result of the last command
+    of the same type and key, which is still running or finished less than
+    `idempotency_ttl` seconds ago, instead of being handled again. Results
+    of up to `idempotency_cache_size` keys are kept, only successful ones
+    once finished: a failed command can be retried. `deduplicated` counts
+    commands answered this way. Batches are not deduplicated.
+
+    Messages join the trace of the span they were sent from, unless they
+    carry one already. The bus records spans of commands waiting in queue,
+    their handlers and events they raised, see `tracing`.
+    """
+
     def __init__(
         self,
         uow: unit_of_work.AbstractUnitOfWork,
         event_handlers: dict[events.Event, list[Callable]],
         command_handlers: dict[commands.Command, Callable],
         background_threads: int = 1,
+        conflict_retries: int = 5,
+        group_commit: bool = False,
+        group_commit_window: float = 0.0,
+        group_commit_size: int = 64,
+        max_queue_size: Optional[int] = None,
+        max_queue_wait: Optional[float] = None,
+        retry_after: int = 1,
+        command_timeout: Optional[float] = None,
+        event_threads: int = 0,
+        idempotency_cache_size: int = 10000,
+        idempotency_ttl: float = 300.0,
     ):
         self.uow: unit_of_work.AbstractUnitOfWork = uow
         self.event_handlers: dict[events.Event, list[Callable]] = event_handlers
         self.command_handlers: dict[commands.Command, Callable] = command_handlers
-        self.pool = multiprocessing.pool.ThreadPool(background_threads)
+        self.conflict_retries: int = conflict_retries
+        self.lanes: List[multiprocessing.pool.ThreadPool] = [
+            multiprocessing.pool.ThreadPool(1) for _ in range(background_threads)
+        ]
+        self.event_lanes: List[multiprocessing.pool.ThreadPool] = [
+            multiprocessing.pool.ThreadPool(1) for _ in range(event_threads)
+        ]
+        self.group_commit: bool = group_commit
+        self.group_commit_window: float = group_commit_window
+        self.group_commit_size: int = group_commit_size
+        self.max_queue_size: Optional[int] = max_queue_size
+        self.max_queue_wait: Optional[float] = max_queue_wait
+        self.retry_after: int = retry_after
+        self.command_timeout: Optional[float] = command_timeout
+        self.queued: int = 0  # Commands waiting to be handled
+        self.rejected: int = 0  # Commands not queued, the queue was full
+        self.skipped: int = 0  # Commands not handled, their deadline passed
+        self.expired: int = 0  # Results not awaited past deadline
+        self.deduplicated: int = 0  # Commands answered with an earlier result
+        self.results: idempotency.ResultCache = idempotency.ResultCache(
+            idempotency_cache_size, idempotency_ttl
+        )
+        self._queue_lock: threading.Lock = threading.Lock()
+        self._groups: List[deque[Tuple[commands.Command, PendingResult, float]]] = [
+            deque() for _ in self.lanes
+        ]
+        self._groups_scheduled: List[bool] = [False for _ in self.lanes]
+        self._groups_condition: threading.Condition = threading.Condition()
+        self.metrics: metrics.Registry = metrics.Registry()
+        self._register_metrics()
 
-    def handle(self, message: Message) -> multiprocessing.pool.AsyncResult:
+    def handle(
+        self, message: Message
+    ) -> Union[multiprocessing.pool.AsyncResult, PendingResult]:
         """
         Handle message
 
@@ -37,23 +255,559 @@ class MessageBus:
 
         Raises:
             ValueError: If message is not Event or Command
+            exceptions.QueueFull: If too many commands are waiting
+
+        Returns:
+            Union[multiprocessing.pool.AsyncResult, PendingResult]: Result,
+                PendingResult for commands in group commit mode or with an
+                idempotency key
+        """
+        self._set_deadline(message)
+        self._set_trace(message)
+        if self._is_idempotent(message):
+            return self._submit_idempotent(message)
+        return self._submit(message)
+
+    def handle_batch(
+        self, batch: List[commands.Command]
+    ) -> multiprocessing.pool.AsyncResult:
+        """
+        Handle commands in a single unit of work, one after another. Either
+        all of them are committed at once or, if any fails, none is. Events
+        raised by the commands are dispatched together after the commit
+
+        Args:
+            batch (List[commands.Command]): Commands to handle
+
+        Raises:
+            exceptions.BatchCommandFailed: If any command fails
+            exceptions.QueueFull: If too many commands are waiting
+
+        Returns:
+            multiprocessing.pool.AsyncResult: Results of commands, in order
+        """
+        for command in batch:
+            self._set_deadline(command)
+            self._set_trace(command)
+        return self._submit_batch(batch)
+
+    def _register_metrics(self) -> None:
+        register = self.metrics.register
+        self._queue_wait_seconds = register(
+            metrics.Histogram(
+                "messagebus_queue_wait_seconds",
+                "Time commands waited in queue",
+                ["command"],
+            )
+        )
+        self._handler_seconds = register(
+            metrics.Histogram(
+                "messagebus_handler_seconds",
+                "Time spent in command handlers, without commit",
+                ["command"],
+            )
+        )
+        self._commit_seconds = register(
+            metrics.Histogram(
+                "messagebus_commit_seconds",
+                "Time spent committing changes of commands",
+                ["command"],
+            )
+        )
+        self._event_handler_seconds = register(
+            metrics.Histogram(
+                "messagebus_event_handler_seconds",
+                "Time spent in all handlers of an event",
+                ["event"],
+            )
+        )
+        self._commands_total = register(
+            metrics.Counter(
+                "messagebus_commands_total",
+                "Handled commands by outcome",
+                ["command", "outcome"],
+            )
+        )
+        self._events_total = register(
+            metrics.Counter(
+                "messagebus_events_total", "Events raised by handlers", ["event"]
+            )
+        )
+        register(
+            metrics.Gauge(
+                "messagebus_queue_depth",
+                "Commands waiting to be handled",
+                function=lambda: {(): self.queued},
+            )
+        )
+        for name, help in (
+            ("rejected", "Commands rejected because the queue was full"),
+            ("skipped", "Commands skipped because their deadline passed"),
+            ("expired", "Commands not handled before callers stopped waiting"),
+            ("deduplicated", "Commands answered with the result of an earlier one"),
+        ):
+            register(
+                metrics.Counter(
+                    f"messagebus_commands_{name}_total",
+                    help,
+                    function=_attribute(self, name),
+                )
+            )
+        for name, help in (
+            ("commits", "Committed transactions"),
+            ("conflicts", "Commits failed with a concurrency conflict"),
+            ("rollbacks", "Transactions rolled back"),
+            ("savepoint_rollbacks", "Nested blocks rolled back to savepoint"),
+        ):
+            register(
+                metrics.Counter(
+                    f"unit_of_work_{name}_total",
+                    help,
+                    function=_attribute(self.uow, name),
+                )
+            )
+        register(
+            metrics.Gauge(
+                "repository_size",
+                "Instances stored in repository",
+                ["repository"],
+                function=lambda: {
+                    ("players",): len(self.uow.players),
+                    ("rooms",): len(self.uow.rooms),
+                },
+            )
+        )
+
+    def _count(self, counter: str) -> None:
+        with self._queue_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _observe(self, name: str, start: float, outcome: str) -> None:
+        """
+        Record handler and commit time of a command since start
+        """
+        elapsed = time.perf_counter() - start
+        commit_time = self.uow.pop_commit_time()
+        self._handler_seconds.observe(elapsed - commit_time, name)
+        self._commit_seconds.observe(commit_time, name)
+        self._commands_total.inc(name, outcome)
+
+    def _set_deadline(self, message: Message) -> None:
+        if (
+            isinstance(message, commands.Command)
+            and message.deadline is None
+            and self.command_timeout is not None
+        ):
+            message.deadline = time.monotonic() + self.command_timeout
+
+    def _set_trace(self, message: Message) -> None:
+        if (
+            isinstance(message, (commands.Command, events.Event))
+            and message.trace is None
+        ):
+            message.trace = tracing.current()
+
+    def _is_idempotent(self, message: Message) -> TypeGuard[commands.Command]:
+        return (
+            isinstance(message, commands.Command)
+            and message.idempotency_key is not None
+        )
+
+    def _lane(self, message: Message) -> int:
+        if isinstance(message, commands.Command):
+            key = message.partition_key
+            if key is not None:
+                return hash(key) % len(self.lanes)
+
+        return 0
+
+    def _submit(
+        self,
+        message: Message,
+        lane: Optional[int] = None,
+        callback: Optional[Callable[[Any], None]] = None,
+        error_callback: Optional[Callable[[BaseException], None]] = None,
+    ) -> Union[multiprocessing.pool.AsyncResult, PendingResult]:
+        if lane is None:
+            lane = self._lane(message)
+
+        pool = self.lanes[lane]
+        if not isinstance(message, commands.Command):
+            enqueued = None
+            if self.event_lanes:
+                pool = self.event_lanes[lane % len(self.event_lanes)]
+        elif self.group_commit:
+            return self._submit_to_group(message, lane, callback, error_callback)
+        else:
+            enqueued = self._enqueue()
+
+        return pool.apply_async(
+            self._handle,
+            (message, lane, enqueued),
+            callback=callback,
+            error_callback=error_callback,
+        )
+
+    def _submit_idempotent(
+        self, command: commands.Command, lane: Optional[int] = None
+    ) -> PendingResult:
         """
-        return self.pool.apply_async(self._handle, (message,))
+        Submit command unless a command with the same idempotency key is
+        running or has finished recently, share its result then
+
+        Raises:
+            exceptions.IdempotencyKeyReused: If the key was used with a
+                command with other fields
+            exceptions.QueueFull: If too many commands are waiting
+        """
+        key = (type(command), command.idempotency_key)
+        shared, added = self.results.get_or_add(
+            key, PendingResult, _fingerprint(command)
+        )
+        if not added:
+            self._count("deduplicated")
+            return shared
+
+        def finish(result: Any) -> None:
+            self.results.finish(key, shared)
+            shared._set(True, result)
+
+        def fail(exception: BaseException) -> None:
+            self.results.discard(key, shared)
+            shared._set(False, exception)
+
+        try:
+            self._submit(command, lane, callback=finish, error_callback=fail)
+        except Exception as e:  # Duplicates sent meanwhile fail with it too
+            fail(e)
+            raise
+        return shared
+
+    def _submit_batch(
+        self,
+        batch: List[commands.Command],
+        callback: Optional[Callable[[Any], None]] = None,
+        error_callback: Optional[Callable[[BaseException], None]] = None,
+    ) -> multiprocessing.pool.AsyncResult:
+        # Keep order with other commands if all share a lane
+        lanes = {self._lane(command) for command in batch}
+        lane = lanes.pop() if len(lanes) == 1 else 0
+        enqueued = self._enqueue()
+
+        return self.lanes[lane].apply_async(
+            self._handle_batch,
+            (batch, lane, enqueued),
+            callback=callback,
+            error_callback=error_callback,
+        )
+
+    def _submit_to_group(
+        self,
+        command: commands.Command,
+        lane: int,
+        callback: Optional[Callable[[Any], None]] = None,
+        error_callback: Optional[Callable[[BaseException], None]] = None,
+    ) -> PendingResult:
+        enqueued = self._enqueue()
+        result = PendingResult(callback, error_callback)
+        with self._groups_condition:
+            group = self._groups[lane]
+            group.append((command, result, enqueued))
+            if len(group) >= self.group_commit_size:
+                self._groups_condition.notify_all()
+
+            if not self._groups_scheduled[lane]:
+                self._groups_scheduled[lane] = True
+                self.lanes[lane].apply_async(self._handle_group, (lane,))
+
+        return result
+
+    def _take_group(
+        self, lane: int
+    ) -> List[Tuple[commands.Command, PendingResult, float]]:
+        deadline = time.monotonic() + self.group_commit_window
+        with self._groups_condition:
+            group = self._groups[lane]
+            while len(group) < self.group_commit_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._groups_condition.wait(remaining)
+
+            taken = [
+                group.popleft() for _ in range(min(len(group), self.group_commit_size))
+            ]
+            if group:  # Rest goes to the next group
+                self.lanes[lane].apply_async(self._handle_group, (lane,))
+            else:
+                self._groups_scheduled[lane] = False
+
+        return taken
+
+    def _enqueue(self) -> float:
+        """
+        Admit a command to the queue
+
+        Raises:
+            exceptions.QueueFull: If the queue is full
 
-    def _collect_new_events(self) -> None:
+        Returns:
+            float: Time the command was queued at
+        """
+        with self._queue_lock:
+            if self.max_queue_size is not None and self.queued >= self.max_queue_size:
+                self.rejected += 1
+                raise exceptions.QueueFull(
+                    f"More than {self.max_queue_size} commands are waiting",
+                    self.retry_after,
+                )
+            self.queued += 1
+
+        return time.monotonic()
+
+    def _dequeue(
+        self,
+        name: str,
+        enqueued: float,
+        deadline: Optional[float] = None,
+        trace: Optional[tracing.TraceContext] = None,
+    ) -> None:
+        """
+        Take a command from the queue to handle it
+
+        Args:
+            name (str): Name of the command, for metrics
+            enqueued (float): Time the command was queued at
+            deadline (Optional[float]): Deadline of the command
+            trace (Optional[tracing.TraceContext]): Span which sent the command
+
+        Raises:
+            exceptions.DeadlineExceeded: If its deadline passed
+            exceptions.QueueWaitExpired: If it waited too long to be handled
+        """
+        with self._queue_lock:
+            self.queued -= 1
+
+        waited = time.monotonic() - enqueued
+        self._queue_wait_seconds.observe(waited, name)
+        tracing.record(f"queue {name}", trace, waited)
+
+        self._check_deadline(deadline)
+        if self.max_queue_wait is not None and waited > self.max_queue_wait:
+            raise exceptions.QueueWaitExpired(
+                f"Command waited {waited:.3f}s in queue", self.retry_after
+            )
+
+    def _check_deadline(self, deadline: Optional[float]) -> None:
+        """
+        Raises:
+            exceptions.DeadlineExceeded: If deadline passed
+        """
+        if deadline is not None and time.monotonic() > deadline:
+            self._count("skipped")
+            raise exceptions.DeadlineExceeded("Command deadline passed before it ran")
+
+    def _dispatch_new_events(
+        self, lane: int, trace: Optional[tracing.TraceContext] = None
+    ) -> None:
+        # Must run in the thread which handled the message, units of work
+        # keep transaction state per thread and coroutines share it
         for event in self.uow.collect_new_events():
-            self.handle(event)
+            self._events_total.inc(type(event).__name__)
+            if event.trace is None:
+                event.trace = trace
+            self._submit(event, lane)
 
-    def _handle(self, message: Message) -> Any:
-        result = None
-        for handler in self._get_handlers(message):
-            result = handler(message)
+    def _handle(
+        self, message: Message, lane: int, enqueued: Optional[float] = None
+    ) -> Any:
+        name = type(message).__name__
+        if enqueued is not None:
+            deadline = getattr(message, "deadline", None)  # Only commands queue
+            self._dequeue(name, enqueued, deadline, message.trace)
+
+        is_command = isinstance(message, commands.Command)
+        # Commands sent outside of a trace start one, events only follow
+        with tracing.span(
+            f"handle {name}", message.trace, root=is_command, lane=lane
+        ) as span:
+            self.uow.pop_commit_time()  # Not spent on this message
+            start = time.perf_counter()
+            try:
+                result = self._call_handlers(message)
+            except Exception:
+                if is_command:
+                    self._observe(name, start, "error")
+                raise
+
+            if is_command:
+                self._observe(name, start, "success")
+            else:
+                self._event_handler_seconds.observe(time.perf_counter() - start, name)
 
-        self.pool.apply_async(self._collect_new_events)
+        self._dispatch_new_events(lane, span and span.context)
 
         if isinstance(message, commands.Command):
             return result
 
+    def _call_handlers(self, message: Message) -> Any:
+        result = None
+        for handler in self._get_handlers(message):
+            for attempt in range(self.conflict_retries + 1):
+                try:
+                    result = self._call(handler, message)
+                    break
+                except exceptions.ConcurrencyConflict:
+                    if attempt == self.conflict_retries:
+                        raise
+                    logger.debug(f"Retrying {message} after concurrency conflict")
+
+        return result
+
+    def _handle_batch(
+        self, batch: List[commands.Command], lane: int, enqueued: float
+    ) -> List[Any]:
+        deadlines = [c.deadline for c in batch if c.deadline is not None]
+        trace = batch[0].trace if batch else None
+        self._dequeue("Batch", enqueued, min(deadlines, default=None), trace)
+
+        with tracing.span(
+            "handle Batch", trace, root=True, lane=lane, size=len(batch)
+        ) as span:
+            self.uow.pop_commit_time()
+            start = time.perf_counter()
+            try:
+                results = self._call_batch(batch)
+            except Exception:
+                self._observe("Batch", start, "error")
+                raise
+            self._observe("Batch", start, "success")
+
+        self._dispatch_new_events(lane, span and span.context)
+        return results
+
+    def _call_batch(self, batch: List[commands.Command]) -> List[Any]:
+        for attempt in range(self.conflict_retries + 1):
+            try:
+                results = []
+                # Handlers' own `with uow` blocks join this one
+                with self.uow:
+                    for index, command in enumerate(batch):
+                        handler = self._get_command_handlers(command)[0]
+                        try:
+                            results.append(self._call(handler, command))
+                        except exceptions.ConcurrencyConflict:
+                            raise
+                        except Exception as e:
+                            raise exceptions.BatchCommandFailed(index, e) from e
+                    self.uow.commit()
+                break
+            except exceptions.ConcurrencyConflict:
+                if attempt == self.conflict_retries:
+                    raise
+                logger.debug("Retrying batch after concurrency conflict")
+
+        return results
+
+    def _handle_group(self, lane: int) -> None:
+        group: List[Tuple[commands.Command, PendingResult]] = []
+        for command, result, enqueued in self._take_group(lane):
+            try:
+                self._dequeue(
+                    type(command).__name__, enqueued, command.deadline, command.trace
+                )
+                group.append((command, result))
+            except (exceptions.DeadlineExceeded, exceptions.QueueWaitExpired) as e:
+                result._set(False, e)
+        if not group:
+            return
+
+        self.uow.pop_commit_time()
+        outcomes = self._run_group([command for command, _ in group], lane)
+        commit_time = self.uow.pop_commit_time()  # Shared by all commands
+
+        for (command, _), (success, _) in zip(group, outcomes):
+            name = type(command).__name__
+            self._commit_seconds.observe(commit_time, name)
+            self._commands_total.inc(name, "success" if success else "error")
+            tracing.record(
+                "group commit", command.trace, commit_time, size=len(group)
+            )
+
+        self._dispatch_new_events(lane)
+
+        for (_, result), (success, value) in zip(group, outcomes):
+            result._set(success, value)
+
+    def _run_group(
+        self, group: List[commands.Command], lane: int
+    ) -> List[Tuple[bool, Any]]:
+        handler_times = [0.0] * len(group)  # Of all attempts, observed once
+        outcomes: List[Tuple[bool, Any]] = []
+        error: Optional[Exception] = None
+        for attempt in range(self.conflict_retries + 1):
+            try:
+                outcomes = []
+                with self.uow:
+                    for index, command in enumerate(group):
+                        name = type(command).__name__
+                        start = time.perf_counter()
+                        try:
+                            handler = self._get_command_handlers(command)[0]
+                            with tracing.span(
+                                f"handle {name}", command.trace, root=True, lane=lane
+                            ) as span, self.uow:  # Savepoint
+                                outcomes.append((True, self._call(handler, command)))
+                                self._trace_new_events(span and span.context)
+                        except exceptions.ConcurrencyConflict:
+                            raise
+                        except Exception as e:
+                            outcomes.append((False, e))
+                        finally:
+                            handler_times[index] += time.perf_counter() - start
+                    self.uow.commit()
+                error = None
+                break
+            except exceptions.ConcurrencyConflict as e:
+                error = e
+                if attempt < self.conflict_retries:
+                    logger.debug("Retrying group of commands after conflict")
+            except Exception as e:  # Commit failed, nothing was committed
+                logger.exception("Exception committing group of commands")
+                error = e
+                break
+
+        for command, handler_time in zip(group, handler_times):
+            self._handler_seconds.observe(handler_time, type(command).__name__)
+
+        if error is None:
+            return outcomes
+        # Commands which failed on their own keep their errors
+        return [
+            outcomes[index]
+            if index < len(outcomes) and not outcomes[index][0]
+            else (False, error)
+            for index in range(len(group))
+        ]
+
+    def _trace_new_events(self, trace: Optional[tracing.TraceContext]) -> None:
+        """
+        Set trace of events raised in the current transaction which have
+        none. Events of a group are dispatched after all of its commands,
+        this keeps the command which raised them
+        """
+        if trace is None:
+            return
+        for instance in chain(self.uow.players.seen, self.uow.rooms.seen):
+            if not instance.has_events:
+                continue
+            for event in instance.events:
+                if event.trace is None:
+                    event.trace = trace
+
+    def _call(self, handler: Callable, message: Message) -> Any:
+        return handler(message)
+
     def _get_handlers(self, message: Message) -> list[Callable]:
         if isinstance(message, commands.Command):
             return self._get_command_handlers(message)
@@ -79,3 +833,164 @@ class MessageBus:
         except Exception as e:
             logger.exception(f"Exception processing {func}")
             return e
+
+
+class AsyncMessageBus(MessageBus):
+    """
+    Message bus for asyncio applications
+
+    `handle_async` returns an awaitable, so waiting for a result does not
+    block the event loop, `handle` returns results like in MessageBus.
+    The same goes for `handle_batch_async` and `handle_batch`.
+    Coroutine handlers run on the event loop, regular handlers keep running
+    in the thread pool. Either way messages go through their lane: it waits
+    for coroutine handlers, so they keep its order and are queued like
+    other commands, and run in its transaction state. Waiting stops at the
+    command deadline.
+    """
+
+    def __init__(
+        self,
+        uow: unit_of_work.AbstractUnitOfWork,
+        event_handlers: dict[events.Event, list[Callable]],
+        command_handlers: dict[commands.Command, Callable],
+        background_threads: int = 1,
+        conflict_retries: int = 5,
+        group_commit: bool = False,
+        group_commit_window: float = 0.0,
+        group_commit_size: int = 64,
+        max_queue_size: Optional[int] = None,
+        max_queue_wait: Optional[float] = None,
+        retry_after: int = 1,
+        command_timeout: Optional[float] = None,
+        event_threads: int = 0,
+        idempotency_cache_size: int = 10000,
+        idempotency_ttl: float = 300.0,
+    ):
+        super().__init__(
+            uow,
+            event_handlers,
+            command_handlers,
+            background_threads,
+            conflict_retries,
+            group_commit,
+            group_commit_window,
+            group_commit_size,
+            max_queue_size,
+            max_queue_wait,
+            retry_after,
+            command_timeout,
+            event_threads,
+            idempotency_cache_size,
+            idempotency_ttl,
+        )
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    async def handle_async(self, message: Message) -> Any:
+        """
+        Handle message and wait for its result without blocking the loop
+
+        Args:
+            message (Message): Message to handle. It can be either Event or Command
+
+        Raises:
+            ValueError: If message is not Event or Command
+            exceptions.QueueFull: If too many commands are waiting
+            exceptions.DeadlineExceeded: If command was not handled in time
+
+        Returns:
+            Any: Result of command handler, None for events
+        """
+        self.loop = asyncio.get_running_loop()
+        self._set_deadline(message)
+        self._set_trace(message)
+        deadline = getattr(message, "deadline", None)
+
+        lane = self._lane(message)
+        if self._is_idempotent(message):
+            future = self.loop.create_future()
+            self._submit_idempotent(message, lane).add_callbacks(
+                callback=lambda result: self._resolve(future, result=result),
+                error_callback=lambda exception: self._resolve(future, exception),
+            )
+            return await self._wait(future, deadline)
+
+        future = self.loop.create_future()
+        self._submit(
+            message,
+            lane,
+            callback=lambda result: self._resolve(future, result=result),
+            error_callback=lambda exception: self._resolve(future, exception),
+        )
+        return await self._wait(future, deadline)
+
+    async def handle_batch_async(self, batch: List[commands.Command]) -> List[Any]:
+        """
+        Handle commands in a single unit of work and wait for their results
+        without blocking the loop, see MessageBus.handle_batch
+
+        Args:
+            batch (List[commands.Command]): Commands to handle
+
+        Raises:
+            exceptions.BatchCommandFailed: If any command fails
+            exceptions.QueueFull: If too many commands are waiting
+            exceptions.DeadlineExceeded: If batch was not handled in time
+
+        Returns:
+            List[Any]: Results of commands, in order
+        """
+        self.loop = asyncio.get_running_loop()
+        for command in batch:
+            self._set_deadline(command)
+            self._set_trace(command)
+        deadlines = [c.deadline for c in batch if c.deadline is not None]
+
+        future = self.loop.create_future()
+        self._submit_batch(
+            batch,
+            callback=lambda result: self._resolve(future, result=result),
+            error_callback=lambda exception: self._resolve(future, exception),
+        )
+        return await self._wait(future, min(deadlines, default=None))
+
+    async def _wait(self, future: asyncio.Future, deadline: Optional[float]) -> Any:
+        if deadline is None:
+            return await future
+
+        try:
+            return await asyncio.wait_for(future, deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            self._count("expired")
+            raise exceptions.DeadlineExceeded(
+                "Command was not handled before its deadline"
+            ) from None
+
+    def _call(self, handler: Callable, message: Message) -> Any:
+        if not asyncio.iscoroutinefunction(handler):
+            return handler(message)
+
+        if self.loop is None or self.loop.is_closed():
+            return asyncio.run(handler(message))
+
+        # The lane waits, the coroutine runs in a copy of its context, so it
+        # uses the transaction state of the lane
+        return asyncio.run_coroutine_threadsafe(handler(message), self.loop).result()
+
+    def _resolve(
+        self,
+        future: asyncio.Future,
+        exception: Optional[BaseException] = None,
+        result: Any = None,
+    ) -> None:
+        def resolve() -> None:
+            if future.done():  # Caller stopped waiting
+                return
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+
+        loop = future.get_loop()
+        with contextlib.suppress(RuntimeError):  # Loop closed, caller is gone
+            loop.call_soon_threadsafe(resolve)
@@ -0,0 +1,241 @@
+"""
+Metrics rendered in the Prometheus text exposition format.
+
+Updating a metric takes a lock and a dictionary lookup, so it is cheap
+enough for the hot path. Metrics computed from state which already exists
+elsewhere, like queue depth, take a function called only when rendered.
+"""
+from __future__ import annotations
+
+import bisect
+import threading
+from typing import (
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+Labels = Tuple[str, ...]  # Label values, in the order of label names
+
+# Seconds, from a fraction of a millisecond to a slow request
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+
+    def escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    pairs = ",".join(
+        f'{name}="{escape(str(value))}"' for name, value in zip(names, values)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Metric:
+    """
+    Metric with values for every combination of label values
+
+    Args:
+        name (str): Name of metric
+        help (str): Description of metric
+        labels (Sequence[str]): Names of labels
+        function (Optional[Callable[[], Dict[Labels, float]]]): Computes
+            values when rendered, instead of them being set
+    """
+
+    type: str = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        function: Optional[Callable[[], Dict[Labels, float]]] = None,
+    ):
+        self.name: str = name
+        self.help: str = help
+        self.labels: Tuple[str, ...] = tuple(labels)
+        self._function: Optional[Callable[[], Dict[Labels, float]]] = function
+        self._values: Dict[Labels, float] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def value(self, *labels: str) -> float:
+        """
+        Get current value for label values
+
+        Returns:
+            float: Value, 0 if it was never set
+        """
+        return self._collect().get(tuple(labels), 0)
+
+    def render(self) -> Iterator[str]:
+        """
+        Yields:
+            str: Lines of the exposition format
+        """
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        for labels, value in sorted(self._collect().items()):
+            yield (
+                f"{self.name}{_format_labels(self.labels, labels)} "
+                f"{_format_value(value)}"
+            )
+
+    def _collect(self) -> Dict[Labels, float]:
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values over buckets
+
+    Args:
+        name (str): Name of metric
+        help (str): Description of metric
+        labels (Sequence[str]): Names of labels
+        buckets (Sequence[float]): Upper bounds of buckets, ascending
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        # labels -> (count in every bucket and above the last, sum)
+        self._observed: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            observed = self._observed.get(labels)
+            if observed is None:
+                observed = ([0] * (len(self.buckets) + 1), [0.0])
+                self._observed[labels] = observed
+            observed[0][index] += 1
+            observed[1][0] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            observed = self._observed.get(tuple(labels))
+            return sum(observed[0]) if observed else 0
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+        with self._lock:
+            observed = {
+                labels: (list(counts), total[0])
+                for labels, (counts, total) in self._observed.items()
+            }
+
+        names = self.labels + ("le",)
+        for labels, (counts, total) in sorted(observed.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield (
+                    f"{self.name}_bucket"
+                    f"{_format_labels(names, labels + (_format_value(bound),))} "
+                    f"{cumulative}"
+                )
+            rendered = _format_labels(self.labels, labels)
+            yield f"{self.name}_sum{rendered} {_format_value(total)}"
+            yield f"{self.name}_count{rendered} {cumulative}"
+
+
+_M = TypeVar("_M", bound=Metric)
+
+
+class Registry:
+    """
+    Set of metrics rendered together
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: _M) -> _M:
+        """
+        Add metric
+
+        Raises:
+            ValueError: If there is a metric with the same name
+
+        Returns:
+            _M: Added metric, of the type it was passed as
+        """
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Metric:
+        return self._metrics[name]
+
+    def render(self) -> str:
+        """
+        Render all metrics
+
+        Returns:
+            str: Metrics in the Prometheus text exposition format
+        """
+        return "".join(
+            f"{line}\n" for metric in self._metrics.values() for line in metric.render()
+        )
@@ -0,0 +1,252 @@
+"""
+Subscriptions to changes of rooms, so that clients are pushed events
+instead of polling rooms for them.
+
+Events are published from threads of the message bus and consumed by
+subscribers on asyncio event loops, e.g. WebSocket connections. A busy room
+can have thousands of subscribers, so every event is encoded once and the
+encoded message is shared by all of them. Waking up a loop is a write to
+its self-pipe, so it is done once per loop, not once per subscriber.
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import json
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+from domain import events
+
+RoomEvent = Union[events.PlayerJoinedRoom, events.PlayerLeftRoom]
+# Sequence number, version of room after the event and encoded message
+Published = Tuple[int, int, str]
+
+
+def encode_event(sequence: int, event: RoomEvent) -> str:
+    """
+    Encode event as a JSON message
+
+    Args:
+        sequence (int): Sequence number of event
+        event (RoomEvent): Event of room
+
+    Returns:
+        str: Message
+    """
+    return json.dumps(
+        {
+            "type": type(event).__name__,
+            "sequence": sequence,
+            "version": event.room.version,
+            "room_id": event.room.id,
+            "player_id": event.player.id,
+        }
+    )
+
+
+class Subscription:
+    """
+    Messages of a room waiting to be sent to one subscriber
+
+    A subscriber which falls `max_size` messages behind either has them
+    coalesced, if `coalesce` is set: only the latest message is kept and
+    `skipped` counts the others, or is dropped: it is closed with
+    `overflowed` set, and should subscribe again for a fresh snapshot.
+
+    Args:
+        room_id (str): Id of room
+        sequence (int): Sequence number of the last event published for the
+            room before subscribing
+        loop (asyncio.AbstractEventLoop): Loop the subscriber runs on
+        max_size (int): Maximum number of messages waiting to be sent
+        coalesce (bool): Keep the latest message instead of dropping
+            subscriber when it falls behind
+    """
+
+    def __init__(
+        self,
+        room_id: str,
+        sequence: int,
+        loop: asyncio.AbstractEventLoop,
+        max_size: int,
+        coalesce: bool = False,
+    ):
+        self.room_id: str = room_id
+        self.sequence: int = sequence
+        self.max_size: int = max_size
+        self.coalesce: bool = coalesce
+        self.closed: bool = False
+        self.overflowed: bool = False
+        self.skipped: int = 0  # Messages coalesced away
+        self.loop: asyncio.AbstractEventLoop = loop
+        self._messages: deque[Published] = deque()
+        self._ready: asyncio.Event = asyncio.Event()
+
+    async def get(self) -> Optional[Published]:
+        """
+        Wait for the next message
+
+        Returns:
+            Optional[Published]: Sequence number, version of room and
+                message, None once closed
+        """
+        while not self._messages:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+
+        return self._messages.popleft()
+
+    def close(self) -> None:
+        """
+        Stop waiting for messages. Must be called on the loop of subscriber
+        """
+        self.closed = True
+        self._ready.set()
+
+    def _push(self, published: Published) -> None:
+        """
+        Called on the loop of subscriber
+        """
+        # Published before subscribing, but fanned out to the live set later
+        if self.closed or published[0] <= self.sequence:
+            return
+        if len(self._messages) >= self.max_size:
+            if not self.coalesce:
+                self.overflowed = True
+                self._messages.clear()
+                self.close()
+                return
+            self.skipped += len(self._messages)
+            self._messages.clear()
+
+        self._messages.append(published)
+        self._ready.set()
+
+
+def _fan_out(subscribers: Iterable[Subscription], published: Published) -> None:
+    """
+    Called on the loop all of subscribers run on
+    """
+    for subscription in subscribers:
+        subscription._push(published)
+
+
+class _Room:
+    __slots__ = ("sequence", "version", "subscribers")
+
+    def __init__(self):
+        self.sequence: int = 0  # Of the last published event
+        self.version: int = 0  # Of room after the last published event
+        self.subscribers: Dict[asyncio.AbstractEventLoop, Set[Subscription]] = {}
+
+
+class RoomSubscriptions:
+    """
+    Subscribers of rooms
+
+    Events of every room are numbered with consecutive sequence numbers, in
+    the order they are published. Numbers are kept only while a room has
+    subscribers, a snapshot of the room taken after subscribing is what
+    later events apply to. Commands of a room can run on different lanes of
+    the message bus, so an event can be published after a newer one. It is
+    then dropped, the newer event already carries a later version of room.
+
+    Args:
+        encode (Callable[[int, RoomEvent], str]): Encodes event with its
+            sequence number as message sent to subscribers
+        max_size (int): Maximum number of messages waiting for a subscriber
+        coalesce (bool): Keep only the latest message for subscribers which
+            fall behind, instead of dropping them
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[int, RoomEvent], str] = encode_event,
+        max_size: int = 1000,
+        coalesce: bool = False,
+    ):
+        self.encode: Callable[[int, RoomEvent], str] = encode
+        self.max_size: int = max_size
+        self.coalesce: bool = coalesce
+        self._rooms: Dict[str, _Room] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """
+        Returns:
+            int: Number of subscribers
+        """
+        with self._lock:
+            return sum(
+                len(subscribers)
+                for room in self._rooms.values()
+                for subscribers in room.subscribers.values()
+            )
+
+    def subscribe(self, room_id: str) -> Subscription:
+        """
+        Subscribe to events of room. Must be called on a running event loop
+
+        Args:
+            room_id (str): Id of room
+
+        Returns:
+            Subscription: Events published from now on
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            room = self._rooms.get(room_id)
+            if room is None:
+                room = self._rooms[room_id] = _Room()
+            subscription = Subscription(
+                room_id, room.sequence, loop, self.max_size, self.coalesce
+            )
+            room.subscribers.setdefault(loop, set()).add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Stop sending events to subscription. Must be called on its loop
+        """
+        with self._lock:
+            room = self._rooms.get(subscription.room_id)
+            if room is None:
+                return
+            subscribers = room.subscribers.get(subscription.loop, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                room.subscribers.pop(subscription.loop, None)
+            if not room.subscribers:
+                del self._rooms[subscription.room_id]
+
+    def publish(self, event: RoomEvent) -> None:
+        """
+        Encode event once and send it to subscribers of its room.
+        Called from any thread
+
+        Args:
+            event (RoomEvent): Event of room
+        """
+        with self._lock:  # Held while scheduling, to keep order of events
+            room = self._rooms.get(event.room.id)
+            if room is None or event.room.version <= room.version:
+                return
+            room.sequence += 1
+            room.version = event.room.version
+            published = (
+                room.sequence,
+                event.room.version,
+                self.encode(room.sequence, event),
+            )
+
+            # Sets of subscribers are only changed on their loop, where
+            # _fan_out runs too, so they are passed without a copy. Who
+            # subscribed meanwhile ignores the event by its sequence number
+            for loop, subscribers in room.subscribers.items():
+                with contextlib.suppress(RuntimeError):  # Loop closed, it is gone
+                    loop.call_soon_threadsafe(_fan_out, subscribers, published)
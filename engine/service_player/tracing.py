@@ -0,0 +1,323 @@
+"""
+Spans of work done for a request: the route, the command waiting in queue,
+its handler, the commit and handlers of events it raised.
+
+Trace context is carried on commands and events, so spans recorded in
+threads of the message bus join the trace of the request that sent them.
+Within a thread the current span is kept in a context variable, which lets
+code like the unit of work record spans without knowing about messages.
+
+Whether a trace is recorded is decided once, when it starts, with the
+probability `sample_rate` of the tracer. Traces that are not sampled carry
+NOT_SAMPLED as their context, so work done for them is not sampled again
+as a trace of its own. Their spans cost a context variable read and
+nothing is exported.
+"""
+from __future__ import annotations
+
+import abc
+import contextvars
+import json
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, TextIO
+
+
+class TraceContext:
+    """
+    Identifies a span within a trace, to record child spans under it
+    """
+
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id: str = trace_id
+        self.span_id: str = span_id
+        self.sampled: bool = sampled
+
+    def __repr__(self) -> str:
+        if not self.sampled:
+            return "TraceContext(not sampled)"
+        return f"TraceContext({self.trace_id}, {self.span_id})"
+
+
+# Context of traces that are not recorded
+NOT_SAMPLED = TraceContext("", "", sampled=False)
+
+
+class Span:
+    """
+    Finished or running unit of work in a trace
+
+    Args:
+        name (str): Name of work, e.g. "handle JoinRoom"
+        context (TraceContext): Ids of this span
+        parent_id (Optional[str]): Id of parent span, None for a root span
+        start (float): Wall clock time the span started at
+        attributes (Dict[str, Any]): Details of work
+    """
+
+    __slots__ = ("name", "context", "parent_id", "start", "duration", "attributes")
+
+    def __init__(
+        self,
+        name: str,
+        context: TraceContext,
+        parent_id: Optional[str],
+        start: float,
+        attributes: Dict[str, Any],
+    ):
+        self.name: str = name
+        self.context: TraceContext = context
+        self.parent_id: Optional[str] = parent_id
+        self.start: float = start
+        self.duration: float = 0.0
+        self.attributes: Dict[str, Any] = attributes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+        }
+
+
+class AbstractExporter(abc.ABC):
+    @abc.abstractmethod
+    def export(self, span: Span) -> None:
+        """
+        Store finished span. Called from any thread
+
+        Args:
+            span (Span): Finished span
+        """
+        raise NotImplementedError
+
+
+class NullExporter(AbstractExporter):
+    def export(self, span: Span) -> None:
+        pass
+
+
+class MemoryExporter(AbstractExporter):
+    """
+    Keeps finished spans in `spans`
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._lock: threading.Lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+
+class JsonFileExporter(AbstractExporter):
+    """
+    Appends finished spans to a file, one JSON object per line
+
+    Args:
+        path (str): Path of the file
+    """
+
+    def __init__(self, path: str):
+        self.path: str = path
+        self._file: TextIO = open(path, "a", encoding="utf-8")
+        self._lock: threading.Lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Samples traces and exports their spans
+
+    Args:
+        exporter (AbstractExporter): Destination of finished spans
+        sample_rate (float): Share of traces recorded, from 0 to 1
+    """
+
+    def __init__(self, exporter: AbstractExporter, sample_rate: float = 1.0):
+        self.exporter: AbstractExporter = exporter
+        self.sample_rate: float = sample_rate
+
+    def sample(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+
+
+class _SpanScope:
+    """
+    Records a span while the `with` block runs and makes it current
+    """
+
+    __slots__ = ("_tracer", "_span", "_started", "_token")
+
+    def __init__(self, tracer: Tracer, span: Span):
+        self._tracer: Tracer = tracer
+        self._span: Span = span
+        self._started: float = 0.0
+        self._token: Optional[contextvars.Token[Optional[TraceContext]]] = None
+
+    def __enter__(self) -> Span:
+        self._token = _current.set(self._span.context)
+        self._started = time.perf_counter()
+        return self._span
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._span.duration = time.perf_counter() - self._started
+        if self._token is not None:
+            _current.reset(self._token)
+        if exc_type is not None:
+            self._span.attributes["error"] = exc_type.__name__
+        self._tracer.exporter.export(self._span)
+
+
+class _NoSpan:
+    """
+    Stands in for a span which is not recorded
+    """
+
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+
+class _NotSampledScope:
+    """
+    Stands in for a span of a trace that is not sampled, makes NOT_SAMPLED
+    current so work done in the `with` block does not start a trace
+    """
+
+    __slots__ = ("_token",)
+
+    def __init__(self):
+        self._token: Optional[contextvars.Token[Optional[TraceContext]]] = None
+
+    def __enter__(self) -> None:
+        self._token = _current.set(NOT_SAMPLED)
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._token is not None:
+            _current.reset(self._token)
+
+
+_NO_SPAN = _NoSpan()
+
+_tracer: Tracer = Tracer(NullExporter(), sample_rate=0.0)
+_current: contextvars.ContextVar[Optional[TraceContext]] = contextvars.ContextVar(
+    "trace_context", default=None
+)
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def set_tracer(tracer: Tracer) -> None:
+    """
+    Replace tracer used by `span` and `record`
+
+    Args:
+        tracer (Tracer): New tracer
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def current() -> Optional[TraceContext]:
+    """
+    Get context of the span running in this thread or task
+
+    Returns:
+        Optional[TraceContext]: Current span, NOT_SAMPLED in traces that are
+            not sampled, None outside of traces
+    """
+    return _current.get()
+
+
+def span(
+    name: str,
+    parent: Optional[TraceContext] = None,
+    root: bool = False,
+    **attributes: Any,
+) -> Any:
+    """
+    Record a span around a `with` block, which gets the Span, or None if the
+    trace is not sampled
+
+    Args:
+        name (str): Name of work
+        parent (Optional[TraceContext]): Parent span, the current one if None
+        root (bool): Start a new trace when there is no parent. If it is not
+            sampled, NOT_SAMPLED is current in the block
+        **attributes (Any): Details of work
+
+    Returns:
+        Any: Context manager
+    """
+    if parent is None:
+        parent = _current.get()
+    if parent is not None:
+        if not parent.sampled:
+            return _NotSampledScope()
+        context = TraceContext(parent.trace_id, _new_id(64))
+        parent_id: Optional[str] = parent.span_id
+    elif not root:
+        return _NO_SPAN
+    elif _tracer.sample():
+        context = TraceContext(_new_id(128), _new_id(64))
+        parent_id = None
+    else:
+        return _NotSampledScope()
+
+    return _SpanScope(_tracer, Span(name, context, parent_id, time.time(), attributes))
+
+
+def record(
+    name: str, parent: Optional[TraceContext], duration: float, **attributes: Any
+) -> None:
+    """
+    Record a span of work which ended now, e.g. time spent waiting in queue
+
+    Args:
+        name (str): Name of work
+        parent (Optional[TraceContext]): Parent span, nothing is recorded if
+            None or not sampled
+        duration (float): Seconds the work took
+        **attributes (Any): Details of work
+    """
+    if parent is None or not parent.sampled:
+        return
+
+    finished = Span(
+        name,
+        TraceContext(parent.trace_id, _new_id(64)),
+        parent.span_id,
+        time.time() - duration,
+        attributes,
+    )
+    finished.duration = duration
+    _tracer.exporter.export(finished)
@@ -1,47 +1,162 @@
 from __future__ import annotations
 
 import abc
+import contextvars
 import logging
-from typing import TYPE_CHECKING
+import threading
+import time
+from collections import deque
+from itertools import chain
+from typing import TYPE_CHECKING, Any, List, Optional, cast
+
+from service_player import exceptions, tracing
+from sqlalchemy.exc import IntegrityError
 
 if TYPE_CHECKING:
     from adapters import repository
+    from adapters.persistence import RamPersistence
+    from domain.base import BaseModel
+    from sqlalchemy.engine import Connection, Engine
 
 logger = logging.getLogger(__name__)
 
 
+class _State:
+    """
+    Transaction state of a unit of work, separate for every thread and
+    asyncio task
+    """
+
+    def __init__(self):
+        self.depth: int = 0  # Number of nested `with` blocks
+        self.savepoints: List[Any] = []  # One for every nested block
+        self.connection: Optional[Connection] = None
+        self.emitted: deque[BaseModel] = deque()  # Committed with new events
+        self.commit_time: float = 0.0  # Seconds spent committing, see pop
+
+
 class AbstractUnitOfWork(abc.ABC):
+    """
+    Unit of work. Nested `with` blocks are savepoints: if one exits with an
+    exception, changes made inside it are rolled back and the rest of the
+    transaction is kept. Commits inside them are deferred until the
+    outermost block commits, and nothing is committed if it exits without
+    committing. This lets handlers run together, e.g. in a batch, as a
+    single transaction.
+
+    Savepoints cover instances added or got from repositories inside the
+    nested block, do not change ones got before it there.
+
+    `commits`, `conflicts`, `rollbacks` and `savepoint_rollbacks` count
+    transactions by outcome, for metrics
+    """
+
     players: repository.AbstractRepository
     rooms: repository.AbstractRepository
 
+    def __init__(self):
+        # Coroutines interleave on one thread, so state is kept per context
+        # instead of per thread. A coroutine started from a thread, e.g. a
+        # handler run on the event loop for a lane, shares the state of it
+        self._state: contextvars.ContextVar[_State] = contextvars.ContextVar(
+            f"{type(self).__name__}_state"
+        )
+        self.commits: int = 0
+        self.conflicts: int = 0  # Commits failed with ConcurrencyConflict
+        self.rollbacks: int = 0  # Transactions ended with uncommitted changes
+        self.savepoint_rollbacks: int = 0
+        self._counters_lock: threading.Lock = threading.Lock()
+
+    @property
+    def _local(self) -> _State:
+        try:
+            return self._state.get()
+        except LookupError:
+            state = _State()
+            self._state.set(state)
+            return state
+
     def __enter__(self) -> AbstractUnitOfWork:
+        if self._local.depth > 1:
+            self._local.savepoints.append(self._savepoint())
         return self
 
-    def __exit__(self, *args):
-        self.rollback()
+    def __exit__(self, exc_type, *args):
+        if self._local.depth <= 1:  # Outermost block decides for nested ones
+            if exc_type is not None or self.players.seen or self.rooms.seen:
+                self._count("rollbacks")
+            self.rollback()
+        elif exc_type is not None:
+            self._count("savepoint_rollbacks")
+            self._rollback_to(self._local.savepoints.pop())
+        else:
+            self._release(self._local.savepoints.pop())
 
     def commit(self):
         """
-        Commit all changes made in this unit of work
+        Commit all changes made in this unit of work.
+        Inside a nested block it is deferred until the outermost block commits
         """
-        self._commit()
+        if self._local.depth > 1:
+            return
+
+        emitted = [
+            instance
+            for instance in chain(self.players.seen, self.rooms.seen)
+            if instance.has_events
+        ]
+        start = time.perf_counter()
+        try:
+            with tracing.span("commit"):
+                self._commit()
+        except exceptions.ConcurrencyConflict:
+            self._count("conflicts")
+            raise
+        finally:
+            self._local.commit_time += time.perf_counter() - start
+
+        self._count("commits")
+        self._local.emitted.extend(emitted)
+
+    def pop_commit_time(self) -> float:
+        """
+        Get seconds the current thread spent committing since the last call
+
+        Returns:
+            float: Seconds
+        """
+        commit_time, self._local.commit_time = self._local.commit_time, 0.0
+        return commit_time
+
+    def _count(self, counter: str) -> None:
+        with self._counters_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
 
     def collect_new_events(self):
         """
-        Collect all new events from all instances in the repository
+        Collect new events from instances committed by the current thread
 
         Yields:
             Event: New event
         """
-        for instance in self.players.seen:
-            if hasattr(instance, "events") and isinstance(instance.events, list):
-                while instance.events:
-                    yield instance.events.pop(0)
+        emitted = self._local.emitted
+        while emitted:
+            instance = emitted.popleft()
+            while instance.events:
+                yield instance.events.popleft()
+
+    def _savepoint(self) -> Any:
+        return (self.players.savepoint(), self.rooms.savepoint())
+
+    def _rollback_to(self, savepoint: Any) -> None:
+        players, rooms = savepoint
+        self.players.rollback_to(players)
+        self.rooms.rollback_to(rooms)
 
-        for instance in self.rooms.seen:
-            if hasattr(instance, "events") and isinstance(instance.events, list):
-                while instance.events:
-                    yield instance.events.pop(0)
+    def _release(self, savepoint: Any) -> None:
+        players, rooms = savepoint
+        self.players.release(players)
+        self.rooms.release(rooms)
 
     @abc.abstractmethod
     def _commit(self):
@@ -57,27 +172,142 @@ class AbstractUnitOfWork(abc.ABC):
         """
         raise NotImplementedError
 
+    @abc.abstractmethod
+    def close(self) -> None:
+        """
+        Release resources held by this unit of work, e.g. at shutdown
+
+        Raises:
+            NotImplementedError: Not implemented
+        """
+        raise NotImplementedError
+
 
 class RamUnitOfWork(AbstractUnitOfWork):
     def __init__(
         self,
         players: repository.RamPlayerRepository,
         rooms: repository.RamRoomRepository,
+        persistence: Optional[RamPersistence] = None,
     ):
+        super().__init__()
         self.players: repository.RamPlayerRepository = players
         self.rooms: repository.RamRoomRepository = rooms
+        self.persistence: Optional[RamPersistence] = persistence
+        self._commit_lock = threading.Lock()  # Commits of both repositories are atomic
+
+    def __enter__(self) -> AbstractUnitOfWork:
+        if self._local.depth == 0:
+            self.players.begin()
+            self.rooms.begin()
 
-        self.last_committed_players = self.players.copy()
-        self.last_committed_rooms = self.rooms.copy()
+        self._local.depth += 1
+        return super().__enter__()
+
+    def __exit__(self, *args):
+        super().__exit__(*args)
+        self._local.depth -= 1
+
+        if self._local.depth == 0:
+            self.players.end()
+            self.rooms.end()
 
     def _commit(self):
         logger.debug("Commiting changes in RamUnitOfWork")
 
-        self.last_committed_players = self.players.copy()
-        self.last_committed_rooms = self.rooms.copy()
+        with self._commit_lock:
+            players = self.players.prepare()
+            rooms = self.rooms.prepare()
+
+            if self.persistence is not None:
+                self.persistence.append(players, rooms)
+
+            self.players.commit()
+            self.rooms.commit()
+
+            if self.persistence is not None and self.persistence.should_snapshot():
+                self.persistence.snapshot(self.players.all(), self.rooms.all())
 
     def rollback(self):
         logger.debug("Rolling back changes in RamUnitOfWork")
 
-        self.players = self.last_committed_players.copy()
-        self.rooms = self.last_committed_rooms.copy()
+        self.players.rollback()
+        self.rooms.rollback()
+
+    def close(self) -> None:
+        if self.persistence is not None:
+            self.persistence.close()
+
+
+class SqlUnitOfWork(AbstractUnitOfWork):
+    def __init__(
+        self,
+        engine: Engine,
+        players: repository.SqlPlayerRepository,
+        rooms: repository.SqlRoomRepository,
+    ):
+        super().__init__()
+        self.engine: Engine = engine
+        self.players: repository.SqlPlayerRepository = players
+        self.rooms: repository.SqlRoomRepository = rooms
+
+    def __enter__(self) -> AbstractUnitOfWork:
+        if self._local.depth == 0:
+            self._local.connection = self.engine.connect()
+            self._local.connection.begin()
+            self.players.begin(self._local.connection)
+            self.rooms.begin(self._local.connection)
+
+        self._local.depth += 1
+        return super().__enter__()
+
+    def __exit__(self, *args):
+        super().__exit__(*args)
+        self._local.depth -= 1
+
+        if self._local.depth == 0:
+            self.players.end()
+            self.rooms.end()
+            self._local.connection.close()
+            self._local.connection = None
+
+    def _savepoint(self) -> Any:
+        # SAVEPOINT keeps the transaction usable if a statement fails inside
+        # the nested block, e.g. PostgreSQL aborts the whole transaction then.
+        # Nested blocks run inside the outer one, which opened the connection
+        connection = cast("Connection", self._local.connection)
+        return (super()._savepoint(), connection.begin_nested())
+
+    def _rollback_to(self, savepoint: Any) -> None:
+        repositories, nested = savepoint
+        super()._rollback_to(repositories)
+        nested.rollback()
+
+    def _release(self, savepoint: Any) -> None:
+        repositories, nested = savepoint
+        super()._release(repositories)
+        nested.commit()
+
+    def _commit(self):
+        logger.debug("Commiting changes in SqlUnitOfWork")
+
+        try:
+            # Players first, rooms reference them
+            self.players.flush()
+            self.rooms.flush()
+            self._local.connection.commit()
+        except IntegrityError as e:  # Unique key taken by a concurrent transaction
+            raise exceptions.ConcurrencyConflict(str(e)) from e
+
+    def rollback(self):
+        logger.debug("Rolling back changes in SqlUnitOfWork")
+
+        self.players.rollback()
+        self.rooms.rollback()
+        if self._local.connection is not None:
+            self._local.connection.rollback()
+
+    def close(self) -> None:
+        # The engine is shared by every unit of work of the process, see
+        # orm.get_engine, so its connections are closed with the process
+        pass
@@ -0,0 +1,58 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from domain import rooms
+from service_player import unit_of_work
+
+RoomsCursor = Tuple[datetime, str]  # Creation time and id of the last room on page
+
+
+def list_rooms(
+    uow: unit_of_work.AbstractUnitOfWork,
+    limit: int,
+    free_slots: bool = False,
+    creator_id: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    after: Optional[RoomsCursor] = None,
+) -> Tuple[List[rooms.Room], Optional[RoomsCursor]]:
+    """
+    List rooms ordered by creation time, a page at a time.
+
+    Pages are read from sorted indexes starting right after the cursor, so
+    the cost of a page does not depend on how many pages came before it
+
+    Args:
+        uow (unit_of_work.AbstractUnitOfWork): Unit of work
+        limit (int): Maximum number of rooms on page
+        free_slots (bool): Only rooms players can still join
+        creator_id (Optional[str]): Only room created by player
+        created_after (Optional[datetime]): Only rooms created at or after
+        after (Optional[RoomsCursor]): Cursor returned with the previous page
+
+    Returns:
+        Tuple[List[rooms.Room], Optional[RoomsCursor]]: Rooms and cursor of
+            the next page, None if it is the last one
+    """
+    if creator_id is not None:
+        # Player can create one room, there is nothing to paginate
+        room = uow.rooms.get(creator_id=creator_id)
+        found = [
+            room
+            for room in ([room] if room is not None else [])
+            if (not free_slots or not room.is_full)
+            and (created_after is None or room.created_at >= created_after)
+            and (after is None or (room.created_at, room.id) > after)
+        ]
+        return found[:limit], None
+
+    found = uow.rooms.find_range(
+        "open_created_at" if free_slots else "created_at",
+        start=created_after,
+        limit=limit + 1,  # One more to know if there is a next page
+        after=after,
+    )
+    if len(found) <= limit:
+        return found, None
+
+    last = found[limit - 1]
+    return found[:limit], (last.created_at, last.id)
@@ -0,0 +1,37 @@
+import config
+import pytest
+from adapters import orm
+from service_player import tracing
+
+
+@pytest.fixture
+def sql_database():
+    engine = orm.get_engine(config.get_database_uri())
+    orm.metadata.drop_all(engine)
+    orm.metadata.create_all(engine)
+    yield engine
+    orm.metadata.drop_all(engine)
+
+
+@pytest.fixture
+def sql_file_database(tmp_path, monkeypatch):
+    """
+    Database in a file, unlike in-memory SQLite it runs transactions
+    of different threads at the same time
+    """
+    monkeypatch.setenv("DATABASE_URI", f"sqlite:///{tmp_path / 'test.db'}")
+    engine = orm.get_engine(config.get_database_uri())
+    orm.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def traced():
+    """
+    Trace everything, spans are kept in the yielded exporter
+    """
+    exporter = tracing.MemoryExporter()
+    tracing.set_tracer(tracing.Tracer(exporter, sample_rate=1.0))
+    yield exporter
+    tracing.set_tracer(tracing.Tracer(tracing.NullExporter(), sample_rate=0.0))
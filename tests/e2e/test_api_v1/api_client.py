@@ -1,6 +1,10 @@
-from typing import Dict
+import contextlib
+from typing import ContextManager, Dict, Iterator, List, Optional
 
+from entrypoints.fastapi_app.deps import get_message_bus
 from fastapi.testclient import TestClient
+from service_player import messagebus
+from starlette.testclient import WebSocketTestSession
 
 from engine import config
 from engine.entrypoints.fastapi_app.app import create_app
@@ -8,10 +12,27 @@ from engine.entrypoints.fastapi_app.app import create_app
 _client = TestClient(create_app())
 
 
-def post_create_player(username: str) -> Dict:
+@contextlib.contextmanager
+def override_message_bus(message_bus: messagebus.MessageBus) -> Iterator[TestClient]:
+    """
+    Make the API use message_bus instead of the default one
+    """
+    _client.app.dependency_overrides[get_message_bus] = lambda: message_bus
+    try:
+        yield _client
+    finally:
+        _client.app.dependency_overrides.clear()
+
+
+def idempotency_headers(idempotency_key: Optional[str]) -> Dict[str, str]:
+    return {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+
+
+def post_create_player(username: str, idempotency_key: Optional[str] = None) -> Dict:
     return _client.post(
         f"{config.get_api_url()}/v1/players",
         params={"username": username},
+        headers=idempotency_headers(idempotency_key),
     ).json()
 
 
@@ -21,17 +42,40 @@ def get_room(room_id: str) -> Dict:
     ).json()
 
 
-def post_create_room(creator_id: str) -> Dict:
+def get_player_room(player_id: str) -> Dict:
+    return _client.get(
+        f"{config.get_api_url()}/v1/players/{player_id}/room",
+    ).json()
+
+
+def get_rooms(**params) -> Dict:
+    return _client.get(
+        f"{config.get_api_url()}/v1/rooms",
+        params=params,
+    ).json()
+
+
+def post_create_room(creator_id: str, **params) -> Dict:
     return _client.post(
         f"{config.get_api_url()}/v1/rooms",
-        params={"creator_id": creator_id},
+        params={"creator_id": creator_id, **params},
     ).json()
 
 
-def join_room(room_id: str, player_id: str) -> Dict:
+def join_room(
+    room_id: str, player_id: str, idempotency_key: Optional[str] = None
+) -> Dict:
     return _client.post(
         f"{config.get_api_url()}/v1/rooms/{room_id}/join",
         params={"player_id": player_id},
+        headers=idempotency_headers(idempotency_key),
+    ).json()
+
+
+def quick_join(player_id: str) -> Dict:
+    return _client.post(
+        f"{config.get_api_url()}/v1/rooms/quick-join",
+        params={"player_id": player_id},
     ).json()
 
 
@@ -40,3 +84,20 @@ def leave_room(room_id: str, player_id: str) -> Dict:
         f"{config.get_api_url()}/v1/rooms/{room_id}/leave",
         params={"player_id": player_id},
     ).json()
+
+
+def room_events(room_id: str) -> ContextManager[WebSocketTestSession]:
+    return _client.websocket_connect(
+        f"{config.get_api_url()}/v1/rooms/{room_id}/events".replace("http", "ws", 1)
+    )
+
+
+def post_batch(batch: List[Dict]) -> Dict:
+    return _client.post(
+        f"{config.get_api_url()}/v1/batch",
+        json={"commands": batch},
+    ).json()
+
+
+def get_metrics() -> str:
+    return _client.get(f"{config.get_api_url()}/metrics").text
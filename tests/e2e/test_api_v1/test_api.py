@@ -1,3 +1,18 @@
+import base64
+import threading
+from datetime import datetime, timezone
+
+import factories
+import pytest
+from domain import commands
+from entrypoints.fastapi_app import deps
+from entrypoints.fastapi_app.app import create_app
+from fastapi.testclient import TestClient
+from service_player import tracing
+from starlette.websockets import WebSocketDisconnect
+
+from engine import config
+
 from . import api_client
 
 
@@ -138,6 +153,36 @@ def test_get_room():
     assert response["data"]["players"] == [creator_id]
 
 
+def test_get_player_room():
+    response = api_client.post_create_player(username="testuser10")
+    creator_id = response["data"]["id"]
+
+    response = api_client.post_create_player(username="testuser11")
+    player_id = response["data"]["id"]
+
+    response = api_client.get_player_room(player_id=player_id)
+    assert_default_format(response)
+    assert response["status_code"] == 404
+
+    response = api_client.post_create_room(creator_id=creator_id)
+    room_id = response["data"]["id"]
+    api_client.join_room(room_id=room_id, player_id=player_id)
+
+    response = api_client.get_player_room(player_id=player_id)
+    assert_default_format(response)
+    assert response["status_code"] == 200
+    assert response["data"]["id"] == room_id
+    assert response["data"]["players"] == [creator_id, player_id]
+
+    response = api_client.post_create_room(creator_id=player_id)
+    assert_default_format(response)
+    assert response["status_code"] == 409
+
+    response = api_client.get_player_room(player_id="invalid")
+    assert_default_format(response)
+    assert response["status_code"] == 404
+
+
 def test_leave_room():
     response = api_client.post_create_player(username="testuser7")
 
@@ -206,3 +251,234 @@ def test_leave_room():
 
     assert response["status_code"] == 200
     assert response["success"] is True
+
+
+def test_list_rooms():
+    created_after = datetime.now(timezone.utc).isoformat()
+    room_ids = []
+    for i in range(3):
+        response = api_client.post_create_player(username=f"lister{i}")
+        creator_id = response["data"]["id"]
+        response = api_client.post_create_room(creator_id=creator_id, capacity=i + 1)
+        room_ids.append(response["data"]["id"])
+
+    response = api_client.get_rooms(created_after=created_after, limit=2)
+    assert_default_format(response)
+    assert response["status_code"] == 200
+    assert [room["id"] for room in response["data"]["rooms"]] == room_ids[:2]
+    assert response["data"]["rooms"][0]["capacity"] == 1
+
+    response = api_client.get_rooms(
+        created_after=created_after, limit=2, cursor=response["data"]["next_cursor"]
+    )
+    assert [room["id"] for room in response["data"]["rooms"]] == room_ids[2:]
+    assert response["data"]["next_cursor"] is None
+
+    response = api_client.get_rooms(created_after=created_after, free_slots=True)
+    assert [room["id"] for room in response["data"]["rooms"]] == room_ids[1:]
+
+    response = api_client.get_rooms(creator_id=creator_id)
+    assert [room["id"] for room in response["data"]["rooms"]] == room_ids[2:]
+
+    response = api_client.get_rooms(cursor="invalid")
+    assert_default_format(response)
+    assert response["status_code"] == 400
+
+
+def test_quick_join():
+    response = api_client.post_create_player(username="quickjoiner")
+    player_id = response["data"]["id"]
+
+    response = api_client.quick_join(player_id=player_id)
+    assert_default_format(response)
+    assert response["status_code"] == 200
+    room_id = response["data"]["id"]
+
+    response = api_client.get_player_room(player_id=player_id)
+    assert response["data"]["id"] == room_id
+
+    response = api_client.quick_join(player_id=player_id)
+    assert_default_format(response)
+    assert response["status_code"] == 409
+
+    response = api_client.quick_join(player_id="invalid")
+    assert_default_format(response)
+    assert response["status_code"] == 404
+
+
+def test_batch():
+    response = api_client.post_create_player(username="party_leader")
+    leader_id = response["data"]["id"]
+
+    response = api_client.post_batch(
+        [
+            {"type": "CreatePlayer", "username": "party_member1"},
+            {"type": "CreatePlayer", "username": "party_member2"},
+            {"type": "CreateRoom", "creator_id": leader_id, "capacity": 4},
+        ]
+    )
+    assert_default_format(response)
+    assert response["status_code"] == 200
+    results = response["data"]["results"]
+    assert [result.get("username") for result in results[:2]] == [
+        "party_member1",
+        "party_member2",
+    ]
+    room_id = results[2]["id"]
+
+    response = api_client.post_batch(
+        [
+            {"type": "JoinRoom", "room_id": room_id, "player_id": results[0]["id"]},
+            {"type": "JoinRoom", "room_id": "invalid", "player_id": results[1]["id"]},
+        ]
+    )
+    assert_default_format(response)
+    assert response["status_code"] == 404
+    assert response["data"] == {"index": 1}
+
+    # First join was rolled back with the batch
+    response = api_client.get_room(room_id=room_id)
+    assert response["data"]["players"] == [leader_id]
+
+
+def test_overloaded():
+    message_bus = factories.create_message_bus(
+        factories.create_uow("ram"), asynchronous=True, max_queue_size=0
+    )
+
+    with api_client.override_message_bus(message_bus) as client:
+        response = api_client.post_create_player(username="overloaded")
+        assert_default_format(response)
+        assert response["status_code"] == 503
+        assert response["success"] is False
+
+        response = client.post(
+            f"{config.get_api_url()}/v1/rooms/quick-join",
+            params={"player_id": "overloaded"},
+        )
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "1"
+
+
+def test_timeout():
+    release = threading.Event()
+    message_bus = factories.create_message_bus(
+        factories.create_uow("ram"),
+        command_handlers={commands.CreatePlayer: lambda command: release.wait(5)},
+        asynchronous=True,
+        command_timeout=0.01,
+    )
+
+    with api_client.override_message_bus(message_bus):
+        response = api_client.post_create_player(username="slow")
+        release.set()
+
+    assert_default_format(response)
+    assert response["status_code"] == 504
+    assert response["success"] is False
+
+
+def test_metrics():
+    api_client.post_create_player(username="measured")
+
+    metrics = api_client.get_metrics()
+
+    assert "# TYPE messagebus_handler_seconds histogram" in metrics
+    assert 'messagebus_commands_total{command="CreatePlayer",outcome="success"}' in (
+        metrics
+    )
+
+
+def test_idempotency_key():
+    first = api_client.post_create_player("retried", idempotency_key="create-1")
+    retried = api_client.post_create_player("retried", idempotency_key="create-1")
+
+    assert retried == first
+    assert first["status_code"] == 201
+
+    room_id = api_client.post_create_room(creator_id=first["data"]["id"])["data"]["id"]
+    player_id = api_client.post_create_player("retried2")["data"]["id"]
+    responses = [
+        api_client.join_room(room_id, player_id, idempotency_key="join-1")
+        for _ in range(2)
+    ]
+
+    assert [response["status_code"] for response in responses] == [200, 200]
+    response = api_client.join_room(room_id, player_id)
+    assert response["status_code"] == 409
+
+    reused = api_client.post_create_player("other", idempotency_key="create-1")
+    assert reused["status_code"] == 422
+
+
+def test_tracing(traced):
+    api_client.post_create_player(username="traced")
+
+    spans = {span.name: span for span in traced.spans}
+    request = spans["POST /v1/players/"]
+    assert request.parent_id is None
+    assert request.attributes["status_code"] == 201
+    assert spans["handle CreatePlayer"].parent_id == request.context.span_id
+    assert spans["handle CreatePlayer"].context.trace_id == request.context.trace_id
+
+
+def test_room_events():
+    creator_id = api_client.post_create_player("subscribed creator")["data"]["id"]
+    player_id = api_client.post_create_player("subscribed player")["data"]["id"]
+    room_id = api_client.post_create_room(creator_id=creator_id)["data"]["id"]
+
+    with api_client.room_events(room_id) as websocket:
+        snapshot = websocket.receive_json()
+        api_client.join_room(room_id, player_id)
+        joined = websocket.receive_json()
+        api_client.leave_room(room_id, player_id)
+        left = websocket.receive_json()
+
+    assert snapshot["type"] == "snapshot"
+    assert snapshot["room"]["players"] == [creator_id]
+    assert joined["type"] == "PlayerJoinedRoom"
+    assert joined["player_id"] == player_id
+    assert joined["room"]["players"] == [creator_id, player_id]
+    assert left["type"] == "PlayerLeftRoom"
+    assert left["room"]["players"] == [creator_id]
+    assert left["sequence"] == joined["sequence"] + 1 == snapshot["sequence"] + 2
+    assert left["version"] > joined["version"] > snapshot["version"]
+
+
+def test_room_events_of_unknown_room():
+    with pytest.raises(WebSocketDisconnect) as error:
+        with api_client.room_events("unknown") as websocket:
+            websocket.receive_json()
+
+    assert error.value.code == 1008
+
+
+def test_unit_of_work_is_closed_at_shutdown(monkeypatch):
+    closed = []
+    monkeypatch.setattr(deps.message_bus.uow, "close", lambda: closed.append(True))
+
+    with TestClient(create_app()):
+        assert closed == []
+
+    assert closed == [True]
+
+
+def test_list_rooms_with_cursor_without_time_zone():
+    cursor = base64.urlsafe_b64encode(b"2026-01-01T00:00:00|room").decode()
+    response = api_client.get_rooms(cursor=cursor)
+    assert response["status_code"] == 200
+
+    cursor = base64.urlsafe_b64encode(b"yesterday|room").decode()
+    response = api_client.get_rooms(cursor=cursor)
+    assert response["status_code"] == 400
+
+
+def test_unsampled_requests_record_no_spans(traced):
+    tracing.set_tracer(tracing.Tracer(traced, sample_rate=0.0))
+    api_client.post_create_player(username="not traced")
+
+    assert traced.spans == []
+
+
+def test_message_bus_runs_configured_lanes():
+    assert len(deps.message_bus.lanes) == config.get_message_bus_lanes() > 1
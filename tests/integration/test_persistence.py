@@ -0,0 +1,113 @@
+import gc
+import os
+import pickle
+import zlib
+
+import factories
+import pytest
+from adapters import persistence
+from domain import commands
+from service_player import handlers, unit_of_work
+
+
+def create_persistent_uow(directory, **kwargs) -> unit_of_work.RamUnitOfWork:
+    uow = unit_of_work.RamUnitOfWork(
+        factories.create_players_repository("ram"),
+        factories.create_rooms_repository("ram"),
+        persistence.RamPersistence(str(directory), **kwargs),
+    )
+    uow.persistence.recover(uow.players, uow.rooms)
+    return uow
+
+
+def populate(uow: unit_of_work.RamUnitOfWork):
+    creator = handlers.create_player(commands.CreatePlayer("creator"), uow)
+    first = handlers.create_player(commands.CreatePlayer("first"), uow)
+    second = handlers.create_player(commands.CreatePlayer("second"), uow)
+    room = handlers.create_room(commands.CreateRoom(creator.id, capacity=3), uow)
+    handlers.join_room(commands.JoinRoom(room.id, first.id), uow)
+    handlers.join_room(commands.JoinRoom(room.id, second.id), uow)
+    handlers.leave_room(commands.LeaveRoom(room.id, creator.id), uow)
+    return room
+
+
+class TestRamPersistence:
+    def assert_recovered(self, uow: unit_of_work.RamUnitOfWork, room_id: str):
+        assert len(uow.players) == 3
+        assert len(uow.rooms) == 1
+
+        room = uow.rooms.get(id=room_id)
+        assert room.version == 4
+        assert [player.username for player in room.players] == ["first", "second"]
+        assert room.players[0] is uow.players.get(username="first")
+        assert room.capacity == 3
+        assert room.created_at.tzinfo is not None
+        assert uow.rooms.find_range("open_created_at") == [room]
+
+    def test_recovers_from_log(self, tmp_path):
+        uow = create_persistent_uow(tmp_path)
+        room = populate(uow)
+        uow.persistence.close()
+
+        self.assert_recovered(create_persistent_uow(tmp_path), room.id)
+
+    def test_recovers_from_snapshot_and_log_tail(self, tmp_path):
+        uow = create_persistent_uow(tmp_path, snapshot_every=5)
+        room = populate(uow)
+        uow.persistence.close()
+
+        files = sorted(os.listdir(tmp_path))
+        assert files == ["snapshot-0000000000000005.pickle", "wal-0000000000000006.log"]
+
+        self.assert_recovered(create_persistent_uow(tmp_path), room.id)
+
+    def test_ignores_torn_log_tail(self, tmp_path):
+        uow = create_persistent_uow(tmp_path)
+        room = populate(uow)
+        uow.persistence.close()
+
+        (log,) = tmp_path.glob("wal-*.log")
+        with open(log, "ab") as file:
+            file.write(b"\x10\x00\x00\x00garbage")
+
+        uow = create_persistent_uow(tmp_path)
+        self.assert_recovered(uow, room.id)
+
+        handlers.create_player(commands.CreatePlayer("after-crash"), uow)
+        uow.persistence.close()
+
+        assert create_persistent_uow(tmp_path).players.get(username="after-crash")
+
+    def test_truncates_torn_log_tail(self, tmp_path):
+        create_persistent_uow(tmp_path).persistence.close()
+
+        (log,) = tmp_path.glob("wal-*.log")
+        with open(log, "ab") as file:
+            file.write(b"\x10\x00\x00\x00garbage")
+
+        uow = create_persistent_uow(tmp_path)  # Continues writing the same segment
+        handlers.create_player(commands.CreatePlayer("test"), uow)
+        uow.persistence.close()
+
+        assert create_persistent_uow(tmp_path).players.get(username="test")
+
+    def test_recovers_rooms_logged_without_capacity_as_unlimited(self, tmp_path):
+        record = pickle.dumps(
+            (1, [("p", "creator", 1)], [("r", "p", 1, ["p"])])  # Older format
+        )
+        (tmp_path / "wal-0000000000000001.log").write_bytes(
+            persistence._HEADER.pack(len(record), zlib.crc32(record)) + record
+        )
+
+        room = create_persistent_uow(tmp_path).rooms.get(id="r")
+
+        assert room.capacity is None
+        assert not room.is_full
+
+    def test_enables_gc_after_failed_recovery(self, tmp_path):
+        (tmp_path / "snapshot-0000000000000001.pickle").write_bytes(b"garbage")
+
+        with pytest.raises(pickle.UnpicklingError):
+            create_persistent_uow(tmp_path)
+
+        assert gc.isenabled()
@@ -0,0 +1,229 @@
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+import factories
+import pytest
+from domain import players, rooms
+from service_player import exceptions
+
+
+def add_rooms(uow, count: int) -> None:
+    """
+    Add `count` rooms, room ri has creator pi-0 and players pi-1 ... pi-i
+    """
+    with uow:
+        for i in range(count):
+            members = [
+                players.Player(id=f"p{i}-{j}", username=f"user{i}-{j}")
+                for j in range(i + 1)
+            ]
+            for player in members:
+                uow.players.add(player)
+            uow.rooms.add(rooms.Room(id=f"r{i}", creator=members[0], players=members))
+        uow.commit()
+
+
+class IndexTests:
+    uow_type: str
+
+    def test_find_rooms_by_player(self):
+        uow = factories.create_uow(self.uow_type)
+        add_rooms(uow, 3)
+
+        assert [room.id for room in uow.rooms.find("player_id", "p2-1")] == ["r2"]
+        assert [room.id for room in uow.rooms.find("player_id", "p0-0")] == ["r0"]
+        assert uow.rooms.find("player_id", "unknown") == []
+
+    def test_find_range(self):
+        uow = factories.create_uow(self.uow_type)
+        add_rooms(uow, 5)
+
+        found = uow.rooms.find_range("players_count", start=2, stop=4)
+        assert [room.id for room in found] == ["r1", "r2"]
+
+        found = uow.rooms.find_range("players_count", stop=5, limit=2, reverse=True)
+        assert [room.id for room in found] == ["r3", "r2"]
+
+    def test_index_is_updated_on_commit(self):
+        uow = factories.create_uow(self.uow_type)
+        add_rooms(uow, 2)
+        player = uow.players.get(id="p1-1")
+
+        with uow:
+            uow.rooms.get(id="r1").leave(player)
+            uow.commit()
+
+        assert uow.rooms.find("player_id", "p1-1") == []
+        found = uow.rooms.find_range("players_count", start=1, stop=2)
+        assert [room.id for room in found] == ["r0", "r1"]
+
+        with uow:
+            uow.rooms.get(id="r0").join(player)
+            uow.commit()
+
+        assert [room.id for room in uow.rooms.find("player_id", "p1-1")] == ["r0"]
+
+    def test_transaction_sees_its_own_changes(self):
+        uow = factories.create_uow(self.uow_type)
+        add_rooms(uow, 2)
+        player = uow.players.get(id="p1-1")
+
+        with uow:
+            uow.rooms.get(id="r1").leave(player)
+            uow.rooms.get(id="r0").join(player)
+
+            found = uow.rooms.find("player_id", "p1-1")
+            assert [room.id for room in found] == ["r0"]
+            assert all(room in uow.rooms.seen for room in found)
+
+            found = uow.rooms.find_range("players_count", stop=2)
+            assert [room.id for room in found] == ["r1"]
+
+        # Rolled back
+        assert [room.id for room in uow.rooms.find("player_id", "p1-1")] == ["r1"]
+
+    def test_player_can_be_in_one_room(self):
+        uow = factories.create_uow(self.uow_type)
+        add_rooms(uow, 2)
+        player = uow.players.get(id="p1-1")
+
+        with pytest.raises(exceptions.ConcurrencyConflict):
+            with uow:
+                uow.rooms.get(id="r0").join(player)
+                uow.commit()
+
+        with pytest.raises(exceptions.ConcurrencyConflict):
+            with uow:
+                uow.rooms.add(rooms.Room(id="r2", creator=player))
+                uow.commit()
+
+        assert [room.id for room in uow.rooms.find("player_id", "p1-1")] == ["r1"]
+
+    def test_partial_index(self):
+        uow = factories.create_uow(self.uow_type)
+        with uow:
+            for i in range(3):
+                creator = players.Player(id=f"p{i}", username=f"user{i}")
+                uow.players.add(creator)
+                uow.rooms.add(rooms.Room(id=f"r{i}", creator=creator, capacity=i + 1))
+            uow.commit()
+
+        found = uow.rooms.find_range("open_created_at")
+        assert [room.id for room in found] == ["r1", "r2"]
+        found = uow.rooms.find_range("open_free_slots", reverse=True)
+        assert [room.id for room in found] == ["r2", "r1"]
+
+        with uow:
+            uow.rooms.get(id="r1").join(players.Player(id="p0", username="user0"))
+
+            found = uow.rooms.find_range("open_created_at")
+            assert [room.id for room in found] == ["r2"]
+
+    def test_rooms_without_capacity_are_never_full(self):
+        uow = factories.create_uow(self.uow_type)
+        with uow:
+            for i, capacity in enumerate([None, 2, 3]):
+                creator = players.Player(id=f"p{i}", username=f"user{i}")
+                uow.players.add(creator)
+                room = rooms.Room(id=f"r{i}", creator=creator, capacity=capacity)
+                uow.rooms.add(room)
+            uow.commit()
+
+        found = uow.rooms.find_range("open_created_at")
+        assert [room.id for room in found] == ["r0", "r1", "r2"]
+        found = uow.rooms.find_range("open_free_slots")  # Fullest first
+        assert [room.id for room in found] == ["r1", "r2", "r0"]
+
+    def test_find_range_after_cursor(self):
+        uow = factories.create_uow(self.uow_type)
+        created_at = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        with uow:
+            for i in range(5):
+                creator = players.Player(id=f"p{i}", username=f"user{i}")
+                uow.players.add(creator)
+                uow.rooms.add(
+                    rooms.Room(
+                        id=f"r{i}",
+                        creator=creator,
+                        # Pairs r0, r4 and r1, r3 were created at the same time
+                        created_at=created_at + timedelta(seconds=min(i, 4 - i)),
+                    )
+                )
+            uow.commit()
+
+        pages = []
+        after = None
+        while page := uow.rooms.find_range("created_at", limit=2, after=after):
+            pages.append([room.id for room in page])
+            after = (page[-1].created_at, page[-1].id)
+
+        assert pages == [["r0", "r4"], ["r1", "r3"], ["r2"]]
+
+        found = uow.rooms.find_range(
+            "created_at", reverse=True, after=(created_at + timedelta(seconds=1), "r3")
+        )
+        assert [room.id for room in found] == ["r1", "r4", "r0"]
+
+    def test_created_at_in_other_time_zone(self):
+        uow = factories.create_uow(self.uow_type)
+        created_at = datetime(2026, 1, 1, 12, tzinfo=timezone(timedelta(hours=2)))
+        with uow:
+            creator = players.Player(id="p", username="user")
+            uow.players.add(creator)
+            uow.rooms.add(rooms.Room(id="r", creator=creator, created_at=created_at))
+            uow.commit()
+
+        assert uow.rooms.get(id="r").created_at == created_at
+        same_time = datetime(2026, 1, 1, 10, tzinfo=timezone.utc)
+        later = same_time + timedelta(minutes=1)
+        assert uow.rooms.find_range("created_at", start=same_time) != []
+        assert uow.rooms.find_range("created_at", start=later) == []
+
+    def test_unknown_index(self):
+        uow = factories.create_uow(self.uow_type)
+
+        with pytest.raises(ValueError):
+            uow.rooms.find("unknown", 1)
+        with pytest.raises(ValueError):
+            uow.rooms.find_range("player_id")
+
+
+class TestRamIndexes(IndexTests):
+    uow_type = "ram"
+
+
+@pytest.mark.usefixtures("sql_database")
+class TestSqlIndexes(IndexTests):
+    uow_type = "sql"
+
+
+class TestRamRepository:
+    def test_readers_see_stored_instances_while_they_are_changed(self):
+        uow = factories.create_uow("ram")
+        add_rooms(uow, 2)
+        stop = threading.Event()
+
+        def change():  # Players move between rooms
+            while not stop.is_set():
+                with uow:
+                    player = uow.players.get(id="p1-1")
+                    source, target = uow.rooms.get(id="r1"), uow.rooms.get(id="r0")
+                    if player.id not in [member.id for member in source.players]:
+                        source, target = target, source
+                    source.leave(player)
+                    target.join(player)
+                    uow.commit()
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer = threading.Thread(target=change)
+        writer.start()
+        try:
+            for _ in range(100000):
+                assert uow.rooms.get(id="r0") is not None
+                assert uow.rooms.get(id="r1") is not None
+        finally:
+            stop.set()
+            writer.join()
+            sys.setswitchinterval(switch_interval)
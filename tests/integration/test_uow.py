@@ -1,7 +1,10 @@
 import contextlib
+import threading
 
 import factories
-from domain import players
+import pytest
+from domain import events, players, rooms
+from service_player import exceptions
 
 
 class TestRamUOWCreation:
@@ -40,3 +43,315 @@ class TestRamUOWCreation:
                         raise ValueError("oops")
 
         assert uow.players.get(username="test") is None
+
+    def test_nested_commit_is_deferred_to_outermost_block(self):
+        uow = factories.create_uow("ram")
+
+        with uow:
+            with uow:
+                uow.players.add(players.Player(id="1", username="first"))
+                uow.commit()
+            with uow:
+                uow.players.add(players.Player(id="2", username="second"))
+                uow.commit()
+
+            assert uow.players.get(username="first") is not None
+            assert len(uow.players) == 0  # Nothing committed yet
+            uow.commit()
+
+        assert len(uow.players) == 2
+
+    def test_nested_block_rolls_back_only_its_changes(self):
+        uow = factories.create_uow("ram")
+
+        with uow:
+            creator = players.Player(id="1", username="creator")
+            uow.players.add(creator)
+            uow.rooms.add(rooms.Room(id="10", creator=creator))
+            uow.commit()
+
+        with uow:
+            room = uow.rooms.get(id="10")
+            room.join(players.Player(id="2", username="first"))
+
+            with contextlib.suppress(ValueError):
+                with uow:
+                    room = uow.rooms.get(id="10")
+                    room.join(players.Player(id="3", username="second"))
+                    room.events.append(events.PlayerJoinedRoom(room, creator))
+                    uow.players.add(players.Player(id="3", username="second"))
+                    raise ValueError("oops")
+
+            assert uow.rooms.get(id="10") is room
+            assert [player.id for player in room.players] == ["1", "2"]
+            assert not room.has_events
+            assert uow.players.get(username="second") is None
+            assert list(uow.players.seen) == []
+            uow.commit()
+
+        assert [player.id for player in uow.rooms.get(id="10").players] == ["1", "2"]
+
+    def test_changes_are_isolated_until_commit(self):
+        uow = factories.create_uow("ram")
+
+        with uow:
+            creator = players.Player(id="1", username="creator")
+            uow.players.add(creator)
+            uow.rooms.add(rooms.Room(id="10", creator=creator))
+            uow.commit()
+
+        committed_room = uow.rooms.get(id="10")
+
+        with uow:
+            room = uow.rooms.get(id="10")
+            room.join(players.Player(id="2", username="other"))
+
+            assert room is not committed_room
+            assert uow.rooms.get(id="10") is room
+            assert len(committed_room.players) == 1
+
+        assert uow.rooms.get(id="10") is committed_room
+        assert len(committed_room.players) == 1
+
+    def test_commit_stores_only_changed_instances(self):
+        uow = factories.create_uow("ram")
+
+        with uow:
+            uow.players.add(players.Player(id="1", username="first"))
+            uow.players.add(players.Player(id="2", username="second"))
+            uow.commit()
+
+        first = uow.players.get(id="1")
+        second = uow.players.get(id="2")
+
+        with uow:
+            uow.players.get(id="1").username = "renamed"
+            uow.players.get(id="2")
+            uow.commit()
+
+        assert uow.players.get(id="1") is not first
+        assert uow.players.get(id="1").username == "renamed"
+        assert uow.players.get(id="2") is second
+
+
+
+    def test_collects_events_of_committed_instances_only(self):
+        uow = factories.create_uow("ram")
+
+        with uow:
+            player = players.Player(id="1", username="test")
+            player.events.append(events.PlayerCreated(player=player))
+            uow.players.add(player)
+            uow.commit()
+
+        with contextlib.suppress(ValueError):
+            with uow:
+                other = players.Player(id="2", username="other")
+                other.events.append(events.PlayerCreated(player=other))
+                uow.players.add(other)
+                raise ValueError("oops")
+
+        assert not uow.players.seen
+        assert [event.player.id for event in uow.collect_new_events()] == ["1"]
+        assert list(uow.collect_new_events()) == []
+    def test_concurrent_commit_conflicts(self):
+        uow = factories.create_uow("ram")
+
+        with uow:
+            creator = players.Player(id="1", username="creator")
+            uow.players.add(creator)
+            uow.players.add(players.Player(id="2", username="first"))
+            uow.players.add(players.Player(id="3", username="second"))
+            uow.rooms.add(rooms.Room(id="10", creator=creator))
+            uow.commit()
+
+        def join_in_other_transaction():
+            with uow:
+                uow.rooms.get(id="10").join(uow.players.get(id="3"))
+                uow.commit()
+
+        with uow:
+            room = uow.rooms.get(id="10")
+            room.join(uow.players.get(id="2"))
+
+            thread = threading.Thread(target=join_in_other_transaction)
+            thread.start()
+            thread.join()
+
+            with pytest.raises(exceptions.ConcurrencyConflict):
+                uow.commit()
+
+        room = uow.rooms.get(id="10")
+        assert [player.id for player in room.players] == ["1", "3"]
+        assert room.version == 2
+
+
+@pytest.mark.usefixtures("sql_database")
+class TestSqlUOWCreation:
+    def test_works(self):
+        uow = factories.create_uow("sql")
+
+        with uow:
+            uow.players.add(players.Player(id="123", username="test"))
+            uow.commit()
+
+        assert uow.players.get(username="test") is not None
+        assert len(uow.players) == 1
+
+    def test_rolls_back(self):
+        uow = factories.create_uow("sql")
+
+        with uow:
+            uow.players.add(players.Player(id="123", username="test"))
+
+        assert uow.players.get(username="test") is None
+
+    def test_rolls_back_if_exception(self):
+        uow = factories.create_uow("sql")
+
+        with contextlib.suppress(ValueError):
+            with uow:
+                with uow:
+                    uow.players.add(players.Player(id="123", username="test"))
+                    raise ValueError("oops")
+
+        assert uow.players.get(username="test") is None
+
+    def test_nested_block_rolls_back_only_its_changes(self):
+        uow = factories.create_uow("sql")
+
+        with uow:
+            creator = players.Player(id="1", username="creator")
+            uow.players.add(creator)
+            uow.rooms.add(rooms.Room(id="10", creator=creator))
+            uow.commit()
+
+        with uow:
+            uow.players.add(players.Player(id="2", username="first"))
+            with uow:
+                uow.rooms.get(id="10").join(uow.players.get(id="2"))
+                with contextlib.suppress(ValueError):
+                    with uow:
+                        room = uow.rooms.get(id="10")
+                        room.join(players.Player(id="3", username="second"))
+                        uow.players.add(players.Player(id="3", username="second"))
+                        raise ValueError("oops")
+
+            assert uow.players.get(username="second") is None
+            uow.commit()
+
+        room = uow.rooms.get(id="10")
+        assert [player.id for player in room.players] == ["1", "2"]
+        assert len(uow.players) == 2
+
+    def test_stores_room_members_in_join_order(self):
+        uow = factories.create_uow("sql")
+
+        with uow:
+            creator = players.Player(id="1", username="creator")
+            uow.players.add(creator)
+            uow.players.add(players.Player(id="2", username="first"))
+            uow.players.add(players.Player(id="3", username="second"))
+            uow.rooms.add(rooms.Room(id="10", creator=creator))
+            uow.commit()
+
+        with uow:
+            room = uow.rooms.get(id="10")
+            room.join(uow.players.get(id="3"))
+            room.join(uow.players.get(id="2"))
+            room.leave(uow.players.get(id="1"))
+            uow.commit()
+
+        room = uow.rooms.get(creator_id="1")
+        assert room.id == "10"
+        assert [player.username for player in room.players] == ["second", "first"]
+
+    def test_keeps_order_of_members_who_stay(self):
+        uow = factories.create_uow("sql")
+
+        with uow:
+            creator = players.Player(id="1", username="creator")
+            other = players.Player(id="4", username="other")
+            uow.players.add(creator)
+            uow.players.add(other)
+            uow.players.add(players.Player(id="2", username="first"))
+            uow.players.add(players.Player(id="3", username="second"))
+            room = rooms.Room(id="10", creator=creator)
+            room.join(uow.players.get(id="2"))
+            room.join(uow.players.get(id="3"))
+            uow.rooms.add(room)
+            uow.rooms.add(rooms.Room(id="11", creator=other))
+            uow.commit()
+
+        with uow:
+            room = uow.rooms.get(id="10")
+            other_room = uow.rooms.get(id="11")
+            room.leave(uow.players.get(id="2"))
+            other_room.join(uow.players.get(id="2"))
+            room.leave(uow.players.get(id="1"))
+            room.join(uow.players.get(id="1"))
+            uow.commit()
+
+        with uow:
+            room = uow.rooms.get(id="10")
+            other_room = uow.rooms.get(id="11")
+            assert [player.id for player in room.players] == ["3", "1"]
+            assert [player.id for player in other_room.players] == ["4", "2"]
+
+    def test_in_memory_database_runs_one_transaction_at_a_time(self):
+        uow = factories.create_uow("sql")
+        entered = threading.Event()
+
+        def other_transaction():
+            with uow:
+                entered.set()
+
+        with uow:
+            thread = threading.Thread(target=other_transaction)
+            thread.start()
+            assert not entered.wait(timeout=0.1)
+
+        assert entered.wait(timeout=5)
+        thread.join()
+
+    def test_closing_keeps_shared_engine_open(self):
+        factories.create_uow("sql").close()
+        uow = factories.create_uow("sql")
+
+        with uow:
+            uow.players.add(players.Player(id="123", username="test"))
+            uow.commit()
+
+        assert len(uow.players) == 1
+
+    @pytest.mark.usefixtures("sql_file_database")
+    def test_concurrent_commit_conflicts(self):
+        uow = factories.create_uow("sql")
+
+        with uow:
+            creator = players.Player(id="1", username="creator")
+            uow.players.add(creator)
+            uow.players.add(players.Player(id="2", username="first"))
+            uow.players.add(players.Player(id="3", username="second"))
+            uow.rooms.add(rooms.Room(id="10", creator=creator))
+            uow.commit()
+
+        def join_in_other_transaction():
+            with uow:
+                uow.rooms.get(id="10").join(uow.players.get(id="3"))
+                uow.commit()
+
+        with uow:
+            room = uow.rooms.get(id="10")
+            room.join(uow.players.get(id="2"))
+
+            thread = threading.Thread(target=join_in_other_transaction)
+            thread.start()
+            thread.join()
+
+            with pytest.raises(exceptions.ConcurrencyConflict):
+                uow.commit()
+
+        room = uow.rooms.get(id="10")
+        assert [player.id for player in room.players] == ["1", "3"]
+        assert room.version == 2
@@ -0,0 +1,54 @@
+import time
+
+import pytest
+from service_player import exceptions, idempotency
+
+
+class TestResultCache:
+    def test_returns_result_for_same_key(self):
+        cache = idempotency.ResultCache(max_size=10, ttl=60)
+
+        assert cache.get_or_add("key", lambda: "first") == ("first", True)
+        assert cache.get_or_add("key", lambda: "second") == ("first", False)
+        assert cache.get_or_add("other", lambda: "other") == ("other", True)
+
+    def test_evicts_least_recently_used(self):
+        cache = idempotency.ResultCache(max_size=2, ttl=60)
+        cache.get_or_add("a", lambda: "a")
+        cache.get_or_add("b", lambda: "b")
+        cache.get_or_add("a", lambda: "new a")  # Used, b is the oldest now
+        cache.get_or_add("c", lambda: "c")
+
+        assert len(cache) == 2
+        assert cache.get_or_add("a", lambda: "new a") == ("a", False)
+        assert cache.get_or_add("b", lambda: "new b") == ("new b", True)
+
+    def test_finished_results_expire(self):
+        cache = idempotency.ResultCache(max_size=10, ttl=0.01)
+        cache.get_or_add("running", lambda: "running")
+        cache.get_or_add("finished", lambda: "finished")
+        cache.finish("finished", "finished")
+        time.sleep(0.02)
+
+        assert cache.get_or_add("running", lambda: "new") == ("running", False)
+        assert cache.get_or_add("finished", lambda: "new") == ("new", True)
+
+    def test_discard_only_given_result(self):
+        cache = idempotency.ResultCache(max_size=10, ttl=60)
+        cache.get_or_add("key", lambda: "first")
+
+        cache.discard("key", "other")
+        assert cache.get_or_add("key", lambda: "new") == ("first", False)
+        cache.discard("key", "first")
+        assert cache.get_or_add("key", lambda: "new") == ("new", True)
+
+    def test_key_is_bound_to_fingerprint(self):
+        cache = idempotency.ResultCache(max_size=10, ttl=0.01)
+        cache.get_or_add("key", lambda: "first", fingerprint=("a",))
+
+        assert cache.get_or_add("key", lambda: "new", ("a",)) == ("first", False)
+        with pytest.raises(exceptions.IdempotencyKeyReused):
+            cache.get_or_add("key", lambda: "new", ("b",))
+        cache.finish("key", "first")
+        time.sleep(0.02)
+        assert cache.get_or_add("key", lambda: "new", ("b",)) == ("new", True)
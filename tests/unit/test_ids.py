@@ -0,0 +1,56 @@
+import threading
+import time
+
+import factories
+import pytest
+from domain import ids
+
+
+class TestUlidGenerator:
+    def test_ids_are_sorted_by_creation_time(self):
+        generator = ids.UlidGenerator()
+
+        first = generator()
+        time.sleep(0.002)
+        second = generator()
+
+        assert len(first) == len(second) == 26
+        assert first < second
+
+    def test_ids_are_monotonic_within_millisecond(self):
+        generator = ids.UlidGenerator()
+
+        generated = [generator() for _ in range(1000)]
+
+        assert generated == sorted(generated)
+        assert len(set(generated)) == len(generated)
+
+    def test_ids_are_unique_across_threads(self):
+        generator = ids.UlidGenerator()
+        generated: list[str] = []
+
+        def generate():
+            generated.extend(generator() for _ in range(1000))
+
+        threads = [threading.Thread(target=generate) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(set(generated)) == 4000
+
+
+class TestIdGeneratorFactory:
+    def test_generator_can_be_replaced(self):
+        ids.set_generator(factories.create_id_generator("uuid4"))
+        try:
+            assert len(ids.new_id()) == 36
+        finally:
+            ids.set_generator(factories.create_id_generator("ulid"))
+
+        assert len(ids.new_id()) == 26
+
+    def test_unknown_generator(self):
+        with pytest.raises(ValueError):
+            factories.create_id_generator("unknown")
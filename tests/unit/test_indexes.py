@@ -0,0 +1,99 @@
+import sys
+import threading
+from random import Random
+
+from adapters import indexes
+from domain import players, rooms
+
+
+def create_index(block_size: int) -> indexes.SortedIndex[players.Player]:
+    # Players are indexed by username as a number, negative ones are not
+    return indexes.SortedIndex(
+        "score",
+        key=lambda player: int(player.username),
+        where=lambda player: int(player.username) >= 0,
+        block_size=block_size,
+    )
+
+
+class TestMultiIndex:
+    def test_update_moves_only_changed_values(self):
+        index = indexes.MultiIndex(
+            "player_id", lambda room: [player.id for player in room.players]
+        )
+        members = [players.Player(str(i), str(i)) for i in range(4)]
+        room = rooms.Room("room", creator=members[0], players=members[:3])
+        index.update(room, None)
+
+        changed = rooms.Room("room", creator=members[0], players=members[1:])
+        index.update(changed, room)
+
+        assert index.find("0") == []
+        assert all(index.find(player.id) == [changed] for player in members[1:])
+
+
+class TestSortedIndex:
+    def test_queries_match_sorted_instances(self):
+        random = Random(0)
+        index = create_index(block_size=4)
+        stored = {}
+        for _ in range(1000):
+            id = str(random.randrange(50))
+            instance = players.Player(id, str(random.randrange(-10, 30)))
+            index.update(instance, stored.get(id))
+            stored[id] = instance
+
+        expected = sorted(
+            (int(player.username), player.id, player)
+            for player in stored.values()
+            if int(player.username) >= 0
+        )
+        instances = [player for _, _, player in expected]
+
+        assert index.find_range() == instances
+        assert index.find_range(start=5, stop=20) == [
+            player for value, _, player in expected if 5 <= value < 20
+        ]
+        assert index.find_range(limit=7, reverse=True) == instances[::-1][:7]
+        assert index.find(7) == [player for value, _, player in expected if value == 7]
+        assert all(len(block) <= 4 for block in index._blocks[0])
+
+        for reverse in (False, True):
+            pages, after = [], None
+            while page := index.find_range(limit=3, reverse=reverse, after=after):
+                pages.extend(page)
+                after = (int(page[-1].username), page[-1].id)
+            assert pages == (instances[::-1] if reverse else instances)
+
+    def test_readers_see_every_instance_while_it_is_updated(self):
+        index = create_index(block_size=8)
+        current = [players.Player(str(i), str(i)) for i in range(100)]
+        for player in current:
+            index.update(player, None)
+
+        stop = threading.Event()
+
+        def update():  # Single writer, like commits under the commit lock
+            random = Random(0)
+            while not stop.is_set():
+                i = random.randrange(len(current))
+                player = players.Player(str(i), str(random.randrange(1000)))
+                index.update(player, current[i])
+                current[i] = player
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer = threading.Thread(target=update)
+        writer.start()
+        try:
+            for _ in range(1000):
+                found = index.find_range()
+                values = [int(player.username) for player in found]
+                assert sorted(player.id for player in found) == sorted(
+                    player.id for player in current
+                )
+                assert values == sorted(values)
+        finally:
+            stop.set()
+            writer.join()
+            sys.setswitchinterval(switch_interval)
@@ -0,0 +1,834 @@
+import asyncio
+import threading
+import time
+
+import factories
+import pytest
+from domain import commands, events, players
+from service_player import exceptions, handlers, tracing, unit_of_work
+
+
+def bootstrap_test_async_message_bus(**kwargs):
+    return factories.create_message_bus(
+        uow=factories.create_uow("ram"), asynchronous=True, **kwargs
+    )
+
+
+class TestAsyncMessageBus:
+    def test_handle_async_returns_awaitable(self):
+        message_bus = bootstrap_test_async_message_bus()
+
+        async def scenario():
+            return await message_bus.handle_async(
+                commands.CreatePlayer(username="test")
+            )
+
+        player: players.Player = asyncio.run(scenario())
+
+        assert isinstance(player, players.Player)
+        assert message_bus.uow.players.get(username="test") is not None
+
+    def test_handle_returns_result_like_message_bus(self):
+        message_bus = bootstrap_test_async_message_bus()
+
+        player = message_bus.handle(commands.CreatePlayer(username="test")).get(5)
+
+        assert isinstance(player, players.Player)
+
+    def test_exception_is_raised_on_await(self):
+        message_bus = bootstrap_test_async_message_bus()
+
+        async def scenario():
+            return await message_bus.handle_async(commands.CreatePlayer(username=""))
+
+        with pytest.raises(exceptions.InvalidPlayerUsername):
+            asyncio.run(scenario())
+
+    def test_coroutine_handlers(self):
+        handled = []
+
+        async def create_player(
+            command: commands.CreatePlayer, uow: unit_of_work.AbstractUnitOfWork
+        ) -> players.Player:
+            await asyncio.sleep(0)
+            return handlers.create_player(command, uow)
+
+        async def player_created(event: events.PlayerCreated) -> None:
+            handled.append(event.player.username)
+
+        message_bus = bootstrap_test_async_message_bus(
+            command_handlers={commands.CreatePlayer: create_player},
+            event_handlers={events.PlayerCreated: [player_created]},
+        )
+
+        async def scenario():
+            player = await message_bus.handle_async(
+                commands.CreatePlayer(username="test")
+            )
+            for _ in range(100):  # Events are handled in background
+                if handled:
+                    break
+                await asyncio.sleep(0.01)
+            return player
+
+        player: players.Player = asyncio.run(scenario())
+
+        assert player.username == "test"
+        assert handled == ["test"]
+
+    def test_coroutine_handlers_of_lanes_have_separate_transactions(self):
+        first_entered, second_committed = asyncio.Event(), asyncio.Event()
+
+        async def join_room(
+            command: commands.JoinRoom, uow: unit_of_work.AbstractUnitOfWork
+        ) -> None:
+            with uow:
+                uow.players.add(players.Player(command.player_id, command.player_id))
+                if command.player_id == "failing":
+                    first_entered.set()
+                    await asyncio.wait_for(second_committed.wait(), 5)
+                    raise ValueError("failing")
+                await asyncio.wait_for(first_entered.wait(), 5)
+                uow.commit()
+            second_committed.set()
+
+        message_bus = bootstrap_test_async_message_bus(
+            command_handlers={commands.JoinRoom: join_room}, background_threads=2
+        )
+        lanes = {}
+        for i in range(100):
+            lanes.setdefault(message_bus._lane(commands.JoinRoom(str(i), "")), str(i))
+
+        async def scenario():
+            return await asyncio.gather(
+                message_bus.handle_async(commands.JoinRoom(lanes[0], "failing")),
+                message_bus.handle_async(commands.JoinRoom(lanes[1], "committed")),
+                return_exceptions=True,
+            )
+
+        error, _ = asyncio.run(scenario())
+
+        assert isinstance(error, ValueError)
+        # Not nested in the transaction of the other lane, which rolled back
+        assert message_bus.uow.players.get(id="committed") is not None
+        assert message_bus.uow.players.get(id="failing") is None
+
+    def test_coroutine_handlers_keep_order_of_lane(self):
+        handled = []
+
+        async def join_room(command: commands.JoinRoom) -> None:
+            await asyncio.sleep(0.01)
+            handled.append("join")
+
+        def leave_room(command: commands.LeaveRoom) -> None:
+            handled.append("leave")
+
+        message_bus = bootstrap_test_async_message_bus(
+            command_handlers={
+                commands.JoinRoom: join_room,
+                commands.LeaveRoom: leave_room,
+            }
+        )
+
+        async def scenario():
+            await asyncio.gather(
+                message_bus.handle_async(commands.JoinRoom("room", "player")),
+                message_bus.handle_async(commands.LeaveRoom("room", "player")),
+            )
+
+        asyncio.run(scenario())
+
+        assert handled == ["join", "leave"]
+
+
+class TestLanes:
+    def test_commands_with_same_key_keep_order(self):
+        handled = []
+
+        def join_room(command: commands.JoinRoom) -> None:
+            time.sleep(0.001)
+            handled.append(command.player_id)
+
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            command_handlers={commands.JoinRoom: join_room},
+            background_threads=4,
+        )
+
+        results = [
+            message_bus.handle(commands.JoinRoom(room_id="room", player_id=str(i)))
+            for i in range(20)
+        ]
+        for result in results:
+            result.get()
+
+        assert handled == [str(i) for i in range(20)]
+
+    def test_commands_with_different_keys_run_in_parallel(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def join_room(command: commands.JoinRoom) -> None:
+            barrier.wait()  # Breaks if the other command is not running
+
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            command_handlers={commands.JoinRoom: join_room},
+            background_threads=2,
+        )
+        lanes = {}
+        for i in range(100):
+            lanes.setdefault(message_bus._lane(commands.JoinRoom(str(i), "")), str(i))
+
+        results = [
+            message_bus.handle(commands.JoinRoom(room_id=lanes[0], player_id="1")),
+            message_bus.handle(commands.JoinRoom(room_id=lanes[1], player_id="2")),
+        ]
+
+        for result in results:
+            result.get(timeout=5)
+
+    def test_event_lanes_do_not_delay_commands(self):
+        release, handled = threading.Event(), []
+
+        def player_created(event: events.PlayerCreated) -> None:
+            release.wait(timeout=5)
+            handled.append(event.player.username)
+
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            event_handlers={events.PlayerCreated: [player_created]},
+            event_threads=1,
+        )
+
+        message_bus.handle(commands.CreatePlayer("first")).get(timeout=5)
+        # Would wait for the blocked event handler in the shared lane
+        message_bus.handle(commands.CreatePlayer("second")).get(timeout=1)
+        release.set()
+
+        for _ in range(100):  # Events are handled in background
+            if len(handled) == 2:
+                break
+            time.sleep(0.01)
+        assert handled == ["first", "second"]
+
+    def test_parallel_joins_are_consistent(self):
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"), background_threads=4
+        )
+
+        creators = [
+            message_bus.handle(commands.CreatePlayer(username=f"creator{i}")).get()
+            for i in range(8)
+        ]
+        room_ids = [
+            message_bus.handle(commands.CreateRoom(creator_id=creator.id, capacity=16))
+            .get()
+            .id
+            for creator in creators
+        ]
+        joiners = [
+            message_bus.handle(commands.CreatePlayer(username=f"player{i}")).get()
+            for i in range(80)
+        ]
+
+        results = [
+            message_bus.handle(
+                commands.JoinRoom(room_id=room_ids[i % 8], player_id=player.id)
+            )
+            for i, player in enumerate(joiners)
+        ]
+        for result in results:
+            result.get()
+
+        for i, room_id in enumerate(room_ids):
+            room = message_bus.uow.rooms.get(id=room_id)
+            assert [player.id for player in room.players] == [creators[i].id] + [
+                player.id for player in joiners[i::8]
+            ]
+
+
+class TestConflictRetries:
+    def test_retries_command_after_conflict(self):
+        attempts = []
+
+        def create_player(command: commands.CreatePlayer) -> str:
+            attempts.append(command.username)
+            if len(attempts) < 3:
+                raise exceptions.ConcurrencyConflict("conflict")
+            return command.username
+
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            command_handlers={commands.CreatePlayer: create_player},
+        )
+
+        assert message_bus.handle(commands.CreatePlayer("test")).get() == "test"
+        assert attempts == ["test"] * 3
+
+    def test_gives_up_after_too_many_conflicts(self):
+        def create_player(command: commands.CreatePlayer) -> None:
+            raise exceptions.ConcurrencyConflict("conflict")
+
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            command_handlers={commands.CreatePlayer: create_player},
+        )
+
+        with pytest.raises(exceptions.ConcurrencyConflict):
+            message_bus.handle(commands.CreatePlayer("test")).get()
+
+
+class TestBatch:
+    def test_commands_are_committed_together(self):
+        created = []
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            event_handlers={
+                **handlers.EVENT_HANDLERS,
+                events.PlayerCreated: [
+                    lambda event: created.append(event.player.username)
+                ],
+            },
+        )
+        creator = message_bus.handle(commands.CreatePlayer("creator")).get()
+
+        results = message_bus.handle_batch(
+            [
+                commands.CreatePlayer("first"),
+                commands.CreatePlayer("second"),
+                commands.CreateRoom(creator_id=creator.id),
+            ]
+        ).get()
+
+        assert [player.username for player in results[:2]] == ["first", "second"]
+        assert results[2].creator_id == creator.id
+        assert message_bus.uow.players.get(username="second") is not None
+
+        for _ in range(100):  # Events are handled in background
+            if len(created) == 3:
+                break
+            time.sleep(0.01)
+        assert created == ["creator", "first", "second"]
+
+    def test_nothing_is_committed_if_command_fails(self):
+        message_bus = factories.create_message_bus(uow=factories.create_uow("ram"))
+
+        with pytest.raises(exceptions.BatchCommandFailed) as error:
+            message_bus.handle_batch(
+                [
+                    commands.CreatePlayer("first"),
+                    commands.CreatePlayer("second"),
+                    commands.CreatePlayer("first"),
+                ]
+            ).get()
+
+        assert error.value.index == 2
+        assert isinstance(error.value.error, exceptions.PlayerAlreadyExists)
+        assert len(message_bus.uow.players) == 0
+
+    def test_async_batch(self):
+        message_bus = bootstrap_test_async_message_bus()
+
+        async def scenario():
+            return await message_bus.handle_batch_async([commands.CreatePlayer("test")])
+
+        assert [player.username for player in asyncio.run(scenario())] == ["test"]
+
+
+class TestGroupCommit:
+    def test_commands_share_one_commit(self):
+        uow = factories.create_uow("ram")
+        commits = []
+        commit = uow._commit
+        uow._commit = lambda: commits.append(commit())
+        message_bus = factories.create_message_bus(
+            uow=uow, group_commit=True, group_commit_window=5, group_commit_size=3
+        )
+
+        results = [
+            message_bus.handle(commands.CreatePlayer(username))
+            for username in ("first", "second", "third")
+        ]
+
+        assert [result.get(timeout=5).username for result in results] == [
+            "first",
+            "second",
+            "third",
+        ]
+        assert len(commits) == 1
+        assert len(uow.players) == 3
+
+    def test_failed_command_does_not_roll_back_others(self):
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            group_commit=True,
+            group_commit_window=5,
+            group_commit_size=3,
+        )
+
+        results = [
+            message_bus.handle(commands.CreatePlayer(username))
+            for username in ("first", "first", "second")
+        ]
+
+        assert results[0].get(timeout=5).username == "first"
+        with pytest.raises(exceptions.PlayerAlreadyExists):
+            results[1].get(timeout=5)
+        assert results[2].get(timeout=5).username == "second"
+        assert len(message_bus.uow.players) == 2
+
+    def test_failed_command_changes_are_rolled_back(self):
+        def create_player(
+            command: commands.CreatePlayer, uow: unit_of_work.AbstractUnitOfWork
+        ) -> players.Player:
+            player = handlers.create_player(command, uow)
+            if command.username == "broken":
+                raise ValueError("oops")
+            return player
+
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            command_handlers={commands.CreatePlayer: create_player},
+            group_commit=True,
+            group_commit_window=5,
+            group_commit_size=2,
+        )
+
+        results = [
+            message_bus.handle(commands.CreatePlayer(username))
+            for username in ("broken", "test")
+        ]
+
+        with pytest.raises(ValueError):
+            results[0].get(timeout=5)
+        assert results[1].get(timeout=5).username == "test"
+        assert message_bus.uow.players.get(username="broken") is None
+
+    def test_failed_commit_keeps_errors_of_failed_commands(self):
+        def commit():
+            raise RuntimeError("commit failed")
+
+        uow = factories.create_uow("ram")
+        uow._commit = commit
+        message_bus = factories.create_message_bus(
+            uow=uow, group_commit=True, group_commit_window=5, group_commit_size=2
+        )
+
+        results = [
+            message_bus.handle(commands.CreatePlayer(username))
+            for username in ("", "test")
+        ]
+
+        with pytest.raises(exceptions.InvalidPlayerUsername):
+            results[0].get(timeout=5)
+        with pytest.raises(RuntimeError):
+            results[1].get(timeout=5)
+
+    def test_retried_group_is_measured_once(self):
+        uow = factories.create_uow("ram")
+        attempts = []
+        commit = uow._commit
+
+        def conflicting_commit():
+            attempts.append(None)
+            if len(attempts) == 1:
+                raise exceptions.ConcurrencyConflict("conflict")
+            commit()
+
+        uow._commit = conflicting_commit
+        message_bus = factories.create_message_bus(
+            uow=uow, group_commit=True, group_commit_window=5, group_commit_size=2
+        )
+
+        results = [
+            message_bus.handle(commands.CreatePlayer(username))
+            for username in ("first", "second")
+        ]
+        for result in results:
+            result.get(timeout=5)
+
+        assert len(attempts) == 2
+        handler_seconds = message_bus.metrics.get("messagebus_handler_seconds")
+        assert handler_seconds.count("CreatePlayer") == 2
+
+    def test_async_group_commit(self):
+        message_bus = bootstrap_test_async_message_bus(group_commit=True)
+
+        async def scenario():
+            return await asyncio.gather(
+                message_bus.handle_async(commands.CreatePlayer("first")),
+                message_bus.handle_async(commands.CreatePlayer("")),
+                return_exceptions=True,
+            )
+
+        player, error = asyncio.run(scenario())
+
+        assert player.username == "first"
+        assert isinstance(error, exceptions.InvalidPlayerUsername)
+
+
+def bootstrap_blocked_message_bus(**kwargs):
+    """
+    Message bus which lane is busy handling a command until release is set
+    """
+    started, release, handled = threading.Event(), threading.Event(), []
+
+    def create_player(command: commands.CreatePlayer) -> str:
+        if command.username == "blocker":
+            started.set()
+            release.wait(timeout=5)
+        handled.append(command.username)
+        return command.username
+
+    message_bus = factories.create_message_bus(
+        uow=factories.create_uow("ram"),
+        command_handlers={commands.CreatePlayer: create_player},
+        **kwargs,
+    )
+    blocker = message_bus.handle(commands.CreatePlayer("blocker"))
+    started.wait(timeout=5)
+
+    return message_bus, blocker, release, handled
+
+
+class TestAdmissionControl:
+    def test_rejects_commands_over_queue_size(self):
+        message_bus, blocker, release, _ = bootstrap_blocked_message_bus(
+            max_queue_size=2
+        )
+
+        results = [
+            message_bus.handle(commands.CreatePlayer(username))
+            for username in ("first", "second")
+        ]
+        with pytest.raises(exceptions.QueueFull) as error:
+            message_bus.handle(commands.CreatePlayer("third"))
+        release.set()
+
+        assert error.value.retry_after == 1
+        assert [result.get(timeout=5) for result in [blocker, *results]] == [
+            "blocker",
+            "first",
+            "second",
+        ]
+        assert message_bus.queued == 0
+
+    def test_expired_commands_are_not_handled(self):
+        message_bus, blocker, release, handled = bootstrap_blocked_message_bus(
+            max_queue_wait=0.01
+        )
+
+        result = message_bus.handle(commands.CreatePlayer("late"))
+        time.sleep(0.05)
+        release.set()
+
+        assert blocker.get(timeout=5) == "blocker"
+        with pytest.raises(exceptions.QueueWaitExpired):
+            result.get(timeout=5)
+        assert handled == ["blocker"]
+
+    def test_expired_commands_are_not_handled_in_group(self):
+        message_bus, blocker, release, handled = bootstrap_blocked_message_bus(
+            max_queue_wait=0.01, group_commit=True
+        )
+
+        result = message_bus.handle(commands.CreatePlayer("late"))
+        time.sleep(0.05)
+        release.set()
+        fresh = message_bus.handle(commands.CreatePlayer("fresh"))
+
+        with pytest.raises(exceptions.QueueWaitExpired):
+            result.get(timeout=5)
+        assert fresh.get(timeout=5) == "fresh"
+        assert handled == ["blocker", "fresh"]
+
+    def test_coroutine_commands_are_queued(self):
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def create_player(command: commands.CreatePlayer) -> str:
+            started.set()
+            await release.wait()
+            return command.username
+
+        message_bus = bootstrap_test_async_message_bus(
+            command_handlers={commands.CreatePlayer: create_player},
+            max_queue_size=1,
+        )
+
+        async def scenario():
+            first = asyncio.ensure_future(
+                message_bus.handle_async(commands.CreatePlayer("first"))
+            )
+            await asyncio.wait_for(started.wait(), 5)
+            second = asyncio.ensure_future(
+                message_bus.handle_async(commands.CreatePlayer("second"))
+            )
+            await asyncio.sleep(0)  # Second is queued behind the first
+            with pytest.raises(exceptions.QueueFull):
+                await message_bus.handle_async(commands.CreatePlayer("third"))
+            release.set()
+            return await asyncio.gather(first, second)
+
+        assert asyncio.run(scenario()) == ["first", "second"]
+        assert message_bus.queued == 0
+        assert message_bus.rejected == 1
+
+
+class TestDeadlines:
+    def test_expired_commands_are_skipped(self):
+        message_bus, blocker, release, handled = bootstrap_blocked_message_bus()
+
+        command = commands.CreatePlayer("late")
+        command.deadline = time.monotonic() + 0.01
+        result = message_bus.handle(command)
+        time.sleep(0.05)
+        release.set()
+
+        with pytest.raises(exceptions.DeadlineExceeded):
+            result.get(timeout=5)
+        assert handled == ["blocker"]
+        assert message_bus.skipped == 1
+
+    def test_command_timeout_sets_deadline(self):
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"), command_timeout=5
+        )
+
+        command = commands.CreatePlayer("test")
+        message_bus.handle(command).get(timeout=5)
+
+        assert 0 < command.deadline - time.monotonic() <= 5
+        assert not command.expired
+
+    def test_async_wait_stops_at_deadline(self):
+        release = threading.Event()
+
+        def create_player(command: commands.CreatePlayer) -> None:
+            release.wait(timeout=5)
+
+        message_bus = bootstrap_test_async_message_bus(
+            command_handlers={commands.CreatePlayer: create_player},
+            command_timeout=0.01,
+        )
+
+        async def scenario():
+            return await message_bus.handle_async(commands.CreatePlayer("test"))
+
+        with pytest.raises(exceptions.DeadlineExceeded):
+            asyncio.run(scenario())
+        release.set()
+
+        assert message_bus.expired == 1
+
+
+class TestMetrics:
+    def test_commands_are_measured(self):
+        message_bus = factories.create_message_bus(uow=factories.create_uow("ram"))
+
+        message_bus.handle(commands.CreatePlayer("test")).get(timeout=5)
+        with pytest.raises(exceptions.PlayerAlreadyExists):
+            message_bus.handle(commands.CreatePlayer("test")).get(timeout=5)
+
+        registry = message_bus.metrics
+        for name in ("queue_wait", "handler", "commit"):
+            histogram = registry.get(f"messagebus_{name}_seconds")
+            assert histogram.count("CreatePlayer") == 2
+        total = registry.get("messagebus_commands_total")
+        assert total.value("CreatePlayer", "success") == 1
+        assert total.value("CreatePlayer", "error") == 1
+        assert registry.get("unit_of_work_commits_total").value() == 1
+        assert registry.get("unit_of_work_rollbacks_total").value() == 1
+        assert registry.get("repository_size").value("players") == 1
+        assert 'messagebus_events_total{event="PlayerCreated"} 1' in registry.render()
+
+    def test_coroutine_commands_are_measured(self):
+        async def create_player(command: commands.CreatePlayer) -> str:
+            await asyncio.sleep(0)
+            return command.username
+
+        message_bus = bootstrap_test_async_message_bus(
+            command_handlers={commands.CreatePlayer: create_player}
+        )
+
+        asyncio.run(message_bus.handle_async(commands.CreatePlayer("test")))
+
+        registry = message_bus.metrics
+        for name in ("queue_wait", "handler", "commit"):
+            histogram = registry.get(f"messagebus_{name}_seconds")
+            assert histogram.count("CreatePlayer") == 1
+        total = registry.get("messagebus_commands_total")
+        assert total.value("CreatePlayer", "success") == 1
+
+
+class TestTracing:
+    def test_command_and_its_events_share_trace(self, traced):
+        handled = threading.Event()
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            event_handlers={events.PlayerCreated: [lambda event: handled.set()]},
+            event_threads=1,
+        )
+
+        with tracing.span("request", root=True) as request:
+            message_bus.handle(commands.CreatePlayer("test")).get(timeout=5)
+        assert handled.wait(timeout=5)
+        for _ in range(100):  # Event span ends after its handler
+            if len(traced.spans) == 5:
+                break
+            time.sleep(0.01)
+
+        spans = {span.name: span for span in traced.spans}
+        assert set(spans) == {
+            "request",
+            "queue CreatePlayer",
+            "handle CreatePlayer",
+            "commit",
+            "handle PlayerCreated",
+        }
+        assert {span.context.trace_id for span in traced.spans} == {
+            request.context.trace_id
+        }
+        handle = spans["handle CreatePlayer"]
+        assert handle.parent_id == request.context.span_id
+        assert spans["queue CreatePlayer"].parent_id == request.context.span_id
+        assert spans["commit"].parent_id == handle.context.span_id
+        assert spans["handle PlayerCreated"].parent_id == handle.context.span_id
+
+    def test_command_sent_outside_of_trace_starts_one(self, traced):
+        message_bus = factories.create_message_bus(uow=factories.create_uow("ram"))
+
+        message_bus.handle(commands.CreatePlayer("test")).get(timeout=5)
+
+        spans = {span.name: span for span in traced.spans}
+        handle = spans["handle CreatePlayer"]
+        assert handle.parent_id is None
+        assert spans["commit"].parent_id == handle.context.span_id
+
+    def test_group_commit_is_recorded_in_trace_of_every_command(self, traced):
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"), group_commit=True
+        )
+
+        with tracing.span("request", root=True) as request:
+            message_bus.handle(commands.CreatePlayer("test")).get(timeout=5)
+
+        spans = {span.name: span for span in traced.spans}
+        assert spans["group commit"].parent_id == request.context.span_id
+        assert spans["group commit"].attributes == {"size": 1}
+        assert spans["handle CreatePlayer"].parent_id == request.context.span_id
+
+    def test_events_of_group_join_trace_of_their_command(self, traced):
+        handled = threading.Event()
+        message_bus = factories.create_message_bus(
+            uow=factories.create_uow("ram"),
+            event_handlers={events.PlayerCreated: [lambda event: handled.set()]},
+            group_commit=True,
+        )
+
+        with tracing.span("request", root=True):
+            message_bus.handle(commands.CreatePlayer("test")).get(timeout=5)
+        assert handled.wait(timeout=5)
+        for _ in range(100):  # Event span ends after its handler
+            if any(span.name == "handle PlayerCreated" for span in traced.spans):
+                break
+            time.sleep(0.01)
+
+        spans = {span.name: span for span in traced.spans}
+        handle = spans["handle CreatePlayer"]
+        assert spans["handle PlayerCreated"].parent_id == handle.context.span_id
+
+    def test_commands_of_unsampled_trace_are_not_sampled_again(self):
+        exporter = tracing.MemoryExporter()
+        message_bus = factories.create_message_bus(uow=factories.create_uow("ram"))
+
+        tracing.set_tracer(tracing.Tracer(exporter, sample_rate=0.0))
+        try:
+            with tracing.span("request", root=True) as request:
+                # Any new trace would be sampled now
+                tracing.set_tracer(tracing.Tracer(exporter, sample_rate=1.0))
+                message_bus.handle(commands.CreatePlayer("test")).get(timeout=5)
+        finally:
+            tracing.set_tracer(tracing.Tracer(tracing.NullExporter(), sample_rate=0.0))
+
+        assert request is None
+        assert exporter.spans == []
+
+
+def idempotent(command: commands.Command, key: str) -> commands.Command:
+    command.idempotency_key = key
+    return command
+
+
+class TestIdempotency:
+    def test_retried_command_gets_first_result(self):
+        message_bus = factories.create_message_bus(uow=factories.create_uow("ram"))
+
+        first = message_bus.handle(
+            idempotent(commands.CreatePlayer("test"), "key")
+        ).get(timeout=5)
+        retried = message_bus.handle(
+            idempotent(commands.CreatePlayer("test"), "key")
+        ).get(timeout=5)
+
+        assert retried is first
+        assert message_bus.uow.commits == 1
+        assert message_bus.deduplicated == 1
+        with pytest.raises(exceptions.PlayerAlreadyExists):  # Other key
+            message_bus.handle(
+                idempotent(commands.CreatePlayer("test"), "other")
+            ).get(timeout=5)
+
+    def test_key_reused_for_other_command_is_rejected(self):
+        message_bus = factories.create_message_bus(uow=factories.create_uow("ram"))
+        message_bus.handle(idempotent(commands.CreatePlayer("test"), "key")).get(
+            timeout=5
+        )
+
+        with pytest.raises(exceptions.IdempotencyKeyReused):
+            message_bus.handle(idempotent(commands.CreatePlayer("other"), "key"))
+        assert message_bus.uow.commits == 1
+
+    def test_duplicates_in_flight_share_one_execution(self):
+        message_bus, blocker, release, handled = bootstrap_blocked_message_bus(
+            group_commit=True
+        )
+
+        results = [
+            message_bus.handle(idempotent(commands.CreatePlayer("test"), "key"))
+            for _ in range(3)
+        ]
+        release.set()
+
+        assert [result.get(timeout=5) for result in results] == ["test"] * 3
+        assert handled == ["blocker", "test"]
+
+    def test_failed_command_is_handled_again(self):
+        message_bus, blocker, release, handled = bootstrap_blocked_message_bus(
+            max_queue_wait=0.01
+        )
+
+        expired = message_bus.handle(idempotent(commands.CreatePlayer("test"), "key"))
+        time.sleep(0.05)
+        release.set()
+        with pytest.raises(exceptions.QueueWaitExpired):
+            expired.get(timeout=5)
+        retried = message_bus.handle(idempotent(commands.CreatePlayer("test"), "key"))
+
+        assert retried.get(timeout=5) == "test"
+        assert handled == ["blocker", "test"]
+
+    def test_async_retried_command_gets_first_result(self):
+        message_bus = bootstrap_test_async_message_bus()
+
+        async def scenario():
+            return [
+                await message_bus.handle_async(
+                    idempotent(commands.CreatePlayer("test"), "key")
+                )
+                for _ in range(2)
+            ]
+
+        first, retried = asyncio.run(scenario())
+
+        assert retried is first
+        assert message_bus.uow.commits == 1
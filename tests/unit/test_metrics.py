@@ -0,0 +1,51 @@
+from service_player import metrics
+
+
+class TestMetrics:
+    def test_counter(self):
+        counter = metrics.Counter("requests_total", "Requests", ["path"])
+        counter.inc("/")
+        counter.inc("/", amount=2)
+        counter.inc('/"quoted"')
+
+        assert counter.value("/") == 3
+        assert list(counter.render()) == [
+            "# HELP requests_total Requests",
+            "# TYPE requests_total counter",
+            'requests_total{path="/"} 3',
+            'requests_total{path="/\\"quoted\\""} 1',
+        ]
+
+    def test_function_gauge(self):
+        depth = [5]
+        gauge = metrics.Gauge("depth", "Depth", function=lambda: {(): depth[0]})
+        depth[0] = 7
+
+        assert list(gauge.render())[-1] == "depth 7"
+
+    def test_histogram(self):
+        histogram = metrics.Histogram("latency", "Latency", buckets=[0.1, 1])
+        for value in (0.05, 0.1, 0.5, 2):
+            histogram.observe(value)
+
+        assert histogram.count() == 4
+        assert list(histogram.render())[2:] == [
+            'latency_bucket{le="0.1"} 2',
+            'latency_bucket{le="1"} 3',
+            'latency_bucket{le="+Inf"} 4',
+            "latency_sum 2.65",
+            "latency_count 4",
+        ]
+
+    def test_registry_renders_all_metrics(self):
+        registry = metrics.Registry()
+        registry.register(metrics.Counter("first", "First")).inc()
+        registry.register(metrics.Counter("second", "Second"))
+
+        assert registry.render() == (
+            "# HELP first First\n"
+            "# TYPE first counter\n"
+            "first 1\n"
+            "# HELP second Second\n"
+            "# TYPE second counter\n"
+        )
@@ -58,3 +58,21 @@ class TestPlayerCreation:
 
         with pytest.raises(exceptions.InvalidPlayerUsername):
             async_result.get()  # Wait for result
+
+
+class TestPlayerModel:
+    def test_player_has_no_instance_dict(self):
+        player = players.Player(id="1", username="test")
+
+        assert not hasattr(player, "__dict__")
+        with pytest.raises(AttributeError):
+            player.nickname = "test"
+
+    def test_events_are_created_on_demand(self):
+        player = players.Player(id="1", username="test")
+
+        assert not player.has_events
+        player.events.append(object())
+        assert player.has_events
+        player.events.popleft()
+        assert not player.has_events
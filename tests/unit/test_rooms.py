@@ -128,6 +128,79 @@ class TestRoomCreation:
         with pytest.raises(exceptions.PlayerAlreadyInRoom):
             async_result.get()
 
+    def test_player_cannot_join_second_room(self):
+        messagebus = bootstrap_test_message_bus()
+
+        player: players.Player = messagebus.handle(
+            commands.CreatePlayer(username="test")
+        ).get()
+        another_player: players.Player = messagebus.handle(
+            commands.CreatePlayer(username="test2")
+        ).get()
+        room: rooms.Room = messagebus.handle(
+            commands.CreateRoom(creator_id=player.id)
+        ).get()
+        another_room: rooms.Room = messagebus.handle(
+            commands.CreateRoom(creator_id=another_player.id)
+        ).get()
+
+        async_result: multiprocessing.pool.ApplyResult = messagebus.handle(
+            commands.JoinRoom(player_id=player.id, room_id=another_room.id)
+        )
+        with pytest.raises(exceptions.PlayerAlreadyInRoom):
+            async_result.get()
+
+        messagebus.handle(
+            commands.LeaveRoom(player_id=player.id, room_id=room.id)
+        ).get()
+        messagebus.handle(
+            commands.JoinRoom(player_id=player.id, room_id=another_room.id)
+        ).get()
+
+        assert messagebus.uow.rooms.find("player_id", player.id)[0].id == (
+            another_room.id
+        )
+
+    def test_cannot_join_full_room(self):
+        messagebus = bootstrap_test_message_bus()
+
+        player: players.Player = messagebus.handle(
+            commands.CreatePlayer(username="test")
+        ).get()
+        another_player: players.Player = messagebus.handle(
+            commands.CreatePlayer(username="test2")
+        ).get()
+        room: rooms.Room = messagebus.handle(
+            commands.CreateRoom(creator_id=player.id, capacity=1)
+        ).get()
+
+        async_result: multiprocessing.pool.ApplyResult = messagebus.handle(
+            commands.JoinRoom(player_id=another_player.id, room_id=room.id)
+        )
+        with pytest.raises(exceptions.RoomIsFull):
+            async_result.get()
+
+        async_result = messagebus.handle(
+            commands.CreateRoom(creator_id=another_player.id, capacity=0)
+        )
+        with pytest.raises(exceptions.InvalidRoomCapacity):
+            async_result.get()
+
+    def test_room_without_capacity_has_no_limit(self):
+        messagebus = bootstrap_test_message_bus()
+        creator = messagebus.handle(commands.CreatePlayer(username="creator")).get()
+        room = messagebus.handle(commands.CreateRoom(creator_id=creator.id)).get()
+
+        for i in range(20):
+            player = messagebus.handle(commands.CreatePlayer(username=f"p{i}")).get()
+            messagebus.handle(
+                commands.JoinRoom(player_id=player.id, room_id=room.id)
+            ).get()
+
+        room = messagebus.uow.rooms.get(id=room.id)
+        assert room.capacity is None
+        assert room.players_count == 21
+
     def test_join_room_with_same_player(self):
         messagebus = bootstrap_test_message_bus()
 
@@ -306,3 +379,98 @@ class TestRoomCreation:
         assert isinstance(room, rooms.Room)
         assert len(room.players) == 0
         assert room.players == []
+
+
+class TestRoomMembership:
+    def test_players_are_kept_in_join_order(self):
+        creator = players.Player(id="1", username="creator")
+        first = players.Player(id="2", username="first")
+        second = players.Player(id="3", username="second")
+        room = rooms.Room(id="10", creator=creator)
+
+        room.join(second)
+        room.join(first)
+        room.leave(creator)
+
+        assert room.players == [second, first]
+        assert room.players_count == 2
+        assert room.has_player(first)
+        assert not room.has_player(creator)
+
+    def test_membership_is_checked_by_player_id(self):
+        creator = players.Player(id="1", username="creator")
+        room = rooms.Room(id="10", creator=creator)
+
+        assert room.has_player(players.Player(id="1", username="creator"))
+
+        room.leave(players.Player(id="1", username="creator"))
+
+        assert room.players == []
+
+
+class TestQuickJoin:
+    def test_joins_fullest_room_which_is_not_full(self):
+        messagebus = bootstrap_test_message_bus()
+        creators = [
+            messagebus.handle(commands.CreatePlayer(username=f"creator{i}")).get()
+            for i in range(3)
+        ]
+        # One free slot in full, two in fullest, three in emptiest
+        full, fullest, emptiest = [
+            messagebus.handle(
+                commands.CreateRoom(creator_id=creator.id, capacity=capacity)
+            ).get()
+            for creator, capacity in zip(creators, [1, 3, 4])
+        ]
+        player: players.Player = messagebus.handle(
+            commands.CreatePlayer(username="test")
+        ).get()
+
+        room: rooms.Room = messagebus.handle(
+            commands.QuickJoin(player_id=player.id)
+        ).get()
+
+        assert room.id == fullest.id
+        assert room.has_player(player)
+
+    def test_creates_room_if_all_are_full(self):
+        messagebus = bootstrap_test_message_bus()
+        player: players.Player = messagebus.handle(
+            commands.CreatePlayer(username="test")
+        ).get()
+
+        room: rooms.Room = messagebus.handle(
+            commands.QuickJoin(player_id=player.id, capacity=2)
+        ).get()
+
+        assert room.creator_id == player.id
+        assert room.capacity == 2
+
+    def test_missing_player_cannot_quick_join(self):
+        messagebus = bootstrap_test_message_bus()
+
+        async_result: multiprocessing.pool.ApplyResult = messagebus.handle(
+            commands.QuickJoin(player_id="invalid")
+        )
+        with pytest.raises(exceptions.PlayerDoesNotExist):
+            async_result.get()
+
+    def test_concurrent_quick_joins_do_not_overfill_rooms(self):
+        messagebus = factories.create_message_bus(
+            uow=factories.create_uow("ram"), background_threads=4
+        )
+        joiners = [
+            messagebus.handle(commands.CreatePlayer(username=f"player{i}")).get()
+            for i in range(50)
+        ]
+
+        results = [
+            messagebus.handle(commands.QuickJoin(player_id=player.id, capacity=4))
+            for player in joiners
+        ]
+        joined = [result.get() for result in results]
+
+        rooms_by_id = {room.id: messagebus.uow.rooms.get(id=room.id) for room in joined}
+        assert len(rooms_by_id) == 13
+        assert sum(room.players_count for room in rooms_by_id.values()) == 50
+        assert all(room.players_count <= 4 for room in rooms_by_id.values())
@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+from domain import events, players, rooms
+from service_player import subscriptions
+
+
+def joined(room: rooms.Room, username: str) -> events.PlayerJoinedRoom:
+    player = players.Player(id=username, username=username)
+    return events.PlayerJoinedRoom(room=room, player=player)
+
+
+def create_room(room_id: str = "room") -> rooms.Room:
+    creator = players.Player(id=f"{room_id}-creator", username=f"{room_id}-creator")
+    return rooms.Room(id=room_id, creator=creator, capacity=2)
+
+
+async def drain(subscription: subscriptions.Subscription):
+    subscription.close()
+    received = []
+    while (published := await subscription.get()) is not None:
+        sequence, _, message = published
+        received.append((sequence, json.loads(message)["player_id"]))
+    return received
+
+
+class TestRoomSubscriptions:
+    def test_subscribers_get_numbered_events_of_their_room(self):
+        room, other = create_room(), create_room("other")
+        hub = subscriptions.RoomSubscriptions()
+
+        async def scenario():
+            hub.publish(joined(room, "before"))  # No subscribers, not numbered
+            first = hub.subscribe(room.id)
+            hub.publish(joined(room, "first"))
+            second = hub.subscribe(room.id)
+            hub.publish(joined(other, "other"))
+            hub.publish(joined(room, "second"))
+            await asyncio.sleep(0)
+            return [
+                (subscription.sequence, await drain(subscription))
+                for subscription in (first, second)
+            ]
+
+        assert asyncio.run(scenario()) == [
+            (0, [(1, "first"), (2, "second")]),
+            (1, [(2, "second")]),
+        ]
+
+    def test_event_is_encoded_once(self):
+        room = create_room()
+        encoded = []
+
+        def encode(sequence: int, event: events.Event) -> str:
+            encoded.append(sequence)
+            return subscriptions.encode_event(sequence, event)
+
+        hub = subscriptions.RoomSubscriptions(encode=encode)
+
+        async def scenario():
+            subscribed = [hub.subscribe(room.id) for _ in range(100)]
+            hub.publish(joined(room, "player"))
+            await asyncio.sleep(0)
+            return [(await subscription.get())[2] for subscription in subscribed]
+
+        messages = asyncio.run(scenario())
+
+        assert encoded == [1]
+        assert all(message is messages[0] for message in messages)
+
+    def test_slow_subscriber_is_dropped(self):
+        room = create_room()
+        hub = subscriptions.RoomSubscriptions(max_size=2)
+
+        async def scenario():
+            subscription = hub.subscribe(room.id)
+            for username in ("first", "second", "third"):
+                hub.publish(joined(room, username))
+            await asyncio.sleep(0)
+            return subscription, await subscription.get()
+
+        subscription, published = asyncio.run(scenario())
+
+        assert published is None
+        assert subscription.overflowed
+
+    def test_slow_subscriber_gets_latest_event_when_coalesced(self):
+        room = create_room()
+        hub = subscriptions.RoomSubscriptions(max_size=2, coalesce=True)
+
+        async def scenario():
+            subscription = hub.subscribe(room.id)
+            for username in ("first", "second", "third", "fourth"):
+                hub.publish(joined(room, username))
+            await asyncio.sleep(0)
+            return subscription, await drain(subscription)
+
+        subscription, received = asyncio.run(scenario())
+
+        assert received == [(3, "third"), (4, "fourth")]
+        assert subscription.skipped == 2
+        assert not subscription.overflowed
+
+    def test_unsubscribe(self):
+        room = create_room()
+        hub = subscriptions.RoomSubscriptions()
+
+        async def scenario():
+            subscription = hub.subscribe(room.id)
+            assert len(hub) == 1
+            hub.unsubscribe(subscription)
+
+        asyncio.run(scenario())
+
+        assert len(hub) == 0
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+from service_player import tracing
+
+
+class TestTracing:
+    def test_spans_nest(self, traced):
+        with tracing.span("request", root=True) as request:
+            with tracing.span("handle", lane=0) as handle:
+                assert tracing.current() is handle.context
+            tracing.record("queue", request.context, 0.5)
+        assert tracing.current() is None
+
+        handle_span, queue_span, request_span = traced.spans
+        assert request_span.parent_id is None
+        assert handle_span.parent_id == request_span.context.span_id
+        assert handle_span.attributes == {"lane": 0}
+        assert queue_span.parent_id == request_span.context.span_id
+        assert queue_span.duration == 0.5
+        assert {s.context.trace_id for s in traced.spans} == {
+            request_span.context.trace_id
+        }
+
+    def test_spans_outside_of_trace_are_not_recorded(self, traced):
+        with tracing.span("handle") as span:
+            assert span is None
+        tracing.record("queue", None, 0.5)
+
+        assert traced.spans == []
+
+    def test_sampling(self, traced):
+        tracing.set_tracer(tracing.Tracer(traced, sample_rate=0.0))
+
+        with tracing.span("request", root=True) as span:
+            assert span is None
+            with tracing.span("handle"):
+                pass
+
+        assert traced.spans == []
+
+    def test_errors_are_recorded(self, traced):
+        with pytest.raises(ValueError):
+            with tracing.span("request", root=True):
+                raise ValueError("oops")
+
+        assert traced.spans[0].attributes == {"error": "ValueError"}
+
+    def test_json_file_exporter(self, tmp_path):
+        path = tmp_path / "spans.jsonl"
+        exporter = tracing.JsonFileExporter(str(path))
+        tracing.set_tracer(tracing.Tracer(exporter))
+        try:
+            with tracing.span("request", root=True, path="/v1/players"):
+                with tracing.span("handle"):
+                    pass
+        finally:
+            tracing.set_tracer(tracing.Tracer(tracing.NullExporter(), 0.0))
+            exporter.close()
+
+        handle, request = [json.loads(line) for line in path.read_text().splitlines()]
+        assert request["name"] == "request"
+        assert request["attributes"] == {"path": "/v1/players"}
+        assert handle["parent_id"] == request["span_id"]
+        assert handle["trace_id"] == request["trace_id"]